@@ -0,0 +1,144 @@
+# benchmarks/bench_method_extraction.py
+"""
+Confronta l'estrazione del testo dei metodi a passaggio singolo
+(compute_declaration_spans) con la vecchia extract_method_text, che
+ridivideva il file in righe e contava le graffe carattere per carattere
+per ogni metodo.
+
+Uso:
+    python benchmarks/bench_method_extraction.py --methods 100 500 2000
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import time
+
+import javalang
+
+from src.java_parser import compute_declaration_spans
+
+
+def legacy_extract_method_text(java_code: str, method_node, class_name: str):
+    """Implementazione precedente, mantenuta qui solo come riferimento."""
+    lines = java_code.split("\n")
+
+    start_line = method_node.position.line - 1
+
+    brace_count = 0
+    end_line = start_line
+    found_opening_brace = False
+
+    for i in range(start_line, len(lines)):
+        line = lines[i]
+        for char in line:
+            if char == "{":
+                brace_count += 1
+                found_opening_brace = True
+            elif char == "}":
+                brace_count -= 1
+                if found_opening_brace and brace_count == 0:
+                    end_line = i
+                    break
+        if found_opening_brace and brace_count == 0:
+            break
+
+    method_lines = lines[start_line : end_line + 1]
+    return "\n".join(method_lines)
+
+
+# Un metodo generato è estratto per intero se termina con la "return" finale
+METHOD_END = 'return "";\n    }'
+
+
+def generate_class(num_methods: int) -> str:
+    """Genera una classe con graffe anche in stringhe, caratteri e commenti."""
+    methods = []
+    for i in range(num_methods):
+        methods.append(
+            f"""    @GetMapping("/items/{{id}}")
+    public String method{i}(@RequestParam(value = {{"a", "b"}}) String arg) {{
+        // una graffa nel commento: {{
+        String open = "{{{{";
+        char close = '}}';
+        /* blocco }} */
+        if (arg != null) {{
+            return open + close + helper{i}(arg);
+        }}
+        return "";
+    }}
+"""
+        )
+    return "package bench;\n\npublic class Generated {\n" + "\n".join(methods) + "}\n"
+
+
+def parse(java_code: str):
+    """Tokenizza e analizza una volta sola: il costo è comune a entrambe le versioni."""
+    tokens = list(javalang.tokenizer.tokenize(java_code))
+    return tokens, javalang.parser.Parser(tokens).parse()
+
+
+def methods_of(tree):
+    return [
+        (class_decl, method)
+        for _, class_decl in tree.filter(javalang.tree.ClassDeclaration)
+        for method in class_decl.methods
+    ]
+
+
+def run_legacy(java_code: str, tokens, tree):
+    return [
+        legacy_extract_method_text(java_code, method, class_decl.name)
+        for class_decl, method in methods_of(tree)
+    ]
+
+
+def run_single_pass(java_code: str, tokens, tree):
+    methods = [method for _, method in methods_of(tree)]
+    spans = compute_declaration_spans(java_code, tokens, methods)
+    texts = []
+    for method in methods:
+        start, end = spans[(method.position.line, method.position.column)]
+        texts.append(java_code[start:end])
+    return texts
+
+
+def best_of(func, args, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--methods", type=int, nargs="+", default=[100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'metodi':>8} {'parsing (s)':>12} {'vecchia (s)':>12} {'nuova (s)':>10} "
+        f"{'speedup':>8} {'corretti':>10}"
+    )
+    for n in args.methods:
+        code = generate_class(n)
+        parse_time, (tokens, tree) = best_of(parse, (code,), 1)
+        legacy_time, legacy_texts = best_of(
+            run_legacy, (code, tokens, tree), args.repeat
+        )
+        new_time, new_texts = best_of(run_single_pass, (code, tokens, tree), args.repeat)
+
+        correct = sum(1 for t in new_texts if t.rstrip().endswith(METHOD_END))
+        legacy_correct = sum(1 for t in legacy_texts if t.rstrip().endswith(METHOD_END))
+        print(
+            f"{n:>8} {parse_time:>12.3f} {legacy_time:>12.4f} {new_time:>10.4f} "
+            f"{legacy_time / new_time:>7.1f}x {correct:>5}/{legacy_correct:<5}"
+        )
+    print("(tempi di sola estrazione; corretti: metodi interi con la nuova/vecchia)")
@@ -0,0 +1,132 @@
+# benchmarks/bench_prompt_prefix.py
+"""
+Misura il prefill del prompt della RAG con e senza la KV cache del prefisso
+statico (PROMPT_PREFIX_CACHE_ENABLED) su CPU.
+
+Per ogni domanda sintetica confronta:
+- prefill a freddo: contesto azzerato, il modello valuta tutto il prompt;
+- prefill con prefisso: stato del prefisso ripristinato, il modello valuta
+  solo contesto e domanda.
+Riporta anche il costo della valutazione del prefisso all'avvio contro il
+caricamento dello stato salvato su disco (PROMPT_PREFIX_CACHE_PERSIST).
+
+Il tempo misurato è quello di create_completion con max_tokens=1, cioè
+prefill più un solo token generato.
+
+Uso:
+    python benchmarks/bench_prompt_prefix.py --questions 5 --context-tokens 1500
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+from llama_cpp import Llama
+
+from config import LLM_MODEL_PATH, LLM_N_CTX
+from src.prompt_cache import PromptPrefixCache
+from src.rag_pipeline import RAG_PROMPT_PREFIX, RAG_PROMPT_SUFFIX
+
+_METHOD = """public ResponseEntity<OrderDto> updateOrder{i}(@PathVariable Long id, @Valid @RequestBody OrderDto dto) {{
+    Order order = orderRepository.findById(id).orElseThrow(() -> new OrderNotFoundException(id));
+    order.setStatus(dto.getStatus());
+    return ResponseEntity.ok(orderMapper.toDto(orderRepository.save(order)));
+}}
+"""
+
+
+def make_context(llama, target_tokens: int, seed: int) -> str:
+    """Metodi Java sintetici fino a circa `target_tokens` token."""
+    parts, i = [], seed * 1000
+    while len(llama.tokenize("\n".join(parts).encode("utf-8"), add_bos=False)) < target_tokens:
+        parts.append(_METHOD.format(i=i))
+        i += 1
+    return "\n".join(parts)
+
+
+def timed_completion(llama, prompt: str) -> float:
+    started = time.perf_counter()
+    llama.create_completion(prompt, max_tokens=1, temperature=0.0)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=LLM_MODEL_PATH)
+    parser.add_argument("--n-ctx", type=int, default=LLM_N_CTX)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--context-tokens", type=int, default=1500)
+    args = parser.parse_args()
+
+    llama = Llama(
+        model_path=args.model,
+        n_ctx=args.n_ctx,
+        n_gpu_layers=0,
+        n_threads=args.threads,
+        verbose=False,
+    )
+    prompts = [
+        RAG_PROMPT_PREFIX
+        + RAG_PROMPT_SUFFIX.format(
+            context=make_context(llama, args.context_tokens, q),
+            question=f"Cosa fa il metodo updateOrder{q * 1000}?",
+        )
+        for q in range(args.questions)
+    ]
+    cache = PromptPrefixCache(llama, RAG_PROMPT_PREFIX, persist=False)
+    n_prefix = len(cache.tokens)
+    n_prompt = statistics.mean(len(llama.tokenize(p.encode("utf-8"), special=True)) for p in prompts)
+    print(f"Modello: {os.path.basename(args.model)} (n_ctx={args.n_ctx}, CPU)")
+    print(f"Prefisso: {n_prefix} token su {n_prompt:.0f} token medi di prompt ({n_prefix / n_prompt:.0%})")
+
+    cold = []
+    for prompt in prompts:
+        llama.reset()
+        cold.append(timed_completion(llama, prompt))
+
+    cache.warm()
+    warm = []
+    for prompt in prompts:
+        # Come dopo un prompt estraneo: il contesto non inizia con il prefisso
+        llama.reset()
+        cache.restore()
+        warm.append(timed_completion(llama, prompt))
+
+    cold_ms, warm_ms = statistics.median(cold) * 1000, statistics.median(warm) * 1000
+    print(f"{'':<22}{'p50 prefill':>14}")
+    print(f"{'a freddo':<22}{cold_ms:>11.0f} ms")
+    print(f"{'con prefisso':<22}{warm_ms:>11.0f} ms   (-{1 - warm_ms / cold_ms:.0%})")
+
+    # Avvio: valutazione del prefisso contro stato letto dal disco
+    cache_dir = tempfile.mkdtemp(prefix="bench_prompt_prefix_")
+    try:
+        started = time.perf_counter()
+        PromptPrefixCache(llama, RAG_PROMPT_PREFIX, persist=True, cache_dir=cache_dir).warm()
+        evaluated = time.perf_counter() - started
+        started = time.perf_counter()
+        PromptPrefixCache(llama, RAG_PROMPT_PREFIX, persist=True, cache_dir=cache_dir).warm()
+        loaded = time.perf_counter() - started
+        size = sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, files in os.walk(cache_dir)
+            for f in files
+        )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    print(
+        f"Avvio: prefisso valutato in {evaluated:.2f}s, letto dal disco in {loaded:.2f}s "
+        f"({size / 1024**2:.1f} MB di stato)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/bench_quantization.py
+"""
+Misura l'effetto di VECTOR_QUANTIZATION sul backend mmap: memoria della prima
+fase della ricerca (codici int8/binari contro la matrice float16 e contro i
+float32 originali), recall@k rispetto all'indice non quantizzato e alla
+ricerca esatta, latenza p50/p95 al variare di VECTOR_RESCORE_FACTOR.
+
+Usa la stessa collezione sintetica di bench_vector_backends.py.
+
+Uso:
+    python benchmarks/bench_quantization.py --size 100000 --rescore-factors 4 8 16
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from src.mmap_vector_store import MmapVectorStore
+from src.quantization import CODE_FILES, SCALE_FILE
+from bench_vector_backends import (
+    _BLOCK,
+    _centers,
+    generate_block,
+    make_chunks,
+    make_queries,
+    exact_neighbors,
+)
+
+
+def build(db_path: str, size: int, dim: int):
+    store = MmapVectorStore("bench", persist_directory=db_path, quantization="none")
+    centers = _centers(dim)
+    for start in range(0, size, _BLOCK):
+        stop = min(start + _BLOCK, size)
+        ids, texts, metadatas = make_chunks(start, stop)
+        store.upsert(ids, generate_block(start, stop, dim, centers), texts, metadatas)
+    store.persist()
+
+
+def first_pass_bytes(store: MmapVectorStore) -> int:
+    if store.quantization == "none":
+        return os.path.getsize(store._file("vectors.f16"))
+    size = os.path.getsize(store._file(CODE_FILES[store.quantization]))
+    if store.quantization == "int8":
+        size += os.path.getsize(store._file(SCALE_FILE))
+    return size
+
+
+def run_queries(store, queries, k: int):
+    latencies, found = [], []
+    for q in queries:
+        started = time.perf_counter()
+        rows, _ = store._search_rows(q, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append({store._ids[row] for row in rows})
+    latencies.sort()
+    return found, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--keep", help="Cartella in cui conservare (e riusare) l'indice.")
+    args = parser.parse_args()
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="bench_quant_")
+    os.makedirs(work_dir, exist_ok=True)
+    db_path = os.path.join(work_dir, f"mmap_{args.size}")
+    try:
+        if not os.path.isdir(db_path):
+            print(f"Costruzione dell'indice con {args.size} vettori...")
+            build(db_path, args.size, args.dim)
+        queries = make_queries(args.size, args.queries, args.dim)
+        truth = [
+            {f"c{row}" for row in rows}
+            for rows in exact_neighbors(queries, args.size, args.dim, args.k)
+        ]
+        float32_mb = args.size * args.dim * 4 / 1024**2
+
+        baseline = None
+        print(
+            f"{'modo':>7} {'rescore':>7} {'1a fase MB':>10} {'vs f32':>7} "
+            f"{'recall/none':>11} {'recall/esatto':>13} {'p50 ms':>7} {'p95 ms':>7}"
+        )
+        for mode in ("none", "int8", "binary"):
+            # La prima apertura calcola i codici mancanti dalla matrice float16
+            started = time.perf_counter()
+            MmapVectorStore("bench", persist_directory=db_path, quantization=mode)
+            quantize_s = time.perf_counter() - started
+            for factor in [1] if mode == "none" else args.rescore_factors:
+                store = MmapVectorStore(
+                    "bench", persist_directory=db_path, quantization=mode, rescore_factor=factor
+                )
+                found, p50, p95 = run_queries(store, queries, args.k)
+                if baseline is None:
+                    baseline = found
+                recall_none = np.mean([len(f & b) / args.k for f, b in zip(found, baseline)])
+                recall_exact = np.mean([len(f & t) / args.k for f, t in zip(found, truth)])
+                size_mb = first_pass_bytes(store) / 1024**2
+                print(
+                    f"{mode:>7} {factor if mode != 'none' else '-':>7} {size_mb:>10.1f} "
+                    f"{1 - size_mb / float32_mb:>7.1%} {recall_none:>11.3f} "
+                    f"{recall_exact:>13.3f} {p50:>7.2f} {p95:>7.2f}"
+                )
+            if mode != "none":
+                print(f"        (codici {mode} calcolati in {quantize_s:.1f}s alla prima apertura)")
+        print(f"Vettori float32 originali: {float32_mb:.1f} MB")
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
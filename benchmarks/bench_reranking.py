@@ -0,0 +1,96 @@
+# benchmarks/bench_reranking.py
+"""
+Misura il guadagno di qualità e la latenza aggiunta dal reranking con
+cross-encoder rispetto al solo ordine della ricerca vettoriale, sulla stessa
+codebase sintetica di bench_hybrid_retrieval.py.
+
+Per ogni numero di candidati (--fetch-k) riporta recall@k e MRR con e senza
+reranking, la latenza p50/p95 del cross-encoder e quante domande avrebbero
+superato RERANK_TIMEOUT_MS (e quindi usato l'ordine vettoriale).
+
+Uso:
+    python benchmarks/bench_reranking.py --methods 2000 --queries 100 --fetch-k 20 50
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+sys.path.append(current_dir)
+
+import argparse
+import shutil
+import tempfile
+import time
+
+from langchain_community.vectorstores import Chroma
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from config import EMBEDDING_MODEL_NAME, RERANK_TIMEOUT_MS
+from src.reranker import Reranker
+from bench_hybrid_retrieval import generate_corpus, make_queries, percentile
+
+
+def evaluate(rankings, queries, k):
+    """recall@k e MRR@k delle classifiche rispetto al chunk atteso."""
+    recall, mrr = 0, 0.0
+    for ranked, (_, expected) in zip(rankings, queries):
+        top = ranked[:k]
+        if expected in top:
+            recall += 1
+            mrr += 1 / (top.index(expected) + 1)
+    return recall / len(queries), mrr / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--methods", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[20, 50])
+    args = parser.parse_args()
+
+    docs, targets = generate_corpus(args.methods)
+    queries = make_queries(targets, args.queries)
+    db_dir = tempfile.mkdtemp(prefix="bench_rerank_")
+    try:
+        store = Chroma.from_documents(
+            docs,
+            HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME),
+            ids=[d.metadata["chunk_id"] for d in docs],
+            persist_directory=db_dir,
+        )
+        reranker = Reranker()
+        reranker.score("warm-up", docs[:2])
+
+        print(
+            f"\n{'fetch_k':>7} {'recall vett.':>13} {'recall rerank':>14} "
+            f"{'MRR vett.':>10} {'MRR rerank':>11} {'p50 ms':>8} {'p95 ms':>8} {'oltre cap':>10}"
+        )
+        for fetch_k in args.fetch_k:
+            vector_rankings, rerank_rankings, latencies = [], [], []
+            for question, _ in queries:
+                candidates = store.similarity_search(question, k=fetch_k)
+                vector_rankings.append([d.metadata["chunk_id"] for d in candidates])
+                started = time.perf_counter()
+                scores = reranker.score(question, candidates)
+                latencies.append((time.perf_counter() - started) * 1000)
+                order = sorted(range(len(candidates)), key=lambda i: -float(scores[i]))
+                rerank_rankings.append([candidates[i].metadata["chunk_id"] for i in order])
+
+            vector_recall, vector_mrr = evaluate(vector_rankings, queries, args.k)
+            rerank_recall, rerank_mrr = evaluate(rerank_rankings, queries, args.k)
+            over_cap = sum(latency > RERANK_TIMEOUT_MS for latency in latencies)
+            print(
+                f"{fetch_k:>7} {vector_recall:>13.1%} {rerank_recall:>14.1%} "
+                f"{vector_mrr:>10.3f} {rerank_mrr:>11.3f} "
+                f"{percentile(latencies, 50):>8.1f} {percentile(latencies, 95):>8.1f} "
+                f"{over_cap:>10}"
+            )
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
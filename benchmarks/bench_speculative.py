@@ -0,0 +1,132 @@
+# benchmarks/bench_speculative.py
+"""
+Confronta la velocità di generazione su CPU con e senza decodifica
+speculativa (LLM_SPECULATIVE_DECODING), sulle stesse domande e con lo
+stesso prompt della RAG.
+
+Per ogni domanda il prompt viene prima valutato da solo (max_tokens=1),
+poi si genera la risposta: il prefisso è già nella KV cache, quindi il
+tempo misurato è quello della sola decodifica. Con --temperature 0 le
+risposte di tutte le modalità devono coincidere con quelle senza bozza.
+
+Uso:
+    python benchmarks/bench_speculative.py --modes none prompt_lookup --max-tokens 256
+    python benchmarks/bench_speculative.py --modes none draft_model --draft-model models/draft.gguf
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import statistics
+import time
+
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+
+from config import (
+    LLM_MODEL_PATH,
+    LLM_N_CTX,
+    LLM_DRAFT_MODEL_PATH,
+    LLM_DRAFT_NUM_PRED_TOKENS,
+    LLM_DRAFT_MAX_NGRAM,
+)
+from src.rag_pipeline import RAG_PROMPT_PREFIX, RAG_PROMPT_SUFFIX
+from src.speculative import SmallModelDraft
+from bench_prompt_prefix import make_context
+
+QUESTIONS = [
+    "Spiega il metodo updateOrder{n}: parametri, annotazioni e repository usati.",
+    "Quali eccezioni lancia updateOrder{n} e con quale status HTTP risponde?",
+    "Riporta il codice di updateOrder{n} e descrivi il DTO restituito.",
+]
+
+
+def make_draft(mode: str, args):
+    if mode == "none":
+        return None
+    if mode == "prompt_lookup":
+        return LlamaPromptLookupDecoding(
+            max_ngram_size=args.max_ngram, num_pred_tokens=args.num_pred_tokens
+        )
+    return SmallModelDraft(args.draft_model, args.num_pred_tokens, args.n_ctx, args.threads)
+
+
+def run_mode(mode: str, prompts, args):
+    draft = make_draft(mode, args)
+    llama = Llama(
+        model_path=args.model,
+        n_ctx=args.n_ctx,
+        n_gpu_layers=0,
+        n_threads=args.threads,
+        logits_all=draft is not None,  # come in load_local_llm
+        draft_model=draft,
+        verbose=False,
+    )
+    rates, answers, tokens = [], [], 0
+    for prompt in prompts:
+        llama.reset()
+        llama.create_completion(prompt, max_tokens=1, temperature=0.0)
+        started = time.perf_counter()
+        result = llama.create_completion(
+            prompt, max_tokens=args.max_tokens, temperature=args.temperature, seed=args.seed
+        )
+        elapsed = time.perf_counter() - started
+        n = result["usage"]["completion_tokens"]
+        rates.append(n / elapsed)
+        tokens += n
+        answers.append(result["choices"][0]["text"])
+    return statistics.median(rates), tokens, answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=LLM_MODEL_PATH)
+    parser.add_argument("--draft-model", default=LLM_DRAFT_MODEL_PATH)
+    parser.add_argument(
+        "--modes", nargs="+", default=["none", "prompt_lookup"],
+        choices=["none", "prompt_lookup", "draft_model"],
+    )
+    parser.add_argument("--n-ctx", type=int, default=LLM_N_CTX)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--context-tokens", type=int, default=1500)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--temperature", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--num-pred-tokens", type=int, default=LLM_DRAFT_NUM_PRED_TOKENS)
+    parser.add_argument("--max-ngram", type=int, default=LLM_DRAFT_MAX_NGRAM)
+    args = parser.parse_args()
+
+    tokenizer = Llama(model_path=args.model, vocab_only=True, verbose=False)
+    prompts = [
+        RAG_PROMPT_PREFIX
+        + RAG_PROMPT_SUFFIX.format(
+            context=make_context(tokenizer, args.context_tokens, q),
+            question=QUESTIONS[q % len(QUESTIONS)].format(n=q * 1000),
+        )
+        for q in range(args.questions)
+    ]
+    print(
+        f"Modello: {os.path.basename(args.model)} (CPU), {len(prompts)} domande, "
+        f"max {args.max_tokens} token, temperatura {args.temperature}"
+    )
+
+    print(f"{'modalità':<16}{'token/s p50':>14}{'token':>8}{'speedup':>10}{'uguali':>9}")
+    baseline = None
+    for mode in args.modes:
+        rate, tokens, answers = run_mode(mode, prompts, args)
+        if baseline is None:
+            baseline = (rate, answers)
+        same = sum(a == b for a, b in zip(answers, baseline[1]))
+        print(
+            f"{mode:<16}{rate:>14.1f}{tokens:>8}{rate / baseline[0]:>9.2f}x"
+            f"{same:>6}/{len(answers)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+# benchmarks/bench_vector_backends.py
+"""
+Confronta i backend dell'indice vettoriale (Chroma e memory map float16/IVF)
+su collezioni sintetiche di 10k, 100k e 1M chunk: tempo di caricamento
+(apertura + prima query), latenza delle query p50/p95, recall@k rispetto
+alla ricerca esatta e RSS massimo del processo che interroga. Su Linux si
+riporta anche la memoria anonima (RssAnon): le pagine del file in memory map
+(RssFile) sono cache del kernel, recuperabile sotto pressione.
+
+I vettori sono raggruppati attorno a centri casuali, come gli embedding di
+codice simile, e normalizzati; ogni chunk ha metadati e testo di dimensioni
+realistiche. Costruzione e query girano in processi separati, così l'RSS
+misurato è solo quello dell'interrogazione.
+
+Uso:
+    python benchmarks/bench_vector_backends.py --sizes 10000 100000 1000000
+    python benchmarks/bench_vector_backends.py --sizes 100000 --backends mmap --keep /tmp/bench_db
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import json
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+
+from src.vector_store import open_vector_store, upsert_chunks, persist_vector_store
+
+_BLOCK = 50_000
+_NUM_CENTERS = 2048
+
+
+def _centers(dim: int):
+    rng = np.random.default_rng(1234)
+    return rng.normal(size=(_NUM_CENTERS, dim)).astype(np.float32)
+
+
+def generate_block(start: int, stop: int, dim: int, centers=None):
+    """Vettori normalizzati delle righe [start, stop), riproducibili per blocco."""
+    centers = _centers(dim) if centers is None else centers
+    rng = np.random.default_rng(start)
+    vectors = centers[rng.integers(0, len(centers), stop - start)]
+    vectors = vectors + 0.6 * rng.normal(size=vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_chunks(start: int, stop: int):
+    ids, texts, metadatas = [], [], []
+    for i in range(start, stop):
+        cls, method = f"Service{i // 20}", f"handle{i % 20}"
+        ids.append(f"c{i}")
+        texts.append(
+            f"public Response {method}(Request request) {{\n"
+            f"    validate(request);\n    return repository.process{i}(request);\n}}\n"
+            * 3
+        )
+        metadatas.append(
+            {
+                "file": f"/repo/src/main/java/com/acme/{cls}.java",
+                "file_name": f"{cls}.java",
+                "class": cls,
+                "method": method,
+                "method_signature": f"{cls}.{method}(Request)",
+                "return_type": "Response",
+                "visibility": "public",
+                "is_static": False,
+                "content_type": "java_method",
+                "chunk_id": f"c{i}",
+            }
+        )
+    return ids, texts, metadatas
+
+
+def make_queries(size: int, num_queries: int, dim: int):
+    rng = np.random.default_rng(7)
+    centers = _centers(dim)
+    queries = []
+    for row in rng.integers(0, size, num_queries):
+        start = (row // _BLOCK) * _BLOCK
+        vector = generate_block(start, min(start + _BLOCK, size), dim, centers)[row - start]
+        noisy = vector + 0.3 * rng.normal(size=dim).astype(np.float32) / np.sqrt(dim)
+        queries.append(noisy / np.linalg.norm(noisy))
+    return np.asarray(queries, dtype=np.float32)
+
+
+def exact_neighbors(queries, size: int, dim: int, k: int):
+    """Top-k esatti per distanza L2, scorrendo la collezione a blocchi."""
+    centers = _centers(dim)
+    best = np.full((len(queries), 0), 0, dtype=np.int64)
+    best_d = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, size, _BLOCK):
+        stop = min(start + _BLOCK, size)
+        block = generate_block(start, stop, dim, centers).astype(np.float16).astype(np.float32)
+        d = (block * block).sum(1)[None, :] - 2.0 * queries @ block.T
+        cand = np.concatenate([best, np.arange(start, stop)[None, :].repeat(len(queries), 0)], 1)
+        cand_d = np.concatenate([best_d, d], 1)
+        top = np.argsort(cand_d, axis=1)[:, :k]
+        best = np.take_along_axis(cand, top, 1)
+        best_d = np.take_along_axis(cand_d, top, 1)
+    return best
+
+
+def rss_anon_mb() -> float:
+    """Memoria privata del processo (solo Linux, altrimenti NaN)."""
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def max_rss_mb() -> float:
+    # Su Linux ru_maxrss sopravvive a fork+exec (includerebbe il processo padre):
+    # VmHWM è il picco del solo processo corrente
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    # macOS: ru_maxrss in byte
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2
+
+
+def build(backend: str, db_path: str, size: int, dim: int):
+    store = open_vector_store("bench", db_path=db_path, backend=backend)
+    centers = _centers(dim)
+    started = time.perf_counter()
+    for start in range(0, size, _BLOCK):
+        stop = min(start + _BLOCK, size)
+        ids, texts, metadatas = make_chunks(start, stop)
+        vectors = generate_block(start, stop, dim, centers)
+        upsert_chunks(store, ids, vectors.tolist(), texts, metadatas)
+    persist_vector_store(store)
+    return {"build_s": time.perf_counter() - started}
+
+
+def query(backend: str, db_path: str, queries_path: str, k: int):
+    queries = np.load(queries_path)
+    started = time.perf_counter()
+    store = open_vector_store("bench", db_path=db_path, backend=backend)
+    store.similarity_search_by_vector_with_relevance_scores(queries[0].tolist(), k=k)
+    load_s = time.perf_counter() - started
+
+    latencies, found = [], []
+    for q in queries:
+        started = time.perf_counter()
+        hits = store.similarity_search_by_vector_with_relevance_scores(q.tolist(), k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        found.append([int(doc.metadata["chunk_id"][1:]) for doc, _ in hits])
+    latencies.sort()
+    return {
+        "load_s": load_s,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95)],
+        "max_rss_mb": max_rss_mb(),
+        "rss_anon_mb": rss_anon_mb(),
+        "found": found,
+    }
+
+
+def run_worker(*args) -> dict:
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", *map(str, args)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--backends", nargs="+", default=["chroma", "mmap"])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--keep", help="Cartella in cui conservare (e riusare) gli indici.")
+    parser.add_argument("--worker", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        mode, backend, db_path = args.worker[:3]
+        if mode == "build":
+            result = build(backend, db_path, int(args.worker[3]), int(args.worker[4]))
+        else:
+            result = query(backend, db_path, args.worker[3], int(args.worker[4]))
+        print(json.dumps(result))
+        return
+
+    work_dir = args.keep or tempfile.mkdtemp(prefix="bench_vectors_")
+    os.makedirs(work_dir, exist_ok=True)
+    try:
+        print(
+            f"{'chunk':>9} {'backend':>7} {'build s':>8} {'load s':>7} "
+            f"{'p50 ms':>7} {'p95 ms':>7} {'recall':>6} {'RSS MB':>7} {'anon MB':>7}"
+        )
+        for size in args.sizes:
+            queries = make_queries(size, args.queries, args.dim)
+            queries_path = os.path.join(work_dir, f"queries_{size}.npy")
+            np.save(queries_path, queries)
+            truth = exact_neighbors(queries, size, args.dim, args.k)
+            for backend in args.backends:
+                db_path = os.path.join(work_dir, f"{backend}_{size}")
+                build_s = float("nan")
+                if not os.path.isdir(db_path):
+                    build_s = run_worker("build", backend, db_path, size, args.dim)["build_s"]
+                result = run_worker("query", backend, db_path, queries_path, args.k)
+                recall = np.mean(
+                    [len(set(f) & set(t.tolist())) / args.k for f, t in zip(result["found"], truth)]
+                )
+                print(
+                    f"{size:>9} {backend:>7} {build_s:>8.1f} {result['load_s']:>7.2f} "
+                    f"{result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f} "
+                    f"{recall:>6.3f} {result['max_rss_mb']:>7.0f} "
+                    f"{result['rss_anon_mb']:>7.0f}"
+                )
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,17 +19,173 @@ os.makedirs(MODELS_DIR, exist_ok=True)
 GITHUB_REPO_URL = ""  # Esempio di un piccolo repo Python
 REPO_NAME = GITHUB_REPO_URL.split("/")[-1].replace(".git", "")
 
+# --- Configurazione Multi-Repository ---
+# Manifest JSON con i repository da indicizzare (vedi repos.example.json)
+REPOS_MANIFEST_PATH = os.path.join(BASE_DIR, "repos.json")
+REPO_FETCH_WORKERS = 8  # Clone/fetch eseguiti in parallelo
+REPO_CLONE_FILTER = "blob:none"  # Partial clone: i blob si scaricano solo se servono
+REPO_SHALLOW_CLONE = False  # True = scarica solo l'ultimo commit (--depth 1)
+REPO_FETCH_RETRIES = 3  # Tentativi del fetch in caso di errori di rete
+REPO_FETCH_RETRY_SECONDS = 2.0  # Attesa prima del secondo tentativo, poi raddoppia
+
+# --- Configurazione del Database Vettoriale ---
+CHROMA_COLLECTION_NAME = "langchain"  # Nome predefinito usato da langchain per Chroma
+# File con l'ultimo commit indicizzato per ogni collezione (ingestione incrementale)
+INDEX_STATE_PATH = os.path.join(CHROMA_DB_DIR, "index_state.json")
+# Backend dell'indice vettoriale: "chroma" oppure "mmap" (matrice float16 in memory
+# map con testi e metadati in un file accanto, vedi src/mmap_vector_store.py)
+VECTOR_BACKEND = "chroma"
+# Partizionamento IVF del backend mmap, costruito da questo numero di chunk in su
+VECTOR_IVF_MIN_ROWS = 5_000
+VECTOR_IVF_NPROBE = 16  # Liste IVF visitate per domanda (più liste = recall più alto)
+# Prima fase della ricerca del backend mmap su codici compatti: "none" (float16),
+# "int8" (1 byte per dimensione) o "binary" (1 bit per dimensione). I migliori
+# k * VECTOR_RESCORE_FACTOR candidati vengono riordinati sui vettori float16 su disco.
+VECTOR_QUANTIZATION = "none"
+VECTOR_RESCORE_FACTOR = 8
+# Indice per livelli: oltre ai chunk dei metodi, riassunti di classi e file (firme,
+# campi, annotazioni, elenco dei metodi) nelle collezioni "<collezione>.classes"
+# e "<collezione>.files"
+HIERARCHICAL_INDEX_ENABLED = True
+# Campi dei metadati tenuti in memoria per i filtri where (gli altri si leggono dal disco)
+VECTOR_FILTER_FIELDS = (
+    "file",
+    "file_name",
+    "class",
+    "method",
+    "visibility",
+    "is_static",
+    "return_type",
+    "content_type",
+)
+
+# --- Configurazione del Retrieval ---
+RETRIEVAL_K = 4  # Chunk recuperati per domanda (come il default di as_retriever)
+# Recupero diretto dei chunk di classi/metodi nominati nella domanda, prima della
+# ricerca vettoriale (tabella dei simboli costruita durante l'ingestione)
+SYMBOL_INDEX_ENABLED = True
+# Filtri sui metadati ricavati dalla domanda (classe, visibilità, tipo restituito, file)
+QUERY_PLANNER_ENABLED = True
+# Con meno risultati filtrati di così si completa con la ricerca senza filtro
+QUERY_FILTER_MIN_RESULTS = 4
+# Ricerca per livelli: si scelgono prima le classi dai loro riassunti, poi si cercano
+# i metodi solo dentro quelle classi; i riassunti scelti entrano nel contesto
+HIERARCHICAL_RETRIEVAL_ENABLED = True
+HIERARCHICAL_CLASS_K = 3  # Classi scelte al primo livello
+# Ricerca ibrida: BM25 sui token del codice + ricerca vettoriale, unite con RRF
+HYBRID_RETRIEVAL_ENABLED = True
+HYBRID_FETCH_K = 20  # Candidati chiesti a ciascun retriever prima della fusione
+HYBRID_RRF_K = 60  # Costante della Reciprocal Rank Fusion
+# Tempo massimo (ms) del retrieval: se il BM25 non ha finito si usa solo il vettoriale
+HYBRID_LATENCY_BUDGET_MS = 200
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Espansione sul call graph: ai chunk recuperati si aggiungono chiamati e chiamanti
+GRAPH_EXPANSION_ENABLED = True
+GRAPH_EXPANSION_HOPS = 2  # Passi massimi nel grafo (controller -> service -> repository)
+GRAPH_EXPANSION_MAX_CHUNKS = 4  # Chunk aggiunti al massimo oltre ai k recuperati
+# Reranking con cross-encoder su CPU: si recuperano più candidati e restano i migliori k
+RERANK_ENABLED = False
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_FETCH_K = 50  # Candidati valutati dal cross-encoder
+RERANK_MAX_LENGTH = 256  # Token massimi per coppia domanda/chunk
+RERANK_TIMEOUT_MS = 400  # Oltre questo tempo si usa l'ordine del retrieval
+
+# --- Cache delle Domande ---
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Embedding di domande tenuti in memoria (LRU)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_DIR = os.path.join(DATA_DIR, "answer_cache")
+ANSWER_CACHE_SIZE_LIMIT = 256 * 1024**2  # 256 MB, poi eviction LRU
+# Da incrementare quando cambia il template del prompt: invalida le risposte salvate
+PROMPT_VERSION = 2
+
 # --- Configurazione Embeddings ---
 EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# Cache su disco degli embedding dei chunk, indirizzata per contenuto
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = os.path.join(DATA_DIR, "embedding_cache")
+EMBEDDING_CACHE_SIZE_LIMIT = 2 * 1024**3  # 2 GB, poi eviction LRU
 
 # --- Configurazione LLM Locale (per la Fase 3) ---
 LLM_MODEL_NAME = "mistral-7b-instruct-v0.2.Q5_K_S.gguf"
 LLM_MODEL_PATH = os.path.join(MODELS_DIR, LLM_MODEL_NAME)
+LLM_N_CTX = 8192  # Finestra di contesto (prompt + risposta)
+LLM_MAX_TOKENS = 2048  # Token massimi della risposta
+# KV cache delle istruzioni fisse in testa al prompt: valutate una volta all'avvio e
+# ripristinate a ogni domanda, il prefill elabora solo contesto e domanda
+PROMPT_PREFIX_CACHE_ENABLED = True
+# Salva lo stato del prefisso su disco: anche i riavvii saltano la valutazione
+PROMPT_PREFIX_CACHE_PERSIST = True
+PROMPT_CACHE_DIR = os.path.join(DATA_DIR, "prompt_cache")
+PROMPT_CACHE_SIZE_LIMIT = 1024**3  # 1 GB (uno stato per modello e prefisso)
+# Decodifica speculativa (vedi src/speculative.py): "none", "prompt_lookup" (bozze
+# copiate dal prompt, utile perché le risposte citano il codice del contesto) o
+# "draft_model" (bozze di un modello GGUF piccolo con lo stesso tokenizer). Il
+# modello principale verifica le bozze in un solo batch; l'output non cambia, ma
+# servono i logit di ogni posizione (circa n_ctx * vocabolario * 4 byte di RAM in più).
+LLM_SPECULATIVE_DECODING = "none"
+LLM_DRAFT_NUM_PRED_TOKENS = 10  # Token proposti per ogni passo di verifica
+LLM_DRAFT_MAX_NGRAM = 3  # prompt_lookup: n-gram più lungo cercato nel prompt
+LLM_DRAFT_MODEL_PATH = os.path.join(MODELS_DIR, "mistral-draft.gguf")
+LLM_DRAFT_N_CTX = LLM_N_CTX
+# Profilo hardware creato da `python src/autotune.py`: thread di prefill e di
+# decodifica, n_batch, n_ctx e mmap/mlock misurati su questo host. Se esiste (per
+# lo stesso file del modello) load_local_llm lo usa al posto dei valori predefiniti.
+# LLM_PROFILE_PATH nell'ambiente sposta il file sia per autotune sia per il caricamento.
+LLM_PROFILE_ENABLED = True
+LLM_PROFILE_PATH = os.getenv("LLM_PROFILE_PATH", os.path.join(DATA_DIR, "llm_profile.json"))
+AUTOTUNE_BATCH_SIZES = (128, 256, 512, 1024)
+AUTOTUNE_CTX_SIZES = (2048, 4096, 8192, 16384, 32768)  # Limitati da LLM_N_CTX
+AUTOTUNE_PREFILL_TOKENS = 512  # Lunghezza del prompt usato per misurare il prefill
+AUTOTUNE_DECODE_TOKENS = 32  # Token decodificati uno alla volta per misura
+AUTOTUNE_MEMORY_FRACTION = 0.8  # Quota della memoria disponibile per modello e KV cache
+
+# --- Scheduler delle Generazioni ---
+# Richieste in coda per l'LLM oltre le quali le nuove vengono rifiutate
+SCHEDULER_MAX_QUEUE = 16
+SCHEDULER_MAX_QUEUE_PER_USER = 2
+# Ogni quanti secondi di attesa una richiesta sale di un livello di priorità
+SCHEDULER_AGING_SECONDS = 30
+# Domande più lunghe (in parole) vengono trattate come spiegazioni, non consultazioni
+SCHEDULER_LOOKUP_MAX_WORDS = 20
+SCHEDULER_STATS_WINDOW = 200  # Richieste recenti usate per i tempi di attesa
+
+# --- API HTTP ---
+# Un solo processo (niente --workers): ogni worker caricherebbe un'altra copia del modello
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", 8000))
+API_BATCH_MAX_QUESTIONS = 100  # Domande accettate da una singola richiesta /ask/batch
+API_BATCH_RETRY_SECONDS = 1.0  # Attesa prima di riprovare se la coda dell'LLM è piena
+
+# --- Impostazioni del Contesto del Prompt ---
+# Margine di token lasciato libero oltre a prompt e risposta (BOS, separatori)
+CONTEXT_SAFETY_TOKENS = 64
+# Sotto questo spazio residuo non si aggiungono altri blocchi di codice
+CONTEXT_MIN_BLOCK_TOKENS = 48
 
 # --- Impostazioni per il Chunking del Codice ---
 CHUNK_SIZE = 1000  # Dimensione massima dei "pezzi" di codice (in caratteri)
 CHUNK_OVERLAP = 400  # Sovrapposizione tra i pezzi per mantenere il contesto
 
+# --- Impostazioni per la Lettura dei Sorgenti ---
+SOURCE_MAX_FILE_SIZE = 1024 * 1024  # File più grandi (es. generati) vengono ignorati
+
+# --- Impostazioni per il Parsing Java ---
+# Numero di processi usati per analizzare i file Java in parallelo (1 = seriale)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+# Cache dei record estratti, indicizzata per SHA del blob git del file
+PARSE_CACHE_ENABLED = True
+PARSE_CACHE_DIR = os.path.join(DATA_DIR, "parse_cache")
+PARSE_CACHE_SIZE_LIMIT = 1024**3  # 1 GB
+# Una chiamata non qualificata viene collegata solo se i metodi omonimi sono al più N
+CALL_GRAPH_MAX_CANDIDATES = 3
+
+# --- Impostazioni per l'Ingestione in Streaming ---
+STREAM_PARSE_BATCH_FILES = 64  # File analizzati per ogni batch dello stadio di parsing
+STREAM_EMBED_BATCH_SIZE = 256  # Chunk per ogni chiamata al modello di embedding
+STREAM_QUEUE_SIZE = 4  # Batch in attesa tra uno stadio e l'altro (limita la RAM)
+STREAM_PROGRESS_INTERVAL = 10  # Secondi tra due report di avanzamento
+
 # --- Bitbucket Credentials (se necessarie in futuro) ---
 BITBUCKET_USERNAME = os.getenv("BITBUCKET_USERNAME")
 BITBUCKET_APP_PASSWORD = os.getenv("BITBUCKET_APP_PASSWORD")
@@ -0,0 +1,213 @@
+# src/api.py
+"""
+API HTTP asincrona dell'assistente, per CI e strumenti interni.
+
+Endpoint:
+- POST /ask: risposta completa con le fonti;
+- POST /ask/stream: Server-Sent Events, prima l'evento "sources", poi un
+  evento "token" per ogni pezzo della risposta e infine "done" (oppure
+  "error" se la coda dell'LLM è piena);
+- POST /ask/batch: retrieval di tutte le domande in parallelo, poi
+  generazione una domanda alla volta, ordinate per chunk recuperati: prompt
+  con lo stesso contesto iniziale uno dopo l'altro riusano la KV cache;
+- GET /health: indice caricato, coda dell'LLM e cache.
+
+L'assistente è quello condiviso del processo (src/model_server.py): il
+retrieval gira in thread separati e le generazioni passano dallo scheduler
+(src/scheduler.py), quindi una generazione lenta non blocca il retrieval
+delle altre richieste. La coda si riempie solo delle domande che devono
+davvero generare (le risposte in cache non la occupano): se è piena /ask
+risponde 429 e /ask/stream, già aperto con le fonti, termina con "error".
+
+Avvio (un solo worker):
+    uvicorn src.api:app --host 127.0.0.1 --port 8000
+    python src/api.py
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, Field
+from sse_starlette.sse import EventSourceResponse
+
+from config import API_HOST, API_PORT, API_BATCH_MAX_QUESTIONS, API_BATCH_RETRY_SECONDS
+from src.model_server import get_code_assistant
+from src.scheduler import SchedulerFull
+
+
+class AskRequest(BaseModel):
+    question: str = Field(min_length=1)
+    repos: Optional[List[str]] = None  # None = tutti i repository indicizzati
+    user: Optional[str] = None  # Per i turni equi dello scheduler
+
+
+class AskResponse(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[dict] = []
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    questions: List[str] = Field(min_length=1, max_length=API_BATCH_MAX_QUESTIONS)
+    repos: Optional[List[str]] = None
+    user: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    results: List[AskResponse]
+    seconds: float
+
+
+def source_info(doc) -> dict:
+    """Metadati essenziali di un chunk recuperato."""
+    meta = doc.metadata
+    return {
+        "repo": meta.get("repo"),
+        "file": meta.get("file") or meta.get("source"),
+        "class": meta.get("class"),
+        "method": meta.get("method_signature"),
+        "content_type": meta.get("content_type"),
+        "chunk_id": meta.get("chunk_id"),
+    }
+
+
+def _context_key(docs):
+    """Chiave di ordinamento del batch: i chunk recuperati, nell'ordine del contesto."""
+    return [f"{d.metadata.get('repo')}/{d.metadata.get('chunk_id')}" for d in docs]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Modelli e indice si caricano all'avvio, non alla prima domanda
+    await asyncio.to_thread(get_code_assistant)
+    yield
+
+
+app = FastAPI(title="Assistente AI per la Codebase Java", lifespan=lifespan)
+
+
+@app.get("/health")
+async def health():
+    assistant = get_code_assistant()
+    return {
+        "status": "ok",
+        "collections": list(assistant.collections),
+        "chunks": await asyncio.to_thread(assistant.count_indexed_chunks),
+        "scheduler": assistant.scheduler.stats(),
+        "cache": assistant.cache_stats(),
+    }
+
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(request: AskRequest):
+    assistant = get_code_assistant()
+    started = time.perf_counter()
+    ticket = assistant.enqueue(request.question, request.user)
+    try:
+        docs = await assistant.aretrieve(request.question, request.repos)
+    except BaseException:
+        ticket.release()
+        raise
+    # Da qui il ticket appartiene al thread di generazione, che lo libera
+    try:
+        answer = await assistant.aanswer(request.question, docs, request.repos, ticket)
+    except SchedulerFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return AskResponse(
+        question=request.question,
+        answer=answer,
+        sources=[source_info(d) for d in docs],
+        seconds=time.perf_counter() - started,
+    )
+
+
+@app.post("/ask/stream")
+async def ask_stream(request: AskRequest):
+    assistant = get_code_assistant()
+    ticket = assistant.enqueue(request.question, request.user)
+
+    async def events():
+        # Se il client si disconnette il generatore viene annullato: prima
+        # della generazione il ticket esce dalla coda, durante la generazione
+        # viene annullato e il thread che la esegue libera l'LLM quando
+        # llama.cpp ha finito il passo in corso
+        stream = None
+        try:
+            docs = await assistant.aretrieve(request.question, request.repos)
+            yield {"event": "sources", "data": json.dumps([source_info(d) for d in docs])}
+            stream = assistant.astream_answer(request.question, docs, request.repos, ticket)
+            async for chunk in stream:
+                yield {"event": "token", "data": json.dumps({"text": chunk})}
+            yield {"event": "done", "data": ""}
+        except SchedulerFull as e:
+            # Lo stream è già aperto: il rifiuto arriva come evento
+            yield {"event": "error", "data": json.dumps({"status": 429, "detail": str(e)})}
+        finally:
+            if stream is None:
+                ticket.release()
+            else:
+                await stream.aclose()
+
+    return EventSourceResponse(events())
+
+
+@app.post("/ask/batch", response_model=BatchResponse)
+async def ask_batch(request: BatchRequest):
+    assistant = get_code_assistant()
+    started = time.perf_counter()
+    questions = request.questions
+    user = request.user or "batch"
+
+    # 1. Retrieval di tutte le domande in parallelo
+    retrieved = await asyncio.gather(
+        *(assistant.aretrieve(q, request.repos) for q in questions),
+        return_exceptions=True,
+    )
+    results = [
+        AskResponse(question=q, error=str(docs))
+        if isinstance(docs, Exception)
+        else AskResponse(question=q, sources=[source_info(d) for d in docs])
+        for q, docs in zip(questions, retrieved)
+    ]
+
+    # 2. Generazione una alla volta, in ordine di contesto. Ogni domanda prende
+    # il proprio turno nello scheduler: le richieste degli altri utenti si
+    # alternano con quelle del batch invece di attenderne la fine.
+    order = sorted(
+        (i for i, docs in enumerate(retrieved) if not isinstance(docs, Exception)),
+        key=lambda i: _context_key(retrieved[i]),
+    )
+    for i in order:
+        generation_started = time.perf_counter()
+        while True:
+            ticket = assistant.enqueue(questions[i], user)
+            try:
+                results[i].answer = await assistant.aanswer(
+                    questions[i], retrieved[i], request.repos, ticket
+                )
+                break
+            except SchedulerFull:
+                await asyncio.sleep(API_BATCH_RETRY_SECONDS)
+            except Exception as e:
+                results[i].error = str(e)
+                break
+        results[i].seconds = time.perf_counter() - generation_started
+
+    return BatchResponse(results=results, seconds=time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=API_HOST, port=API_PORT)
@@ -0,0 +1,353 @@
+# src/autotune.py
+"""
+Profilo hardware dell'LLM: misura sull'host corrente le combinazioni di
+parametri di llama.cpp e salva la migliore in LLM_PROFILE_PATH, che
+load_local_llm() usa automaticamente.
+
+Passi:
+1. CPU utilizzabili: affinità del processo e quota CPU del cgroup (i
+   container vedono spesso tutti i core dell'host), core fisici senza
+   hyperthread;
+2. n_ctx: il più grande tra AUTOTUNE_CTX_SIZES (fino a LLM_N_CTX e al
+   contesto di addestramento) per cui modello e KV cache stanno nella
+   memoria disponibile, anche quella limitata dal cgroup;
+3. caricamento con mmap, senza mmap e con mlock: tempo di caricamento più
+   primo prefill;
+4. thread: prefill (n_threads_batch) e decodifica (n_threads) sono misurati
+   separatamente, perché il prefill scala con i core mentre la decodifica è
+   limitata dalla banda di memoria e spesso rende meglio con meno thread;
+5. n_batch tra AUTOTUNE_BATCH_SIZES, misurando il prefill;
+6. offload su GPU (se la build di llama.cpp lo supporta): i passi precedenti
+   misurano solo la CPU, quindi l'offload completo con i parametri scelti è
+   un candidato a sé e si tiene solo se decodifica più velocemente.
+
+Uso:
+    python src/autotune.py
+    python src/autotune.py --model models/altro.gguf --threads 2 4 8 --quick
+    LLM_PROFILE_PATH=/percorso/profilo.json python src/autotune.py
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import argparse
+import json
+import resource
+import time
+from datetime import datetime, timezone
+
+from config import (
+    LLM_MODEL_PATH,
+    LLM_N_CTX,
+    LLM_PROFILE_ENABLED,
+    LLM_PROFILE_PATH,
+    AUTOTUNE_BATCH_SIZES,
+    AUTOTUNE_CTX_SIZES,
+    AUTOTUNE_PREFILL_TOKENS,
+    AUTOTUNE_DECODE_TOKENS,
+    AUTOTUNE_MEMORY_FRACTION,
+)
+
+# Testo per le misure: codice Java simile ai chunk del contesto
+_SAMPLE = """@Transactional
+public ResponseEntity<OrderDto> updateOrder(@PathVariable Long id, @Valid @RequestBody OrderDto dto) {
+    Order order = orderRepository.findById(id).orElseThrow(() -> new OrderNotFoundException(id));
+    order.setStatus(dto.getStatus());
+    return ResponseEntity.ok(orderMapper.toDto(orderRepository.save(order)));
+}
+"""
+
+
+def _read(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """CPU concesse dalla quota del cgroup (v2 o v1), None se senza limite."""
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")
+    if cpu_max:
+        quota, _, period = cpu_max.partition(" ")
+        if quota != "max":
+            return max(1, int(int(quota) / int(period or 100000)))
+        return None
+    quota = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+    period = _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return max(1, int(int(quota) / int(period)))
+    return None
+
+
+def physical_cores(cpus) -> int:
+    """Core fisici tra le CPU indicate (gli hyperthread dello stesso core contano una volta)."""
+    cores, cpu = set(), None
+    physical_id = None
+    for line in (_read("/proc/cpuinfo") or "").splitlines():
+        key, _, value = (part.strip() for part in line.partition(":"))
+        if key == "processor":
+            cpu, physical_id = int(value), None
+        elif key == "physical id":
+            physical_id = value
+        elif key == "core id" and cpu in cpus:
+            cores.add((physical_id, value))
+    return len(cores) or len(cpus)
+
+
+def host_info() -> dict:
+    cpus = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else set(range(os.cpu_count() or 1))
+    quota = cgroup_cpu_limit()
+    physical = physical_cores(cpus)
+    return {
+        "logical_cpus": len(cpus),
+        "physical_cores": physical,
+        "cgroup_cpus": quota,
+        # Un thread per core fisico, entro la quota del cgroup
+        "usable_cpus": min(physical, quota or physical),
+        "memory_bytes": available_memory(),
+    }
+
+
+def default_threads() -> int:
+    """Thread di llama.cpp senza profilo: core fisici entro la quota del cgroup."""
+    return host_info()["usable_cpus"]
+
+
+def available_memory() -> int:
+    """Memoria disponibile, limitata dal cgroup se più basso."""
+    available = None
+    for line in (_read("/proc/meminfo") or "").splitlines():
+        if line.startswith("MemAvailable:"):
+            available = int(line.split()[1]) * 1024
+    limits = []
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        value = _read(path)
+        if value and value.isdigit():
+            limits.append(int(value))
+    candidates = [v for v in [available, *limits] if v]
+    return min(candidates) if candidates else 0
+
+
+def _model_key(model_path: str) -> dict:
+    return {"model": os.path.basename(model_path), "model_size": os.path.getsize(model_path)}
+
+
+def load_llm_profile(model_path: str = LLM_MODEL_PATH):
+    """Profilo salvato per questo modello, None se assente, disattivato o di un altro modello."""
+    if not LLM_PROFILE_ENABLED or not os.path.exists(LLM_PROFILE_PATH):
+        return None
+    try:
+        with open(LLM_PROFILE_PATH, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"⚠️ Profilo in {LLM_PROFILE_PATH} illeggibile ({e}): uso i valori predefiniti.")
+        return None
+    if not os.path.exists(model_path) or any(
+        profile.get(k) != v for k, v in _model_key(model_path).items()
+    ):
+        print(f"⚠️ Profilo in {LLM_PROFILE_PATH} creato per un altro modello: ignorato.")
+        return None
+    return profile
+
+
+def _kv_bytes_per_token(metadata: dict) -> int:
+    """Byte di KV cache (float16) per token di contesto, dai metadati GGUF."""
+    arch = metadata.get("general.architecture", "llama")
+    n_layer = int(metadata[f"{arch}.block_count"])
+    n_embd = int(metadata[f"{arch}.embedding_length"])
+    n_head = int(metadata[f"{arch}.attention.head_count"])
+    n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    return 2 * n_layer * (n_embd // n_head) * n_head_kv * 2
+
+
+def _best(rates: dict):
+    return max(rates, key=rates.get)
+
+
+class _Bench:
+    def __init__(self, model_path: str, repeats: int):
+        from llama_cpp import Llama
+
+        self.Llama = Llama
+        self.model_path = model_path
+        self.repeats = repeats
+        vocab = Llama(model_path=model_path, vocab_only=True, verbose=False)
+        self.metadata = vocab.metadata
+        text = _SAMPLE * (AUTOTUNE_PREFILL_TOKENS // 40 + AUTOTUNE_DECODE_TOKENS // 40 + 2)
+        self.tokens = vocab.tokenize(text.encode("utf-8"))
+        del vocab
+
+    def load(self, n_gpu_layers: int = 0, **params):
+        return self.Llama(
+            model_path=self.model_path, n_gpu_layers=n_gpu_layers, verbose=False, **params
+        )
+
+    def prefill(self, llama, n_tokens=AUTOTUNE_PREFILL_TOKENS) -> float:
+        """Token/s nella valutazione di un prompt di n_tokens."""
+        best = 0.0
+        for _ in range(self.repeats):
+            llama.reset()
+            started = time.perf_counter()
+            llama.eval(self.tokens[:n_tokens])
+            best = max(best, n_tokens / (time.perf_counter() - started))
+        return best
+
+    def decode(self, llama, n_tokens=AUTOTUNE_DECODE_TOKENS) -> float:
+        """Token/s valutando un token alla volta dopo un breve prompt, come in generazione."""
+        best = 0.0
+        for _ in range(self.repeats):
+            llama.reset()
+            llama.eval(self.tokens[:64])
+            started = time.perf_counter()
+            for token in self.tokens[64 : 64 + n_tokens]:
+                llama.eval([token])
+            best = max(best, n_tokens / (time.perf_counter() - started))
+        return best
+
+
+def autotune(
+    model_path: str = LLM_MODEL_PATH,
+    threads=None,
+    batch_sizes=AUTOTUNE_BATCH_SIZES,
+    ctx_sizes=AUTOTUNE_CTX_SIZES,
+    repeats: int = 2,
+) -> dict:
+    """Esegue le misure e restituisce il profilo migliore (senza salvarlo)."""
+    import llama_cpp
+
+    host = host_info()
+    print(
+        f"🖥️ CPU: {host['logical_cpus']} logiche, {host['physical_cores']} core fisici, "
+        f"quota cgroup {host['cgroup_cpus'] or 'nessuna'}; "
+        f"memoria disponibile {host['memory_bytes'] / 1024**3:.1f} GB"
+    )
+    bench = _Bench(model_path, repeats)
+    results = {}
+
+    # 2. Contesto: il più grande che sta in memoria
+    model_bytes = os.path.getsize(model_path)
+    kv_per_token = _kv_bytes_per_token(bench.metadata)
+    arch = bench.metadata.get("general.architecture", "llama")
+    n_ctx_train = int(bench.metadata.get(f"{arch}.context_length", LLM_N_CTX))
+    # Senza informazioni sulla memoria (host non Linux) non si limita il contesto
+    budget = host["memory_bytes"] * AUTOTUNE_MEMORY_FRACTION or float("inf")
+    fitting = [
+        c for c in sorted(ctx_sizes)
+        if c <= min(LLM_N_CTX, n_ctx_train) and model_bytes + c * kv_per_token <= budget
+    ]
+    n_ctx = fitting[-1] if fitting else min(ctx_sizes)
+    results["n_ctx"] = {
+        str(c): round((model_bytes + c * kv_per_token) / 1024**3, 2) for c in sorted(ctx_sizes)
+    }
+    print(f"📐 n_ctx={n_ctx} (modello + KV cache entro {budget / 1024**3:.1f} GB di memoria)")
+
+    # 3. Caricamento: mmap, senza mmap, mlock (se il limite di memoria bloccabile basta)
+    storage_options = {"mmap": dict(use_mmap=True, use_mlock=False), "no_mmap": dict(use_mmap=False, use_mlock=False)}
+    memlock = resource.getrlimit(resource.RLIMIT_MEMLOCK)[0]
+    if llama_cpp.llama_supports_mlock() and (memlock == resource.RLIM_INFINITY or memlock >= model_bytes):
+        storage_options["mlock"] = dict(use_mmap=True, use_mlock=True)
+    load_times = {}
+    for name, params in storage_options.items():
+        started = time.perf_counter()
+        llama = bench.load(n_ctx=n_ctx, **params)
+        llama.eval(bench.tokens[:AUTOTUNE_PREFILL_TOKENS])
+        load_times[name] = time.perf_counter() - started
+        del llama
+        print(f"   caricamento {name}: {load_times[name]:.2f}s")
+    # A parità (entro il 10%) si preferisce mmap: le pagine del modello sono condivise
+    storage = min(load_times, key=lambda k: load_times[k] * (0.9 if k == "mmap" else 1.0))
+    results["load_seconds"] = load_times
+
+    # 4. Thread, separati per prefill e decodifica, senza ricaricare il modello
+    usable = host["usable_cpus"]
+    candidates = threads or sorted(
+        {t for t in (1, 2, 4, 8, 16, 32, 64) if t < usable} | {usable, host["logical_cpus"]}
+    )
+    llama = bench.load(n_ctx=n_ctx, **storage_options[storage])
+    prefill_rates, decode_rates = {}, {}
+    for t in candidates:
+        llama_cpp.llama_set_n_threads(llama.ctx, t, t)
+        prefill_rates[t] = bench.prefill(llama)
+        decode_rates[t] = bench.decode(llama)
+        print(f"   {t:>3} thread: prefill {prefill_rates[t]:7.1f} tok/s, decodifica {decode_rates[t]:6.1f} tok/s")
+    n_threads_batch, n_threads = _best(prefill_rates), _best(decode_rates)
+    del llama
+    results["prefill_tokens_per_s"] = prefill_rates
+    results["decode_tokens_per_s"] = decode_rates
+
+    # 5. Dimensione del batch di prefill
+    batch_rates = {}
+    for b in [b for b in batch_sizes if b <= n_ctx]:
+        llama = bench.load(
+            n_ctx=n_ctx, n_batch=b, n_ubatch=b,
+            n_threads=n_threads, n_threads_batch=n_threads_batch,
+            **storage_options[storage],
+        )
+        batch_rates[b] = bench.prefill(llama)
+        del llama
+        print(f"   n_batch {b:>5}: prefill {batch_rates[b]:7.1f} tok/s")
+    n_batch = _best(batch_rates)
+    results["batch_prefill_tokens_per_s"] = batch_rates
+
+    # 6. Offload su GPU, con i parametri scelti per la CPU
+    tuned = dict(
+        n_ctx=n_ctx, n_batch=n_batch, n_ubatch=n_batch,
+        n_threads=n_threads, n_threads_batch=n_threads_batch,
+        **storage_options[storage],
+    )
+    n_gpu_layers = 0
+    if llama_cpp.llama_supports_gpu_offload():
+        gpu_rates = {}
+        for layers in (0, -1):
+            llama = bench.load(n_gpu_layers=layers, **tuned)
+            gpu_rates[layers] = bench.decode(llama)
+            del llama
+            print(f"   n_gpu_layers {layers:>3}: decodifica {gpu_rates[layers]:6.1f} tok/s")
+        n_gpu_layers = _best(gpu_rates)
+        results["gpu_decode_tokens_per_s"] = gpu_rates
+
+    return {
+        **_model_key(model_path),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "host": host,
+        # Solo configurazioni misurate: 0 se l'offload non è stato provato o non conviene
+        "n_gpu_layers": n_gpu_layers,
+        **tuned,
+        "results": results,
+    }
+
+
+def save_llm_profile(profile: dict, path: str = LLM_PROFILE_PATH):
+    """Scrive il profilo in un file temporaneo e lo sostituisce: mai un JSON troncato."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Autotuning dei parametri di llama.cpp su questo host.")
+    parser.add_argument("--model", default=LLM_MODEL_PATH, help="Modello GGUF da misurare.")
+    parser.add_argument("--threads", type=int, nargs="+", help="Numeri di thread da provare.")
+    parser.add_argument(
+        "--quick", action="store_true", help="Una sola ripetizione per misura."
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Modello LLM non trovato: {args.model}")
+        sys.exit(1)
+    profile = autotune(args.model, threads=args.threads, repeats=1 if args.quick else 2)
+    save_llm_profile(profile)
+    print(
+        f"\n✅ Profilo salvato in {LLM_PROFILE_PATH}: n_ctx={profile['n_ctx']}, "
+        f"n_batch={profile['n_batch']}, thread prefill/decodifica="
+        f"{profile['n_threads_batch']}/{profile['n_threads']}, "
+        f"mmap={profile['use_mmap']}, mlock={profile['use_mlock']}"
+    )
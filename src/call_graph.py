@@ -0,0 +1,315 @@
+# src/call_graph.py
+"""
+Call graph dei metodi indicizzati.
+
+Durante l'ingestione le chiamate di ogni metodo (nome + oggetto su cui sono
+invocate, es. userService.createUser) vengono risolte negli ID dei chunk dei
+metodi chiamati. La risoluzione è per nome, aiutata dal qualificatore:
+
+- `this.m()` / `m()`: metodi omonimi della stessa classe;
+- `userService.m()` / `UserService.m()`: metodi omonimi della classe con lo
+  stesso nome del qualificatore (anche con suffisso Impl);
+- `find(1).map()` (chiamata sul risultato di un'altra espressione) e ogni
+  altro qualificatore sconosciuto: il metodo si collega solo se il candidato
+  omonimo è uno solo.
+
+Fra gli overload si preferiscono quelli con tanti parametri quanti sono gli
+argomenti della chiamata.
+
+Il grafo è salvato in formato CSR (indptr + indices) in file .npy, sia per i
+chiamati sia per i chiamanti, e viene aperto in memory map: la query legge
+solo le righe dei nodi visitati. Accanto c'è la tabella dei nodi con le
+chiamate non risolte, usata per aggiornare il grafo in modo incrementale.
+"""
+import os
+import gzip
+import json
+import shutil
+
+import numpy as np
+
+from config import CALL_GRAPH_MAX_CANDIDATES
+from src.java_parser import EXPRESSION_QUALIFIER
+
+_NODES_FILE = "nodes.json.gz"
+_IDS_FILE = "ids.json"
+
+
+def parse_qualified_calls(metadata: dict):
+    """Chiamate [(qualificatore, metodo, numero di argomenti o None)] dai metadati di un chunk."""
+    raw = metadata.get("qualified_calls")
+    if raw is None:
+        # Chunk di indici precedenti: solo i nomi dei metodi
+        raw = metadata.get("calls", "")
+    calls = []
+    for call in raw.split(", "):
+        if call:
+            qualifier, _, name = call.rpartition(".")
+            calls.append((qualifier, name))
+    arities = [int(a) for a in metadata.get("call_arities", "").split(", ") if a]
+    if len(arities) != len(calls):
+        arities = [None] * len(calls)
+    return [(q, name, arity) for (q, name), arity in zip(calls, arities)]
+
+
+def _to_csr(num_nodes: int, sources, targets):
+    order = np.lexsort((targets, sources))
+    sources, targets = sources[order], targets[order]
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    return indptr, targets.astype(np.int32)
+
+
+def resolve_calls(nodes: dict, sites=None, max_candidates: int = CALL_GRAPH_MAX_CANDIDATES):
+    """
+    Risolve le chiamate dei nodi {chunk_id: (file, classe, metodo, chiamate, parametri)}.
+    `sites` limita la risoluzione alle chiamate di alcuni nodi (tutti se None).
+    Restituisce {chunk_id: insieme dei chunk_id chiamati}.
+
+    I candidati sono indicizzati per (classe, metodo) e per (metodo, numero di
+    parametri): ogni chiamata consulta solo le proprie liste.
+    """
+    by_class = {}  # (classe, metodo) -> chunk_id
+    by_arity = {}  # (metodo, parametri) -> chunk_id
+    by_name = {}  # metodo -> chunk_id (chiamate di cui non si conosce l'arità)
+    for chunk_id, (_, class_name, method, _, num_params) in nodes.items():
+        by_class.setdefault((class_name.lower(), method), []).append(chunk_id)
+        by_arity.setdefault((method, num_params), []).append(chunk_id)
+        by_name.setdefault(method, []).append(chunk_id)
+
+    def same_arity(targets, arity):
+        # Fra gli overload si preferiscono quelli con lo stesso numero di argomenti
+        if arity is None:
+            return targets
+        return [t for t in targets if nodes[t][4] == arity] or targets
+
+    resolved = {}
+    for chunk_id in nodes if sites is None else sites:
+        file, class_name, _, calls, _ = nodes[chunk_id]
+        edges = set()
+        for qualifier, name, arity in calls:
+            if name not in by_name:
+                continue
+            qualifier = qualifier.rsplit(".", 1)[-1].lower()
+            if qualifier == EXPRESSION_QUALIFIER:
+                # Chiamata sul risultato di un'altra espressione (find(1).map(x)):
+                # non è una chiamata su this, si collega solo un candidato univoco
+                targets = []
+                limit = 1
+            elif qualifier in ("", "this"):
+                targets = [
+                    t for t in by_class.get((class_name.lower(), name), ()) if nodes[t][0] == file
+                ]
+                limit = max_candidates
+            else:
+                targets = by_class.get((qualifier, name), []) + by_class.get(
+                    (qualifier + "impl", name), []
+                )
+                # Qualificatore sconosciuto (variabile locale, interfaccia...): solo se univoco
+                limit = 1
+            targets = same_arity(targets, arity)
+            if not targets:
+                pool = (
+                    by_name[name]
+                    if arity is None
+                    else by_arity.get((name, arity), []) + by_arity.get((name, None), [])
+                )
+                others = [t for t in pool if t != chunk_id]
+                targets = others if len(others) <= limit else []
+            edges.update(t for t in targets if t != chunk_id)
+        resolved[chunk_id] = edges
+    return resolved
+
+
+class CallGraphBuilder:
+    """
+    Tabella dei nodi aggiornabile per file; al salvataggio risolve e scrive il grafo.
+    Dopo un aggiornamento incrementale si risolvono di nuovo solo le chiamate
+    dei nodi aggiunti e quelle dirette a metodi con un nome aggiunto o rimosso;
+    gli archi degli altri nodi vengono dal grafo salvato.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # chunk_id -> (file, classe, metodo, [(qualificatore, metodo, arità)], parametri)
+        self.edges = {}  # chunk_id -> chunk_id chiamati, già risolti
+        self._dirty = set()  # nodi da risolvere al prossimo salvataggio
+        self._changed_names = set()  # nomi dei metodi aggiunti o rimossi
+        self._resolve_all = True  # nessun grafo precedente valido
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_chunks(self, chunks):
+        for doc in chunks:
+            meta = doc.metadata
+            if meta.get("chunk_id") and meta.get("method"):
+                previous = self.nodes.get(meta["chunk_id"])
+                if previous is not None:
+                    self._changed_names.add(previous[2])
+                self.nodes[meta["chunk_id"]] = (
+                    meta.get("file", ""),
+                    meta.get("class", ""),
+                    meta["method"],
+                    parse_qualified_calls(meta),
+                    int(meta.get("num_params", 0)),
+                )
+                self._dirty.add(meta["chunk_id"])
+                self._changed_names.add(meta["method"])
+
+    def remove_files(self, files):
+        files = set(files)
+        if not files:
+            return
+        for chunk_id in [cid for cid, node in self.nodes.items() if node[0] in files]:
+            self._changed_names.add(self.nodes[chunk_id][2])
+            self._dirty.discard(chunk_id)
+            self.edges.pop(chunk_id, None)
+            del self.nodes[chunk_id]
+
+    def _resolve(self):
+        """Aggiorna self.edges risolvendo solo le chiamate che possono essere cambiate."""
+        if self._resolve_all:
+            self.edges = resolve_calls(self.nodes)
+        else:
+            changed = self._changed_names
+            sites = self._dirty | {
+                cid
+                for cid, node in self.nodes.items()
+                if any(name in changed for _, name, _ in node[3])
+            }
+            self.edges.update(resolve_calls(self.nodes, sites))
+            print(f"Call graph: {len(sites)} metodi su {len(self.nodes)} risolti di nuovo.")
+        self._dirty, self._changed_names = set(), set()
+        self._resolve_all = False
+
+    def save(self, graph_dir: str):
+        """
+        Scrive la tabella dei nodi e il grafo risolto; restituisce il numero di archi.
+        I file sono scritti in una cartella temporanea che poi sostituisce quella
+        del grafo: chi legge non vede mai array e ID di due salvataggi diversi.
+        """
+        self._resolve()
+        ids = sorted(self.nodes)
+        index = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        edges = sorted(
+            (index[source], index[target])
+            for source, targets in self.edges.items()
+            if source in index
+            for target in targets
+            if target in index
+        )
+        sources = np.array([s for s, _ in edges], dtype=np.int64)
+        targets = np.array([t for _, t in edges], dtype=np.int64)
+        arrays = {
+            "callees": _to_csr(len(ids), sources, targets),
+            "callers": _to_csr(len(ids), targets, sources),
+        }
+
+        tmp_dir = graph_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for direction, (indptr, indices) in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{direction}_indptr.npy"), indptr)
+            np.save(os.path.join(tmp_dir, f"{direction}_indices.npy"), indices)
+        with open(os.path.join(tmp_dir, _IDS_FILE), "w", encoding="utf-8") as f:
+            f.write(json.dumps(ids))
+        with gzip.open(os.path.join(tmp_dir, _NODES_FILE), "wt", encoding="utf-8") as gz:
+            # Una sola scrittura: json.dump scriverebbe un frammento alla volta
+            gz.write(json.dumps(self.nodes, separators=(",", ":")))
+
+        old_dir = graph_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(graph_dir):
+            os.replace(graph_dir, old_dir)
+        os.replace(tmp_dir, graph_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return len(sources)
+
+    @classmethod
+    def load(cls, graph_dir: str):
+        builder = cls()
+        path = os.path.join(graph_dir, _NODES_FILE)
+        if not os.path.exists(path):
+            return builder
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for chunk_id, node in json.load(f).items():
+                if len(node) == 4:
+                    # Tabella di una versione precedente, senza arità
+                    node = node + [None]
+                file, class_name, method, calls, num_params = node
+                calls = [tuple(c) if len(c) == 3 else (*c, None) for c in calls]
+                builder.nodes[chunk_id] = (file, class_name, method, calls, num_params)
+        # Archi già risolti: si riparte dal grafo salvato, se è quello di questi nodi
+        graph = CallGraph.load(graph_dir)
+        if sorted(builder.nodes) == graph.ids:
+            builder.edges = {chunk_id: set(graph.neighbors(chunk_id)) for chunk_id in graph.ids}
+            builder._resolve_all = False
+        return builder
+
+
+class CallGraph:
+    """Grafo in sola lettura, con gli array CSR aperti in memory map."""
+
+    def __init__(self, ids=(), callees=None, callers=None):
+        self.ids = list(ids)
+        self.index = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self.adjacency = {"callees": callees, "callers": callers}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def neighbors(self, chunk_id: str, direction: str = "callees"):
+        i = self.index.get(chunk_id)
+        if i is None:
+            return []
+        indptr, indices = self.adjacency[direction]
+        return [self.ids[j] for j in indices[indptr[i] : indptr[i + 1]]]
+
+    def expand(self, seeds, hops: int, budget: int):
+        """
+        Visita in ampiezza chiamati e chiamanti dei chunk `seeds` (in ordine di
+        rilevanza) fino a `hops` passi. Restituisce al più `budget` nuovi ID,
+        prima quelli più vicini; per ogni chunk i chiamati precedono i
+        chiamanti (controller -> service -> repository).
+        """
+        visited = set(seeds)
+        frontier = [s for s in seeds if s in self.index]
+        found = []
+        for _ in range(hops):
+            next_frontier = []
+            for chunk_id in frontier:
+                for direction in ("callees", "callers"):
+                    for neighbor in self.neighbors(chunk_id, direction):
+                        if neighbor in visited:
+                            continue
+                        visited.add(neighbor)
+                        found.append(neighbor)
+                        next_frontier.append(neighbor)
+                        if len(found) >= budget:
+                            return found
+            frontier = next_frontier
+        return found
+
+    @classmethod
+    def load(cls, graph_dir: str):
+        ids_path = os.path.join(graph_dir, _IDS_FILE)
+        if not os.path.exists(ids_path):
+            return cls()
+        try:
+            with open(ids_path, "r", encoding="utf-8") as f:
+                ids = json.load(f)
+            arrays = {
+                direction: (
+                    np.load(os.path.join(graph_dir, f"{direction}_indptr.npy"), mmap_mode="r"),
+                    np.load(os.path.join(graph_dir, f"{direction}_indices.npy"), mmap_mode="r"),
+                )
+                for direction in ("callees", "callers")
+            }
+        except (OSError, ValueError) as e:
+            print(f"Call graph in {graph_dir} non leggibile, ignorato: {e}")
+            return cls()
+        # Array e ID di salvataggi diversi (es. cartella scritta a mano o troncata)
+        if any(len(indptr) != len(ids) + 1 for indptr, _ in arrays.values()):
+            print(f"Call graph in {graph_dir} non coerente con i suoi ID, ignorato.")
+            return cls()
+        return cls(ids, arrays["callees"], arrays["callers"])
@@ -0,0 +1,164 @@
+# src/context_packer.py
+"""
+Costruzione del contesto del prompt entro il budget di token del modello.
+
+I chunk recuperati (in ordine di rilevanza) vengono:
+
+1. deduplicati: stesso chunk da più vie di retrieval, o chunk contenuti in altri;
+2. uniti: chunk dello stesso file sovrapposti (CHUNK_OVERLAP) o contigui
+   diventano un solo blocco, senza ripetere il testo in comune;
+3. formattati in modo compatto, con un'intestazione file/classe/metodo;
+4. inseriti in ordine di rilevanza finché c'è spazio: l'ultimo blocco che non
+   entra per intero viene troncato a righe intere per riempire il budget.
+
+I token si contano con il tokenizer del modello, quindi il budget è esatto:
+n_ctx - max_tokens della risposta - token del prompt senza contesto.
+"""
+import os
+
+from config import CONTEXT_SAFETY_TOKENS, CONTEXT_MIN_BLOCK_TOKENS, REPOS_DIR
+
+
+class _Block:
+    """Porzione contigua di un file, formata da uno o più chunk."""
+
+    def __init__(self, doc, rank: int):
+        meta = doc.metadata
+        self.file = meta.get("file") or meta.get("source", "")
+        self.repo = meta.get("repo")
+        self.start = meta.get("start")
+        self.end = meta.get("end")
+        self.text = doc.page_content
+        self.rank = rank
+        label = _label(meta)
+        self.labels = [label] if label else []
+
+    def absorb(self, other: "_Block"):
+        """Unisce un blocco dello stesso file che inizia dentro o subito dopo questo."""
+        if other.end > self.end:
+            overlap = self.end - other.start
+            if overlap >= 0:
+                self.text += other.text[overlap:]
+            else:
+                self.text += "\n" + other.text
+            self.end = other.end
+        self.rank = min(self.rank, other.rank)
+        self.labels += [l for l in other.labels if l not in self.labels]
+
+
+def _label(meta: dict) -> str:
+    return meta.get("method_signature") or meta.get("class") or ""
+
+
+def _display_path(path: str) -> str:
+    if path.startswith(REPOS_DIR + os.sep):
+        return os.path.relpath(path, REPOS_DIR)
+    return path
+
+
+def merge_chunks(docs, max_gap: int = 1):
+    """
+    Deduplica e unisce i chunk. Restituisce i blocchi ordinati per rilevanza
+    (il rango di un blocco è il migliore tra quelli dei suoi chunk).
+    `max_gap` è la distanza massima in caratteri tra due chunk contigui.
+    """
+    blocks, seen_texts = [], set()
+    for rank, doc in enumerate(docs):
+        text = doc.page_content
+        if not text.strip() or text in seen_texts:
+            continue
+        seen_texts.add(text)
+        blocks.append(_Block(doc, rank))
+
+    by_file = {}
+    for block in blocks:
+        by_file.setdefault((block.repo, block.file), []).append(block)
+
+    merged = []
+    for file_blocks in by_file.values():
+        with_offsets = sorted(
+            (b for b in file_blocks if b.start is not None and b.end is not None),
+            key=lambda b: (b.start, -b.end),
+        )
+        current = None
+        for block in with_offsets:
+            if current is not None and block.start <= current.end + max_gap:
+                current.absorb(block)
+            else:
+                current = block
+                merged.append(current)
+        # Chunk di indici senza offset: si scartano solo quelli contenuti in altri
+        without_offsets = [b for b in file_blocks if b.start is None or b.end is None]
+        for block in without_offsets:
+            if not any(block is not o and block.text in o.text for o in file_blocks):
+                merged.append(block)
+
+    return sorted(merged, key=lambda b: b.rank)
+
+
+def format_block(block: _Block, text: str = None) -> str:
+    header = f"// {_display_path(block.file)}"
+    if block.repo:
+        header = f"// [{block.repo}] {_display_path(block.file)}"
+    if block.labels:
+        header += " — " + ", ".join(block.labels)
+    return f"{header}\n{block.text if text is None else text}\n"
+
+
+class ContextPacker:
+    """
+    Riempie il budget di token del contesto.
+
+    Args:
+        count_tokens: funzione testo -> numero di token (tokenizer del modello).
+        n_ctx: finestra di contesto del modello.
+        max_tokens: token riservati alla risposta.
+    """
+
+    def __init__(self, count_tokens, n_ctx: int, max_tokens: int):
+        self.count_tokens = count_tokens
+        self.n_ctx = n_ctx
+        self.max_tokens = max_tokens
+
+    def budget(self, prompt_without_context: str) -> int:
+        """Token disponibili per il contesto, dato il prompt con contesto vuoto."""
+        used = self.count_tokens(prompt_without_context) + CONTEXT_SAFETY_TOKENS
+        return max(0, self.n_ctx - self.max_tokens - used)
+
+    def _truncate(self, block: _Block, budget: int) -> str:
+        """Il blocco troncato a righe intere nel budget indicato, o None."""
+        lines = block.text.split("\n")
+        low, high, best = 1, len(lines) - 1, None
+        while low <= high:
+            mid = (low + high) // 2
+            text = "\n".join(lines[:mid]) + "\n// ..."
+            if self.count_tokens(format_block(block, text)) <= budget:
+                best, low = text, mid + 1
+            else:
+                high = mid - 1
+        return best
+
+    def pack(self, docs, budget: int):
+        """
+        Restituisce (contesto, blocchi inseriti, token usati) riempiendo al
+        massimo `budget` token in ordine di rilevanza.
+        """
+        parts, used = [], 0
+        for block in merge_chunks(docs):
+            remaining = budget - used
+            if remaining < CONTEXT_MIN_BLOCK_TOKENS:
+                break
+            text = format_block(block)
+            tokens = self.count_tokens(text)
+            if tokens > remaining:
+                truncated = self._truncate(block, remaining)
+                if truncated is None:
+                    break
+                text = format_block(block, truncated)
+                tokens = self.count_tokens(text)
+                parts.append(text)
+                used += tokens
+                break
+            parts.append(text)
+            used += tokens
+        return "\n".join(parts), len(parts), used
@@ -0,0 +1,101 @@
+# src/embedding_cache.py
+"""
+Cache persistente degli embedding, indirizzata per contenuto.
+
+La chiave è (nome del modello, SHA-256 del testo del chunk): un metodo identico
+su un altro branch o su un fork riusa il vettore già calcolato, senza chiamare
+il modello. La cache vive su disco (diskcache/SQLite) con un limite di
+dimensione oltre il quale vengono eliminate le voci usate meno di recente.
+"""
+import hashlib
+from array import array
+
+from diskcache import Cache
+from langchain_core.embeddings import Embeddings
+
+from config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_SIZE_LIMIT
+
+
+def text_digest(text: str) -> str:
+    """Hash del contenuto di un chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Avvolge un modello di embedding e consulta la cache prima di calcolare i
+    vettori dei documenti. Le query non passano dalla cache.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        model_name: str,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        size_limit: int = EMBEDDING_CACHE_SIZE_LIMIT,
+    ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = Cache(
+            cache_dir,
+            size_limit=size_limit,
+            eviction_policy="least-recently-used",
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str):
+        return (self.model_name, text_digest(text))
+
+    def embed_documents(self, texts):
+        keys = [self._key(t) for t in texts]
+        vectors = [None] * len(texts)
+
+        # Testi mancanti, deduplicati: due chunk identici costano un solo calcolo
+        missing = {}
+        with self.cache.transact():
+            for i, key in enumerate(keys):
+                cached = self.cache.get(key)
+                if cached is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    vectors[i] = array("f", cached).tolist()
+
+        # I duplicati nello stesso batch contano come hit: non vengono ricalcolati
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            computed = self.embeddings.embed_documents(
+                [texts[missing[k][0]] for k in miss_keys]
+            )
+            with self.cache.transact():
+                for key, vector in zip(miss_keys, computed):
+                    packed = array("f", vector)
+                    self.cache.set(key, packed.tobytes())
+                    # Stessa precisione (float32) dei vettori letti dalla cache
+                    for i in missing[key]:
+                        vectors[i] = packed.tolist()
+        return vectors
+
+    def embed_query(self, text: str):
+        return self.embeddings.embed_query(text)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+        }
+
+    def print_stats(self):
+        s = self.stats()
+        print(
+            f"📦 Cache embedding: {s['hits']} hit, {s['misses']} miss "
+            f"({s['hit_rate']:.1%} hit rate), {s['entries']} voci, "
+            f"{s['size_bytes'] / (1024 * 1024):.1f} MB su disco."
+        )
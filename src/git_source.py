@@ -0,0 +1,241 @@
+# src/git_source.py
+"""
+Enumerazione e lettura dei sorgenti direttamente dal repository git.
+
+Invece di percorrere il filesystem con DirectoryLoader, i file vengono presi
+dall'indice git (`git ls-files`), quindi solo quelli tracciati: i file ignorati
+da .gitignore e gli artefatti non versionati sono esclusi in partenza.
+Estensione e dimensione vengono filtrate prima di leggere qualsiasi contenuto,
+e i blob sono letti in blocco dall'object database con un unico processo
+`git cat-file --batch`. Il contenuto è quello registrato nell'indice, che per
+un clone gestito dall'ingestione coincide con la working tree.
+
+Per le cartelle che non sono repository git c'è un fallback su os.walk con
+gli stessi filtri.
+"""
+import os
+import subprocess
+import threading
+from collections import namedtuple
+
+from config import SOURCE_MAX_FILE_SIZE
+from src.parse_cache import git_blob_sha
+
+SourceFile = namedtuple("SourceFile", ["path", "rel_path", "blob_sha", "text"])
+
+# Cartelle saltate nel fallback senza git (con git decide .gitignore)
+EXCLUDED_DIRS = {
+    ".git",
+    "node_modules",
+    "venv",
+    "target",
+    "build",
+    "dist",
+    "out",
+    "gen",
+    "tmp",
+    "logs",
+    "test-results",
+}
+
+# Estensioni binarie o non utili escluse prima di leggere il contenuto
+BINARY_EXTENSIONS = {
+    ".bin", ".log", ".sqlite3", ".db", ".pyc", ".lock", ".jar", ".class",
+    ".zip", ".tar", ".gz", ".rar", ".7z", ".jpg", ".jpeg", ".png", ".gif",
+    ".bmp", ".ico", ".svg", ".pdf", ".doc", ".docx", ".xls", ".xlsx", ".ppt",
+    ".pptx", ".mp3", ".wav", ".mp4", ".avi", ".mov", ".dll", ".exe", ".so",
+    ".dylib", ".o", ".a", ".p12", ".pem", ".crt", ".key", ".jks",
+}  # fmt: skip
+
+# Modalità git di symlink e submodule: non sono file da leggere
+_SKIPPED_MODES = {"120000", "160000"}
+
+# Byte esaminati per riconoscere un file binario
+_SNIFF_BYTES = 8000
+
+
+def is_git_repository(path: str) -> bool:
+    return os.path.exists(os.path.join(path, ".git"))
+
+
+def is_binary(data: bytes) -> bool:
+    """Euristica di git: un byte nullo all'inizio indica un file binario."""
+    return b"\0" in data[:_SNIFF_BYTES]
+
+
+def decode_source(data: bytes) -> str:
+    """Decodifica come UTF-8, con fallback latin-1 per i file legacy."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("latin-1")
+
+
+def _wanted(rel_path: str, extensions, skip) -> bool:
+    if rel_path in skip:
+        return False
+    ext = os.path.splitext(rel_path)[1].lower()
+    if extensions is not None:
+        return ext in extensions
+    return ext not in BINARY_EXTENSIONS and not os.path.basename(rel_path).startswith(".")
+
+
+def list_tracked_files(repo_path: str, extensions=None, paths=None, skip=frozenset()):
+    """
+    Restituisce [(percorso relativo, SHA del blob)] dei file tracciati
+    nell'indice git, filtrati per estensione (o esclusi i binari noti).
+    `paths` limita l'elenco ai percorsi indicati.
+    """
+    cmd = ["git", "-C", repo_path, "ls-files", "-s", "-z"]
+    if paths is not None:
+        if not paths:
+            return []
+        cmd += ["--", *paths]
+    out = subprocess.run(cmd, check=True, capture_output=True).stdout
+
+    entries = []
+    for record in out.split(b"\0"):
+        if not record:
+            continue
+        # Formato: "<mode> <sha> <stage>\t<path>"
+        info, _, raw_path = record.partition(b"\t")
+        mode, sha, stage = info.decode().split()
+        rel_path = raw_path.decode("utf-8", "surrogateescape")
+        # Durante un merge lo stesso file compare per più stage: tengo lo 0 o il 2
+        if mode in _SKIPPED_MODES or stage not in ("0", "2"):
+            continue
+        if _wanted(rel_path, extensions, skip):
+            entries.append((rel_path, sha))
+    return entries
+
+
+def blob_sizes(repo_path: str, shas):
+    """Dimensioni dei blob con un'unica chiamata a `git cat-file --batch-check`."""
+    if not shas:
+        return {}
+    out = subprocess.run(
+        ["git", "-C", repo_path, "cat-file", "--batch-check=%(objectname) %(objectsize)"],
+        input="".join(f"{sha}\n" for sha in shas).encode(),
+        check=True,
+        capture_output=True,
+    ).stdout
+    sizes = {}
+    for line in out.decode().splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            sizes[parts[0]] = int(parts[1])
+    return sizes
+
+
+def read_blobs(repo_path: str, shas):
+    """
+    Genera (sha, contenuto) leggendo i blob con un solo processo
+    `git cat-file --batch`. Gli SHA vengono scritti da un thread separato per
+    non bloccarsi quando l'output supera i buffer della pipe.
+    """
+    shas = list(shas)
+    if not shas:
+        return
+    proc = subprocess.Popen(
+        ["git", "-C", repo_path, "cat-file", "--batch"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+    def feed():
+        try:
+            for sha in shas:
+                proc.stdin.write(f"{sha}\n".encode())
+            proc.stdin.close()
+        except (BrokenPipeError, ValueError):
+            pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    try:
+        for sha in shas:
+            header = proc.stdout.readline().split()
+            if len(header) != 3:  # "<sha> missing"
+                yield sha, None
+                continue
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # newline finale
+            yield sha, data
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        writer.join()
+
+
+def _iter_git_sources(repo_path, extensions, max_size, paths, skip):
+    entries = list_tracked_files(repo_path, extensions, paths, skip)
+    sizes = blob_sizes(repo_path, sorted({sha for _, sha in entries}))
+    entries = [(p, sha) for p, sha in entries if sizes.get(sha, 0) <= max_size]
+
+    by_sha = {}
+    for rel_path, sha in entries:
+        by_sha.setdefault(sha, []).append(rel_path)
+    # Un blob condiviso da più percorsi viene letto una volta sola
+    for sha, data in read_blobs(repo_path, by_sha):
+        if data is None or is_binary(data):
+            continue
+        text = decode_source(data)
+        for rel_path in by_sha[sha]:
+            yield SourceFile(
+                os.path.normpath(os.path.join(repo_path, rel_path)), rel_path, sha, text
+            )
+
+
+def _iter_filesystem_sources(repo_path, extensions, max_size, paths, skip):
+    if paths is not None:
+        candidates = iter(paths)
+    else:
+
+        def walk():
+            for root, dirs, files in os.walk(repo_path):
+                dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+                for name in sorted(files):
+                    yield os.path.relpath(os.path.join(root, name), repo_path)
+
+        candidates = walk()
+
+    for rel_path in candidates:
+        if not _wanted(rel_path, extensions, skip):
+            continue
+        path = os.path.normpath(os.path.join(repo_path, rel_path))
+        try:
+            if os.path.getsize(path) > max_size:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            print(f"Impossibile leggere {path}: {e}")
+            continue
+        if is_binary(data):
+            continue
+        yield SourceFile(path, rel_path, git_blob_sha(data), decode_source(data))
+
+
+def iter_source_files(
+    repo_path: str,
+    extensions=None,
+    max_size: int = SOURCE_MAX_FILE_SIZE,
+    paths=None,
+    skip=frozenset(),
+):
+    """
+    Genera i SourceFile del repository: dall'indice git se disponibile,
+    altrimenti dal filesystem.
+
+    Args:
+        extensions: estensioni ammesse (es. {".java"}); None = tutti i file
+                    di testo tranne le estensioni binarie note.
+        max_size: dimensione massima in byte dei file letti.
+        paths: se indicato, limita la lettura a questi percorsi relativi.
+        skip: percorsi relativi da saltare (es. già indicizzati).
+    """
+    if is_git_repository(repo_path):
+        return _iter_git_sources(repo_path, extensions, max_size, paths, skip)
+    return _iter_filesystem_sources(repo_path, extensions, max_size, paths, skip)
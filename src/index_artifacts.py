@@ -0,0 +1,110 @@
+# src/index_artifacts.py
+"""
+Indici ausiliari di una collezione, salvati accanto al database Chroma.
+
+L'ingestione (completa, incrementale o in streaming) aggiorna questi indici
+con gli stessi chunk e gli stessi file rimossi che scrive nel database
+vettoriale, così restano sempre allineati alla collezione.
+"""
+import os
+
+from langchain_core.documents import Document
+
+from config import CHROMA_DB_DIR
+from src.symbol_index import SymbolIndex
+from src.lexical_index import LexicalIndex
+from src.call_graph import CallGraph, CallGraphBuilder
+
+# Pagine lette da Chroma quando gli indici vanno ricostruiti dalla collezione
+_REBUILD_PAGE_SIZE = 5000
+
+
+def symbol_index_path(collection_name: str, db_path: str = CHROMA_DB_DIR) -> str:
+    return os.path.join(db_path, f"{collection_name}.symbols.json.gz")
+
+
+def lexical_index_path(collection_name: str, db_path: str = CHROMA_DB_DIR) -> str:
+    return os.path.join(db_path, f"{collection_name}.bm25.json.gz")
+
+
+def call_graph_dir(collection_name: str, db_path: str = CHROMA_DB_DIR) -> str:
+    return os.path.join(db_path, f"{collection_name}.callgraph")
+
+
+def load_symbol_index(collection_name: str, db_path: str = CHROMA_DB_DIR):
+    return SymbolIndex.load(symbol_index_path(collection_name, db_path))
+
+
+def load_lexical_index(collection_name: str, db_path: str = CHROMA_DB_DIR):
+    return LexicalIndex.load(lexical_index_path(collection_name, db_path))
+
+
+def load_call_graph(collection_name: str, db_path: str = CHROMA_DB_DIR):
+    return CallGraph.load(call_graph_dir(collection_name, db_path))
+
+
+class IndexArtifacts:
+    """
+    Insieme degli indici ausiliari di una collezione.
+    Con `reset=True` si parte da indici vuoti (ingestione completa).
+    """
+
+    def __init__(
+        self, collection_name: str, db_path: str = CHROMA_DB_DIR, reset: bool = False
+    ):
+        self.collection_name = collection_name
+        self.db_path = db_path
+        self.symbols = (
+            SymbolIndex() if reset else load_symbol_index(collection_name, db_path)
+        )
+        self.lexical = (
+            LexicalIndex() if reset else load_lexical_index(collection_name, db_path)
+        )
+        self.call_graph = (
+            CallGraphBuilder()
+            if reset
+            else CallGraphBuilder.load(call_graph_dir(collection_name, db_path))
+        )
+
+    def remove_files(self, files):
+        self.symbols.remove_files(files)
+        self.lexical.remove_files(files)
+        self.call_graph.remove_files(files)
+
+    def add_chunks(self, chunks):
+        chunks = list(chunks)
+        self.symbols.add_chunks(chunks)
+        self.lexical.add_chunks(chunks)
+        self.call_graph.add_chunks(chunks)
+
+    def rebuild(self, vector_db):
+        """Ricostruisce gli indici leggendo a pagine tutti i chunk della collezione."""
+        self.symbols = SymbolIndex()
+        self.lexical = LexicalIndex()
+        self.call_graph = CallGraphBuilder()
+        offset = 0
+        while True:
+            page = vector_db.get(
+                include=["metadatas", "documents"],
+                limit=_REBUILD_PAGE_SIZE,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            self.add_chunks(
+                Document(page_content=text or "", metadata={**meta, "chunk_id": cid})
+                for cid, text, meta in zip(
+                    page["ids"], page["documents"], page["metadatas"]
+                )
+            )
+            offset += len(page["ids"])
+
+    def save(self):
+        self.symbols.save(symbol_index_path(self.collection_name, self.db_path))
+        self.lexical.save(lexical_index_path(self.collection_name, self.db_path))
+        num_edges = self.call_graph.save(call_graph_dir(self.collection_name, self.db_path))
+        print(
+            f"🔎 Indici ausiliari: {len(self.symbols)} chunk con classe/metodo, "
+            f"{len(self.lexical)} chunk nell'indice BM25, "
+            f"call graph con {len(self.call_graph)} metodi e {num_edges} chiamate risolte."
+        )
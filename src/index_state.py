@@ -0,0 +1,51 @@
+# src/index_state.py
+"""
+Stato dell'indice per collezione: ultimo commit indicizzato e versione.
+
+La versione viene incrementata a ogni ingestione completata, così chi
+interroga l'indice (es. la cache delle risposte) sa quando i chunk sono
+cambiati anche se i loro ID restano gli stessi.
+"""
+import os
+import json
+
+from config import INDEX_STATE_PATH
+
+
+def load_index_state(state_path: str = INDEX_STATE_PATH) -> dict:
+    """Legge lo stato dell'indice (ultimo commit indicizzato per collezione)."""
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Stato dell'indice illeggibile ({e}), verrà ricreato.")
+        return {}
+
+
+def save_index_state(
+    collection_name: str, commit: str, state_path: str = INDEX_STATE_PATH
+):
+    """
+    Registra l'ultimo commit indicizzato per la collezione indicata e ne
+    incrementa la versione.
+    """
+    state = load_index_state(state_path)
+    previous = state.get(collection_name, {})
+    state[collection_name] = {
+        "commit": commit,
+        "index_version": previous.get("index_version", 0) + 1,
+    }
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def index_versions(collection_names, state_path: str = INDEX_STATE_PATH) -> dict:
+    """Versione corrente dell'indice di ogni collezione (0 se mai registrata)."""
+    state = load_index_state(state_path)
+    return {
+        name: state.get(name, {}).get("index_version", 0) for name in collection_names
+    }
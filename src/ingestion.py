@@ -13,142 +13,69 @@ import logging
 warnings.filterwarnings("ignore", message=".*libmagic.*")
 logging.getLogger("langchain").setLevel(logging.ERROR)
 
-import shutil
-import json
-import javalang
-import shutil
-from git import Repo, GitCommandError
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_text_splitters import (
-    Language,
-    RecursiveCharacterTextSplitter,
-)
+import hashlib
+import argparse
+from git import Repo, GitCommandError, BadName
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 from config import (
     REPOS_DIR,
+    REPOS_MANIFEST_PATH,
     CHROMA_DB_DIR,
+    CHROMA_COLLECTION_NAME,
     GITHUB_REPO_URL,
     REPO_NAME,
     EMBEDDING_MODEL_NAME,
+    EMBEDDING_CACHE_ENABLED,
     CHUNK_SIZE,
     CHUNK_OVERLAP,
+    PARSE_WORKERS,
+    PARSE_CACHE_ENABLED,
+    HIERARCHICAL_INDEX_ENABLED,
+)
+from src.java_parser import (
+    parse_java_sources,
+    record_text,
+    source_text,
+    class_summary_text,
+    file_summary_text,
+)
+from src.embedding_cache import CachedEmbeddings
+from src.parse_cache import ParseCache
+from src.git_source import iter_source_files
+from src.index_artifacts import IndexArtifacts
+from src.index_state import load_index_state, save_index_state
+from src.summary_index import SummaryCollections, split_summary_chunks
+from src.vector_store import (
+    vector_store_class,
+    open_vector_store,
+    count_chunks,
+    delete_stale_chunks,
+    persist_vector_store,
+)
+from src.repositories import (
+    clone_repository,
+    load_manifest,
+    collection_for_repo,
+    repo_local_path,
+    sync_repositories,
 )
-
-
-def clone_repository(repo_url: str, local_path: str):
-    """
-    Clona un repository Git o aggiorna se esiste già.
-    """
-    print(f"Tentativo di clonare/aggiornare il repository: {repo_url}")
-    if os.path.exists(local_path):
-        print(f"Repository {local_path} esiste già. Aggiornamento in corso...")
-        try:
-            repo = Repo(local_path)
-            origin = repo.remotes.origin
-            origin.pull()
-            print("Repository aggiornato con successo.")
-        except GitCommandError as e:
-            print(f"Errore durante l'aggiornamento del repository: {e}")
-            # Potrebbe essere un repository corrotto, tentiamo di riclonare
-            print(f"Elimino e riclono {local_path}...")
-            shutil.rmtree(local_path)
-            Repo.clone_from(repo_url, local_path)
-            print("Repository riclonato con successo.")
-        except Exception as e:
-            print(f"Errore inatteso durante l'aggiornamento: {e}")
-            print(f"Elimino e riclono {local_path}...")
-            shutil.rmtree(local_path)
-            Repo.clone_from(repo_url, local_path)
-            print("Repository riclonato con successo.")
-    else:
-        print(f"Clonazione del repository in {local_path}...")
-        try:
-            Repo.clone_from(repo_url, local_path)
-            print("Repository clonato con successo.")
-        except GitCommandError as e:
-            print(f"Errore durante la clonazione del repository: {e}")
-            raise
 
 
 def load_and_split_code(repo_path: str):
     """
     Carica i file di codice e li divide in chunk.
-    Ignora i file binari e le cartelle .git.
+    Ignora i file binari, quelli non tracciati e le cartelle .git.
     """
     print(f"Caricamento e suddivisione dei file di codice da {repo_path}...")
-    # Loader per tutti i tipi di testo comuni, escludendo alcuni binari e .git
-    loader = DirectoryLoader(
-        repo_path,
-        glob="**/*",  # Carica tutti i file
-        # loader_cls=TextLoader,
-        loader_kwargs={"encoding": "utf-8", "autodetect_encoding": True},
-        exclude=[
-            "**/.*",
-            "**/*.bin",
-            "**/*.log",
-            "**/*.sqlite3",
-            "**/*.db",
-            "**/*.DS_Store",
-            "**/*.pyc",
-            "**/*.lock",
-            "**/node_modules/**",
-            "**/venv/**",
-            "**/*.jar",
-            "**/*.class",
-            "**/*.zip",
-            "**/*.tar",
-            "**/*.gz",
-            "**/*.rar",
-            "**/*.7z",
-            "**/*.jpg",
-            "**/*.jpeg",
-            "**/*.png",
-            "**/*.gif",
-            "**/*.bmp",
-            "**/*.ico",
-            "**/*.svg",
-            "**/*.pdf",
-            "**/*.doc",
-            "**/*.docx",
-            "**/*.xls",
-            "**/*.xlsx",
-            "**/*.ppt",
-            "**/*.pptx",
-            "**/*.mp3",
-            "**/*.wav",
-            "**/*.mp4",
-            "**/*.avi",
-            "**/*.mov",
-            "**/*.dll",
-            "**/*.exe",
-            "**/*.so",
-            "**/*.dylib",
-            "**/*.o",
-            "**/*.a",
-            "**/*.p12",
-            "**/*.pem",
-            "**/*.crt",
-            "**/*.key",
-            "**/*.jks",
-            "**/node_modules/**",
-            "**/venv/**",
-            "**/target/**",
-            "**/build/**",
-            "**/dist/**",
-            "**/test-results/**",
-            "**/tmp/**",
-            "**/logs/**",
-            "**/out/**",
-            "**/gen/**",
-            "**/target/**",
-            "**/build/**",
-            "**/.git/**",
-        ],
-        show_progress=True,
-    )
-    documents = loader.load()
+    # File tracciati da git (rispetta .gitignore), esclusi binari e file troppo grandi
+    documents = [
+        Document(
+            page_content=f.text, metadata={"source": f.path, "blob_sha": f.blob_sha}
+        )
+        for f in iter_source_files(repo_path)
+    ]
 
     print(f"Trovati {len(documents)} documenti.")
 
@@ -171,47 +98,169 @@ def load_and_split_code(repo_path: str):
     return chunks
 
 
-def extract_method_text(java_code: str, method_node, class_name: str):
-    """Estrae il testo di un singolo metodo dal codice Java."""
-    lines = java_code.split("\n")
+def make_chunk_id(relative_path: str, *parts) -> str:
+    """
+    Calcola un ID stabile per un chunk a partire dal percorso relativo del file
+    e dalle parti che lo identificano (classe, metodo, parametri, indice...).
+    Lo stesso metodo produce sempre lo stesso ID, così gli upsert sostituiscono
+    i chunk esistenti invece di duplicarli.
+    """
+    key = "\x1f".join([relative_path.replace(os.sep, "/")] + [str(p) for p in parts])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
-    # Trova la linea di inizio del metodo
-    start_line = method_node.position.line - 1  # javalang usa 1-based indexing
 
-    # Trova la fine del metodo cercando le parentesi graffe bilanciate
-    brace_count = 0
-    end_line = start_line
-    found_opening_brace = False
+def _load_java_documents(repo_path: str, relative_paths=None):
+    """
+    Carica i file Java del repository come Document, leggendoli dall'indice git.
+    Se `relative_paths` è indicato carica solo quei file (modalità incrementale).
+    """
+    return [
+        Document(
+            page_content=f.text, metadata={"source": f.path, "blob_sha": f.blob_sha}
+        )
+        for f in iter_source_files(
+            repo_path, extensions={".java"}, paths=relative_paths
+        )
+    ]
 
-    for i in range(start_line, len(lines)):
-        line = lines[i]
-        for char in line:
-            if char == "{":
-                brace_count += 1
-                found_opening_brace = True
-            elif char == "}":
-                brace_count -= 1
-                if found_opening_brace and brace_count == 0:
-                    end_line = i
-                    break
-        if found_opening_brace and brace_count == 0:
-            break
 
-    # Estrae le linee del metodo
-    method_lines = lines[start_line : end_line + 1]
-    return "\n".join(method_lines)
+def _make_fallback_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    )
 
 
-def load_and_analyze_code(repo_path: str):
-    print(f"Caricamento e analisi del codice da {repo_path}...")
-    loader = DirectoryLoader(
-        repo_path,
-        glob="**/*.java",
-        loader_kwargs={"encoding": "utf-8", "autodetect_encoding": True},
-        exclude=["**/target/**", "**/build/**", "**/.git/**"],
-        show_progress=True,
+def build_file_chunks(
+    file_path: str, rel_path: str, java_code: str, methods_info, splitter
+):
+    """
+    Costruisce i chunk con metadati di un singolo file a partire dai record
+    dei metodi; se il file non è analizzabile usa chunk di testo normali.
+    """
+    chunks = []
+    if not methods_info:
+        # fallback: normale chunk
+        search_from = 0
+        for i, chunk in enumerate(splitter.split_text(java_code)):
+            # Offset del chunk nel file, per unire i chunk sovrapposti nel contesto
+            start = java_code.find(chunk, search_from)
+            if start < 0:
+                start = java_code.find(chunk)
+            search_from = max(start, 0) + 1
+            if len(chunk.strip()) > 30:  # ✅ Evita chunk inutili
+                metadata = {
+                    "file": file_path,
+                    "file_name": os.path.basename(file_path),
+                    "chunk_id": make_chunk_id(rel_path, "chunk", i),
+                }
+                if start >= 0:
+                    metadata.update(start=start, end=start + len(chunk))
+                chunks.append(Document(page_content=chunk, metadata=metadata))
+        return chunks
+
+    text_source = source_text(java_code)
+    # Conta le occorrenze della stessa firma (es. classi annidate omonime)
+    seen_signatures = {}
+    for m in methods_info:
+        text = record_text(text_source, m)
+        if len(text.strip()) > 30:
+            signature = f"{m.class_name}.{m.method}({', '.join(m.params)})"
+            occurrence = seen_signatures.get(signature, 0)
+            seen_signatures[signature] = occurrence + 1
+            chunks.append(
+                Document(
+                    page_content=text,
+                    metadata={
+                        "file": file_path,
+                        "file_name": os.path.basename(file_path),
+                        "class": m.class_name,
+                        "method": m.method,
+                        "calls": ", ".join(m.calls),
+                        "qualified_calls": ", ".join(
+                            f"{q}.{c}" if q else c
+                            for q, c in zip(m.call_qualifiers, m.calls)
+                        ),
+                        # Numero di argomenti di ogni chiamata, per distinguere gli overload
+                        "call_arities": ", ".join(str(a) for a in m.call_arities),
+                        "params": ", ".join(m.params),
+                        "param_names": ", ".join(m.param_names),
+                        "return_type": m.return_type,
+                        "modifiers": ", ".join(m.modifiers),
+                        # Campi scalari per i filtri where di Chroma (niente ricerca per sottostringa)
+                        "visibility": next(
+                            (v for v in ("public", "protected", "private") if v in m.modifiers),
+                            "package",
+                        ),
+                        "is_static": "static" in m.modifiers,
+                        "variables": ", ".join(m.variables),
+                        "num_params": len(m.params),
+                        "num_calls": len(m.calls),
+                        "method_signature": signature,
+                        "content_type": (
+                            "java_constructor" if m.kind == "constructor" else "java_method"
+                        ),
+                        "start": m.start,
+                        "end": m.end,
+                        "chunk_id": make_chunk_id(rel_path, signature, occurrence),
+                    },
+                )
+            )
+    return chunks
+
+
+def build_summary_chunks(file_path: str, rel_path: str, records):
+    """
+    Riassunti di un file per i livelli superiori dell'indice: uno per ogni
+    classe dichiarata e uno per il file (vedi src/summary_index.py).
+    I riassunti non hanno start/end: non sono porzioni del sorgente.
+    """
+    if not records.classes:
+        return []
+    file_name = os.path.basename(file_path)
+    chunks = []
+    seen_classes = {}
+    for c in records.classes:
+        # Classi annidate omonime in punti diversi dello stesso file
+        occurrence = seen_classes.get(c.class_name, 0)
+        seen_classes[c.class_name] = occurrence + 1
+        chunks.append(
+            Document(
+                page_content=class_summary_text(records.package, c),
+                metadata={
+                    "file": file_path,
+                    "file_name": file_name,
+                    "package": records.package,
+                    "class": c.class_name,
+                    "kind": c.kind,
+                    "extends": ", ".join(c.extends),
+                    "implements": ", ".join(c.implements),
+                    "annotations": ", ".join(c.annotations),
+                    "num_fields": len(c.fields),
+                    "num_methods": len(c.methods),
+                    "content_type": "java_class",
+                    "chunk_id": make_chunk_id(rel_path, "class", c.class_name, occurrence),
+                },
+            )
+        )
+    chunks.append(
+        Document(
+            page_content=file_summary_text(rel_path.replace(os.sep, "/"), records),
+            metadata={
+                "file": file_path,
+                "file_name": file_name,
+                "package": records.package,
+                "classes": ", ".join(c.class_name for c in records.classes),
+                "content_type": "java_file",
+                "chunk_id": make_chunk_id(rel_path, "file"),
+            },
+        )
     )
-    raw_docs = loader.load()
+    return chunks
+
+
+def load_and_analyze_code(repo_path: str, relative_paths=None):
+    print(f"Caricamento e analisi del codice da {repo_path}...")
+    raw_docs = _load_java_documents(repo_path, relative_paths)
     # da controllare se funziona
     documents = [
         (
@@ -225,62 +274,57 @@ def load_and_analyze_code(repo_path: str):
     ]
     print(f"Trovati {len(documents)} file Java.")
 
-    enriched_chunks = []
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+    file_paths = [os.path.normpath(doc.metadata["source"]) for doc in documents]
+
+    # Estraggo AST e metadati in parallelo; l'ordine dei risultati è quello dei file.
+    # I file già visti (stesso contenuto) vengono presi dalla cache del parsing.
+    parse_cache = ParseCache() if PARSE_CACHE_ENABLED else None
+    parse = parse_cache.parse if parse_cache else parse_java_sources
+    all_records = parse(
+        [
+            (path, doc.page_content, doc.metadata.get("blob_sha"))
+            for path, doc in zip(file_paths, documents)
+        ],
+        workers=PARSE_WORKERS,
     )
+    if parse_cache:
+        parse_cache.print_stats()
+
+    enriched_chunks, summaries = [], []
+    splitter = _make_fallback_splitter()
+    for file_path, doc, records in zip(file_paths, documents, all_records):
+        rel_path = os.path.relpath(file_path, repo_path)
+        enriched_chunks.extend(
+            build_file_chunks(
+                file_path, rel_path, doc.page_content, records.methods, splitter
+            )
+        )
+        if HIERARCHICAL_INDEX_ENABLED:
+            summaries.extend(build_summary_chunks(file_path, rel_path, records))
+    print(f"Generati {len(enriched_chunks)} chunk con metadati e {len(summaries)} riassunti.")
+    # I riassunti vanno nelle loro collezioni al momento della scrittura
+    return enriched_chunks + summaries
 
-    for doc in documents:
-        file_path = doc.metadata["source"]
-        java_code = doc.page_content
-
-        # Estraggo AST e metadati
-        methods_info = extract_java_structure(java_code, file_path)
-        if not methods_info:
-            # fallback: normale chunk
-            for chunk in splitter.split_text(java_code):
-                if len(chunk.strip()) > 30:  # ✅ Evita chunk inutili
-                    enriched_chunks.append(
-                        Document(page_content=chunk, metadata={"file": file_path})
-                    )
-        else:
-            for m in methods_info:
-                if len(m["text"].strip()) > 30:
-                    enriched_chunks.append(
-                        Document(
-                            page_content=m["text"],
-                            metadata={
-                                "file": m["file"],
-                                "class": m["class"],
-                                "method": m["method"],
-                                "calls": ", ".join(m["calls"]) if m["calls"] else "",
-                                "params": ", ".join(m["params"]) if m["params"] else "",
-                                "param_names": (
-                                    ", ".join(m["param_names"])
-                                    if m["param_names"]
-                                    else ""
-                                ),
-                                "return_type": m["return_type"],
-                                "modifiers": (
-                                    ", ".join(m["modifiers"]) if m["modifiers"] else ""
-                                ),
-                                "variables": (
-                                    ", ".join(m["variables"]) if m["variables"] else ""
-                                ),
-                                "num_params": len(m["params"]) if m["params"] else 0,
-                                "num_calls": len(m["calls"]) if m["calls"] else 0,
-                                "method_signature": f"{m['class']}.{m['method']}({', '.join(m['params']) if m['params'] else ''})",
-                                "content_type": "java_method",
-                            },
-                        )
-                    )
-    print(f"Generati {len(enriched_chunks)} chunk con metadati.")
-    return enriched_chunks
+
+def load_ingestion_embeddings(embedding_model_name: str):
+    """
+    Crea il modello di embedding per l'ingestione, avvolto nella cache su disco
+    se abilitata in config.
+    """
+    embeddings = HuggingFaceEmbeddings(model_name=embedding_model_name)
+    if EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(embeddings, embedding_model_name)
+    return embeddings
 
 
-def create_vector_db(chunks, db_path: str, embedding_model_name: str):
+def create_vector_db(
+    chunks,
+    db_path: str,
+    embedding_model_name: str,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+):
     """
-    Crea o aggiorna il database vettoriale ChromaDB con i chunk di codice.
+    Crea o aggiorna il database vettoriale (backend VECTOR_BACKEND) con i chunk di codice.
     """
     print(f"Creazione/aggiornamento del database vettoriale in {db_path}...")
     # Debug: verifica che tutti gli elementi siano Document
@@ -302,87 +346,301 @@ def create_vector_db(chunks, db_path: str, embedding_model_name: str):
             else:
                 converted_chunks.append(chunk)
         chunks = converted_chunks
-    # Inizializza il modello di embedding
-    embeddings = HuggingFaceEmbeddings(model_name=embedding_model_name)
+    chunks, summaries = split_summary_chunks(chunks)
+    # Inizializza il modello di embedding (con cache su disco)
+    embeddings = load_ingestion_embeddings(embedding_model_name)
 
-    # Crea o carica il database ChromaDB
+    # Crea o carica il database vettoriale
     # 'persist_directory' specifica dove salvare il database su disco
-    vector_db = Chroma.from_documents(chunks, embeddings, persist_directory=db_path)
-    vector_db.persist()  # Salva il database su disco
+    # Gli ID stabili fanno sì che una nuova ingestione sovrascriva i chunk esistenti
+    ids = [c.metadata.get("chunk_id") for c in chunks]
+    vector_db = vector_store_class().from_documents(
+        chunks,
+        embeddings,
+        ids=ids if all(ids) else None,
+        persist_directory=db_path,
+        collection_name=collection_name,
+    )
+    if all(ids):
+        # I chunk dei file cancellati dall'ultima ingestione non sono stati
+        # sovrascritti: senza eliminarli resterebbero nel retrieval, mentre
+        # gli indici ausiliari qui sotto ripartono solo dai nuovi chunk
+        removed = delete_stale_chunks(vector_db, ids)
+        if removed:
+            print(f"Eliminati {removed} chunk non più presenti nel repository.")
+    persist_vector_store(vector_db)  # Salva il database su disco
     print("Database vettoriale creato/aggiornato con successo.")
+
+    # Indici ausiliari (simboli) ricostruiti dagli stessi chunk
+    artifacts = IndexArtifacts(collection_name, db_path, reset=True)
+    artifacts.add_chunks(chunks)
+    artifacts.save()
+    if summaries or HIERARCHICAL_INDEX_ENABLED:
+        summary_collections = SummaryCollections(collection_name, embeddings, db_path)
+        summary_collections.keep_only(summaries)
+        if summaries:
+            summary_collections.add_chunks(summaries)
+        summary_collections.save()
     return vector_db
 
 
-def extract_java_structure(java_code: str, file_path: str):
-    """Estrae classi, metodi e call graph da un file Java."""
-    try:
-        tree = javalang.parse.parse(java_code)
-    except Exception:
-        return []
+def update_vector_db(
+    chunks,
+    removed_files,
+    db_path: str,
+    embedding_model_name: str,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+):
+    """
+    Aggiorna il database vettoriale in modo incrementale: elimina tutti i chunk
+    dei file in `removed_files` (modificati, rinominati o cancellati) e inserisce
+    i nuovi chunk con i loro ID stabili.
+    """
+    print(f"Aggiornamento incrementale del database vettoriale in {db_path}...")
+    chunks, summaries = split_summary_chunks(chunks)
+    embeddings = load_ingestion_embeddings(embedding_model_name)
+    vector_db = open_vector_store(collection_name, embeddings, db_path)
+
+    artifacts = IndexArtifacts(collection_name, db_path)
+    removed_files = sorted(set(removed_files))
+    artifacts.remove_files(removed_files)
+    if removed_files:
+        stale_ids = vector_db.get(where={"file": {"$in": removed_files}}, include=[])[
+            "ids"
+        ]
+        if stale_ids:
+            vector_db.delete(ids=stale_ids)
+        print(f"Eliminati {len(stale_ids)} chunk di {len(removed_files)} file.")
+
+    if chunks:
+        vector_db.add_documents(chunks, ids=[c.metadata["chunk_id"] for c in chunks])
+        print(f"Inseriti/aggiornati {len(chunks)} chunk.")
+    persist_vector_store(vector_db)
+    artifacts.add_chunks(chunks)
+    artifacts.save()
+    if HIERARCHICAL_INDEX_ENABLED:
+        summary_collections = SummaryCollections(collection_name, embeddings, db_path)
+        summary_collections.remove_files(removed_files)
+        if summaries:
+            summary_collections.add_chunks(summaries)
+        summary_collections.save()
+    return vector_db
 
-    data = []
-
-    for _, class_decl in tree.filter(javalang.tree.ClassDeclaration):
-        for method in class_decl.methods:
-            called_methods = []
-            used_variables = []
-            if method.body:
-                for path, node in method:
-                    if isinstance(node, javalang.tree.MethodInvocation):
-                        called_methods.append(node.member)
-                    elif isinstance(node, javalang.tree.MemberReference):
-                        used_variables.append(node.member)
-            try:
-                method_text = extract_method_text(java_code, method, class_decl.name)
-            except Exception as e:
-                print(
-                    f"Errore nell'estrazione del metodo {method.name} da {file_path}: {e}"
-                )
-                # Fallback: usa tutto il file se non riesco a estrarre il metodo
-                method_text = java_code
 
-            # Estrai informazioni aggiuntive dal metodo
-            param_types = (
-                [p.type.name for p in method.parameters] if method.parameters else []
-            )
-            param_names = (
-                [p.name for p in method.parameters] if method.parameters else []
-            )
-            return_type = method.return_type.name if method.return_type else "void"
-            modifiers = method.modifiers if method.modifiers else []
-
-            data.append(
-                {
-                    "class": class_decl.name,
-                    "method": method.name,
-                    "params": param_types,
-                    "param_names": param_names,
-                    "return_type": return_type,
-                    "modifiers": modifiers,
-                    "calls": called_methods,
-                    "variables": used_variables,
-                    "file": file_path,
-                    "text": method_text,
-                }
-            )
-    return data
+def get_head_commit(repo_path: str) -> str:
+    """Restituisce lo SHA del commit HEAD del repository locale."""
+    return Repo(repo_path).head.commit.hexsha
+
+
+def get_changed_java_files(repo_path: str, old_commit: str, new_commit: str):
+    """
+    Confronta due commit e restituisce i file Java da reindicizzare e quelli
+    da rimuovere dall'indice (percorsi relativi al repository).
+    Un file rinominato viene rimosso col vecchio percorso e indicizzato col nuovo.
+    """
+    repo = Repo(repo_path)
+    diff_index = repo.commit(old_commit).diff(repo.commit(new_commit))
+
+    def is_indexed(path):
+        if not path or not path.endswith(".java"):
+            return False
+        parts = path.split("/")
+        return not any(p in ("target", "build", ".git") for p in parts[:-1])
+
+    to_index, to_remove = set(), set()
+    for diff in diff_index:
+        if diff.change_type == "A":
+            to_index.add(diff.b_path)
+        elif diff.change_type == "D":
+            to_remove.add(diff.a_path)
+        elif diff.change_type == "R":
+            to_remove.add(diff.a_path)
+            to_index.add(diff.b_path)
+        else:  # M, T, C
+            to_remove.add(diff.a_path)
+            to_index.add(diff.b_path)
+
+    to_index = sorted(p for p in to_index if is_indexed(p))
+    to_remove = sorted(p for p in to_remove | set(to_index) if is_indexed(p))
+    return to_index, to_remove
+
+
+def run_incremental_ingestion(
+    repo_path: str,
+    db_path: str = CHROMA_DB_DIR,
+    embedding_model_name: str = EMBEDDING_MODEL_NAME,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+):
+    """
+    Reindicizza solo i file Java cambiati dall'ultimo commit indicizzato.
+    Se non esiste uno stato precedente (o il commit non è più raggiungibile)
+    esegue un'ingestione completa.
+    """
+    head = get_head_commit(repo_path)
+    last_commit = load_index_state().get(collection_name, {}).get("commit")
+
+    if last_commit == head:
+        print(f"Indice già aggiornato al commit {head[:10]}, nulla da fare.")
+        return None
+
+    changes = None
+    if last_commit:
+        try:
+            changes = get_changed_java_files(repo_path, last_commit, head)
+        except (BadName, ValueError, GitCommandError) as e:
+            print(f"Commit {last_commit[:10]} non disponibile ({e}).")
+
+    if changes is None:
+        print("Nessuno stato incrementale valido: eseguo un'ingestione completa.")
+        chunks = load_and_analyze_code(repo_path)
+        vector_db = create_vector_db(
+            chunks, db_path, embedding_model_name, collection_name
+        )
+    else:
+        to_index, to_remove = changes
+        print(
+            f"Modifiche {last_commit[:10]}..{head[:10]}: "
+            f"{len(to_index)} file da indicizzare, {len(to_remove)} da rimuovere."
+        )
+        chunks = load_and_analyze_code(repo_path, to_index) if to_index else []
+        vector_db = update_vector_db(
+            chunks,
+            [os.path.normpath(os.path.join(repo_path, p)) for p in to_remove],
+            db_path,
+            embedding_model_name,
+            collection_name,
+        )
+
+    save_index_state(collection_name, head)
+    return vector_db
+
+
+def ingest_repository(
+    repo_path: str,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+    incremental: bool = False,
+    streaming: bool = False,
+    full_reindex: bool = False,
+):
+    """
+    Indicizza un repository già clonato nella collezione indicata.
+    Restituisce il database vettoriale, o None se l'indice era già aggiornato.
+    `streaming` è un'ingestione completa e non si combina con `incremental`.
+    """
+    if streaming and incremental:
+        raise ValueError("--streaming e --incremental non si possono usare insieme.")
+    if full_reindex:
+        open_vector_store(collection_name).delete_collection()
+        SummaryCollections(collection_name).delete()
+        print(f"Collezione '{collection_name}' svuotata.")
+
+    if streaming:
+        from src.streaming_ingestion import checkpoint_path, run_streaming_ingestion
+
+        if full_reindex:
+            # Un checkpoint precedente farebbe saltare file appena cancellati
+            ckpt = checkpoint_path(CHROMA_DB_DIR, collection_name)
+            if os.path.exists(ckpt):
+                os.remove(ckpt)
+        return run_streaming_ingestion(repo_path, collection_name=collection_name)
+
+    if incremental and not full_reindex:
+        # 2-3. Solo i file cambiati dall'ultimo commit indicizzato
+        return run_incremental_ingestion(repo_path, collection_name=collection_name)
+
+    # 2. Carica e suddividi il codice in chunk
+    # code_chunks = load_and_split_code(repo_path)
+    code_chunks = load_and_analyze_code(repo_path)
+
+    # 3. Crea il database vettoriale
+    # ChromaDB salverà i dati nella directory specificata da CHROMA_DB_DIR
+    vector_database = create_vector_db(
+        code_chunks, CHROMA_DB_DIR, EMBEDDING_MODEL_NAME, collection_name
+    )
+    save_index_state(collection_name, get_head_commit(repo_path))
+    return vector_database
+
+
+def _print_summary(vector_database):
+    print(f"🔢 Contiene {count_chunks(vector_database)} elementi.")
+    if isinstance(vector_database.embeddings, CachedEmbeddings):
+        vector_database.embeddings.print_stats()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestione della codebase Java.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reindicizza solo i file cambiati dall'ultimo commit indicizzato.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Ingestione completa in streaming a memoria limitata, riprendibile "
+        "(non si combina con --incremental).",
+    )
+    parser.add_argument(
+        "--full-reindex",
+        action="store_true",
+        help="Svuota la collezione e ricostruisce l'indice da zero.",
+    )
+    parser.add_argument(
+        "--manifest",
+        nargs="?",
+        const=REPOS_MANIFEST_PATH,
+        help="Indicizza i repository del manifest JSON, ognuno nella sua collezione.",
+    )
+    parser.add_argument(
+        "--repos",
+        nargs="+",
+        help="Con --manifest, limita l'ingestione ai repository indicati.",
+    )
+    args = parser.parse_args()
+    if args.streaming and args.incremental:
+        parser.error("--streaming esegue un'ingestione completa: non si combina con --incremental.")
+    mode = dict(
+        incremental=args.incremental,
+        streaming=args.streaming,
+        full_reindex=args.full_reindex,
+    )
+
+    if args.manifest:
+        entries = load_manifest(args.manifest)
+        if args.repos:
+            entries = [e for e in entries if e["name"] in args.repos]
+        if not entries:
+            print(f"Nessun repository da indicizzare in {args.manifest}.")
+            sys.exit(1)
+
+        # 1. Clona o aggiorna tutti i repository in parallelo
+        errors = sync_repositories(entries)
+
+        # 2-3. Indicizza ciascun repository nella propria collezione
+        for entry in entries:
+            name = entry["name"]
+            if errors.get(name):
+                print(f"⚠️ {name} saltato: sincronizzazione fallita ({errors[name]}).")
+                continue
+            print(f"\n=== {name} ===")
+            vector_database = ingest_repository(
+                repo_local_path(name), collection_for_repo(name), **mode
+            )
+            if vector_database is not None:
+                _print_summary(vector_database)
+        print("\n✅ Processo di ingestione multi-repository completato!")
+        sys.exit(0)
+
     # Percorso dove verrà clonato il repository
     local_repo_path = os.path.join(REPOS_DIR, REPO_NAME)
 
     # 1. Clona o aggiorna il repository
     clone_repository(GITHUB_REPO_URL, local_repo_path)
 
-    # 2. Carica e suddividi il codice in chunk
-    # code_chunks = load_and_split_code(local_repo_path)
-    code_chunks = load_and_analyze_code(local_repo_path)
-
-    # 3. Crea il database vettoriale
-    # ChromaDB salverà i dati nella directory specificata da CHROMA_DB_DIR
-    vector_database = create_vector_db(code_chunks, CHROMA_DB_DIR, EMBEDDING_MODEL_NAME)
+    vector_database = ingest_repository(local_repo_path, **mode)
+    if vector_database is None:
+        sys.exit(0)
 
     print("\n✅ Processo di ingestione completato!")
     print(f"📌 Il database vettoriale è salvato in: {CHROMA_DB_DIR}")
-    print(f"🔢 Contiene {vector_database._collection.count()} elementi.")
+    _print_summary(vector_database)
@@ -0,0 +1,515 @@
+# src/java_parser.py
+"""
+Analisi dei sorgenti Java con javalang.
+
+Il modulo importa solo javalang, così i processi worker del pool di parsing
+partono velocemente senza caricare langchain o i modelli di embedding.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import javalang
+
+# Record compatto di un metodo: il testo non viene copiato, si conservano solo
+# gli offset (in caratteri) di inizio e fine da cui ricavarlo nel processo padre.
+MethodRecord = namedtuple(
+    "MethodRecord",
+    [
+        "class_name",
+        "method",
+        "params",
+        "param_names",
+        "return_type",
+        "modifiers",
+        "calls",
+        "call_qualifiers",
+        "call_arities",
+        "variables",
+        "start",
+        "end",
+        "kind",  # "method" oppure "constructor"
+    ],
+)
+
+# Riassunto di una classe (o interfaccia, enum, annotazione) per l'indice per
+# livelli: intestazione, campi e firme dei metodi, senza i corpi.
+ClassRecord = namedtuple(
+    "ClassRecord",
+    [
+        "class_name",
+        "kind",
+        "modifiers",
+        "annotations",
+        "extends",
+        "implements",
+        "constants",
+        "fields",
+        "methods",
+        "documentation",
+    ],
+)
+
+# Risultato dell'analisi di un file: package, import, metodi e classi
+FileRecords = namedtuple("FileRecords", ["package", "imports", "methods", "classes"])
+
+EMPTY_FILE_RECORDS = FileRecords("", (), [], [])
+
+# Versione dell'estrattore: va incrementata a ogni modifica che cambia i record,
+# così la cache del parsing scarta automaticamente i risultati precedenti.
+EXTRACTOR_VERSION = 6
+
+# Qualificatore delle chiamate fatte sul risultato di un'altra espressione
+# (es. map in find(1).map(x)): l'oggetto non è noto dal solo sorgente.
+EXPRESSION_QUALIFIER = "<expr>"
+
+# Caratteri massimi della Javadoc riportata nel riassunto di una classe
+SUMMARY_DOC_CHARS = 300
+
+# Ordine consueto dei modificatori nel codice Java, per riassunti leggibili
+_MODIFIER_ORDER = {
+    m: i
+    for i, m in enumerate(
+        (
+            "public",
+            "protected",
+            "private",
+            "abstract",
+            "default",
+            "static",
+            "final",
+            "transient",
+            "volatile",
+            "synchronized",
+            "native",
+            "strictfp",
+        )
+    )
+}
+
+# Sotto questa soglia di file il costo di avvio del pool supera il guadagno
+MIN_FILES_FOR_POOL = 16
+
+# Dichiarazioni di cui calcolare gli intervalli di testo
+SPAN_NODE_TYPES = (
+    javalang.tree.MethodDeclaration,
+    javalang.tree.ConstructorDeclaration,
+    javalang.tree.ClassDeclaration,
+    javalang.tree.InterfaceDeclaration,
+    javalang.tree.EnumDeclaration,
+)
+
+
+def source_text(java_code: str) -> str:
+    """
+    Restituisce il testo a cui si riferiscono le posizioni di javalang.
+    Il tokenizer decodifica gli escape unicode (es. \\u0041) prima di
+    assegnare le posizioni: solo in quel caso il testo differisce dall'originale.
+    """
+    if "\\u" not in java_code:
+        return java_code
+    tokenizer = javalang.tokenizer.JavaTokenizer(java_code)
+    tokenizer.reset()
+    tokenizer.pre_tokenize()
+    return tokenizer.data
+
+
+def _line_offsets(text: str):
+    """Offset del primo carattere di ogni riga (javalang conta solo i '\\n')."""
+    offsets = [0]
+    find = text.find
+    i = find("\n")
+    while i != -1:
+        offsets.append(i + 1)
+        i = find("\n", i + 1)
+    return offsets
+
+
+def compute_declaration_spans(text: str, tokens, nodes):
+    """
+    Calcola in un solo passaggio sui token gli intervalli [inizio, fine) delle
+    dichiarazioni in `nodes` (metodi, costruttori e classi, anche annidate).
+    I nodi sono quelli già raccolti dal chiamante, per non ripercorrere l'AST.
+
+    Le graffe dentro stringhe, caratteri e commenti non sono token Separator,
+    quindi non influiscono sul bilanciamento. L'intervallo parte dall'inizio
+    della riga della prima annotazione/modificatore e termina dopo la graffa
+    di chiusura (o dopo il ';' dei metodi astratti).
+
+    Restituisce un dizionario {(riga, colonna) della dichiarazione: (start, end)}.
+    """
+    line_offsets = _line_offsets(text)
+
+    def offset(position):
+        return line_offsets[position.line - 1] + position.column - 1
+
+    # Unica scansione: indice dei token per posizione e coppie di parentesi
+    token_index = {}
+    matching = {}
+    stack = {"{": [], "(": []}
+    closing = {"}": "{", ")": "("}
+    for i, token in enumerate(tokens):
+        token_index[(token.position.line, token.position.column)] = i
+        if isinstance(token, javalang.tokenizer.Separator):
+            if token.value in stack:
+                stack[token.value].append(i)
+            elif token.value in closing and stack[closing[token.value]]:
+                matching[stack[closing[token.value]].pop()] = i
+
+    spans = {}
+    for node in nodes:
+        if not isinstance(node, SPAN_NODE_TYPES) or node.position is None:
+            continue
+        key = (node.position.line, node.position.column)
+        first = token_index.get(key)
+        if first is None:
+            continue
+
+        # Inizio: prima annotazione o modificatore che precede la dichiarazione
+        start_idx = first
+        for annotation in getattr(node, "annotations", None) or ():
+            if annotation.position is not None:
+                pos = (annotation.position.line, annotation.position.column)
+                start_idx = min(start_idx, token_index.get(pos, start_idx))
+        while start_idx > 0 and isinstance(
+            tokens[start_idx - 1], javalang.tokenizer.Modifier
+        ):
+            start_idx -= 1
+
+        # Fine: per metodi e costruttori si salta la lista dei parametri, che
+        # può contenere graffe (es. @RequestParam(value = {"a"}))
+        i = first
+        if isinstance(
+            node, (javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration)
+        ):
+            while i < len(tokens) and tokens[i].value != "(":
+                i += 1
+            i = matching.get(i, i)
+        while i < len(tokens) and tokens[i].value not in ("{", ";"):
+            i += 1
+        if i == len(tokens):
+            continue
+        end_idx = matching.get(i, i) if tokens[i].value == "{" else i
+
+        # Si include l'indentazione, a meno che la riga contenga altro codice prima
+        start = offset(tokens[start_idx].position)
+        line_start = line_offsets[tokens[start_idx].position.line - 1]
+        if not text[line_start:start].strip():
+            start = line_start
+        end = offset(tokens[end_idx].position) + len(tokens[end_idx].value)
+        spans[key] = (start, end)
+    return spans
+
+
+def _type_text(node) -> str:
+    """Nome di un tipo con gli eventuali argomenti generici (es. List<User>)."""
+    if node is None:
+        return "void"
+    text = node.name
+    arguments = [a.type for a in getattr(node, "arguments", None) or () if a.type]
+    if arguments:
+        text += "<" + ", ".join(_type_text(a) for a in arguments) + ">"
+    sub_type = getattr(node, "sub_type", None)
+    if sub_type is not None:
+        text += "." + _type_text(sub_type)
+    return text + "[]" * len(node.dimensions or ())
+
+
+def _annotation_text(annotation) -> str:
+    """Annotazione con i soli argomenti letterali (es. @GetMapping("/users"))."""
+    text = "@" + annotation.name
+    element = annotation.element
+    if isinstance(element, javalang.tree.Literal):
+        return f"{text}({element.value})"
+    if isinstance(element, list):
+        pairs = [
+            f"{pair.name} = {pair.value.value}"
+            for pair in element
+            if isinstance(pair.value, javalang.tree.Literal)
+        ]
+        return f"{text}({', '.join(pairs) if pairs else '...'})"
+    return text if element is None else f"{text}(...)"
+
+
+def _ordered_modifiers(modifiers) -> tuple:
+    """Modificatori nell'ordine consueto del codice Java (public static final ...)."""
+    return tuple(
+        sorted(modifiers or (), key=lambda m: (_MODIFIER_ORDER.get(m, len(_MODIFIER_ORDER)), m))
+    )
+
+
+def _declaration_prefix(node) -> str:
+    """Annotazioni e modificatori di una dichiarazione, seguiti da uno spazio."""
+    parts = [_annotation_text(a) for a in node.annotations or ()]
+    parts += _ordered_modifiers(node.modifiers)
+    return "".join(f"{p} " for p in parts)
+
+
+def _method_signature_text(node) -> str:
+    params = ", ".join(
+        f"{_type_text(p.type)}{'...' if p.varargs else ''} {p.name}"
+        for p in node.parameters or ()
+    )
+    if isinstance(node, javalang.tree.ConstructorDeclaration):
+        return f"{_declaration_prefix(node)}{node.name}({params})"
+    return f"{_declaration_prefix(node)}{_type_text(node.return_type)} {node.name}({params})"
+
+
+def _class_record(node) -> ClassRecord:
+    kind = {
+        javalang.tree.InterfaceDeclaration: "interface",
+        javalang.tree.EnumDeclaration: "enum",
+        javalang.tree.AnnotationDeclaration: "@interface",
+    }.get(type(node), "class")
+    # Le classi estendono un solo tipo, le interfacce una lista
+    extends = getattr(node, "extends", None) or []
+    if not isinstance(extends, list):
+        extends = [extends]
+    constants = ()
+    if isinstance(node, javalang.tree.EnumDeclaration):
+        constants = tuple(c.name for c in node.body.constants or ())
+    # Solo le classi hanno costruttori; le enum tengono campi e metodi nel body
+    members = list(getattr(node, "constructors", ())) + list(node.methods)
+    documentation = " ".join(
+        line.strip().lstrip("*").strip()
+        for line in (node.documentation or "").strip("/* \n").splitlines()
+    ).strip()
+    return ClassRecord(
+        class_name=node.name,
+        kind=kind,
+        modifiers=_ordered_modifiers(node.modifiers),
+        annotations=tuple(_annotation_text(a) for a in node.annotations or ()),
+        extends=tuple(_type_text(t) for t in extends),
+        implements=tuple(_type_text(t) for t in getattr(node, "implements", None) or ()),
+        constants=constants,
+        fields=tuple(
+            f"{_declaration_prefix(f)}{_type_text(f.type)} {d.name}"
+            for f in node.fields
+            for d in f.declarators
+        ),
+        methods=tuple(_method_signature_text(m) for m in members),
+        documentation=documentation[:SUMMARY_DOC_CHARS],
+    )
+
+
+def extract_file_records(java_code: str, file_path: str = "") -> FileRecords:
+    """
+    Analizza un file Java: package, import, metodi e costruttori delle classi
+    (MethodRecord) e riassunto di ogni tipo dichiarato (ClassRecord).
+    Il file viene tokenizzato una sola volta: lo stesso flusso di token serve
+    al parser e al calcolo degli intervalli di testo.
+    Restituisce EMPTY_FILE_RECORDS se il file non è analizzabile.
+    """
+    try:
+        tokenizer = javalang.tokenizer.JavaTokenizer(java_code)
+        tokens = list(tokenizer.tokenize())
+        tree = javalang.parser.Parser(tokens).parse()
+    except Exception:
+        return EMPTY_FILE_RECORDS
+
+    text = tokenizer.data
+    # Tutti i tipi dichiarati, anche annidati, con i rispettivi membri
+    type_decls = [t for _, t in tree.filter(javalang.tree.TypeDeclaration)]
+    class_decls = [t for t in type_decls if isinstance(t, javalang.tree.ClassDeclaration)]
+    members = {
+        id(c): [
+            m
+            for m in c.body
+            if isinstance(m, (javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration))
+        ]
+        for c in class_decls
+    }
+    try:
+        spans = compute_declaration_spans(
+            text, tokens, type_decls + [m for c in class_decls for m in members[id(c)]]
+        )
+    except Exception as e:
+        print(f"Errore nel calcolo degli intervalli dei metodi di {file_path}: {e}")
+        spans = {}
+
+    records = []
+    for class_decl in class_decls:
+        class_span = spans.get((class_decl.position.line, class_decl.position.column))
+        for method in members[id(class_decl)]:
+            is_constructor = isinstance(method, javalang.tree.ConstructorDeclaration)
+            called_methods = []
+            call_qualifiers = []
+            call_arities = []
+            used_variables = []
+            # Chiamate in catena (a.b().c(), this.repo.save()): javalang le
+            # rappresenta come selettori dell'espressione che le precede
+            selector_qualifiers = {}
+            if method.body:
+                for path, node in method:
+                    previous = "" if isinstance(node, javalang.tree.This) else None
+                    for selector in getattr(node, "selectors", None) or ():
+                        if isinstance(selector, javalang.tree.MethodInvocation):
+                            # this.repo.save() è una chiamata su repo; dopo un'altra
+                            # chiamata (o su new Foo(), "x"...) l'oggetto è ignoto
+                            selector_qualifiers[id(selector)] = (
+                                EXPRESSION_QUALIFIER if previous is None else previous
+                            )
+                        if previous is not None and isinstance(
+                            selector, javalang.tree.MemberReference
+                        ):
+                            previous = selector.member
+                        else:
+                            previous = None
+                    if isinstance(node, javalang.tree.MethodInvocation):
+                        called_methods.append(node.member)
+                        # Oggetto su cui è invocato il metodo (es. userService), "" se assente
+                        call_qualifiers.append(
+                            node.qualifier or selector_qualifiers.get(id(node), "")
+                        )
+                        call_arities.append(len(node.arguments or ()))
+                    elif isinstance(node, javalang.tree.MemberReference):
+                        used_variables.append(node.member)
+
+            span = spans.get((method.position.line, method.position.column))
+            if span is None:
+                print(f"Errore nell'estrazione del metodo {method.name} da {file_path}")
+                # Fallback: la classe che lo contiene o, se manca anche quella, tutto il file
+                span = class_span or (0, len(text))
+
+            records.append(
+                MethodRecord(
+                    class_name=class_decl.name,
+                    method=method.name,
+                    params=tuple(p.type.name for p in method.parameters or ()),
+                    param_names=tuple(p.name for p in method.parameters or ()),
+                    # Un costruttore restituisce un'istanza della sua classe
+                    return_type=(
+                        class_decl.name
+                        if is_constructor
+                        else method.return_type.name if method.return_type else "void"
+                    ),
+                    # I modificatori sono un set: li ordino per un output deterministico
+                    modifiers=tuple(sorted(method.modifiers or ())),
+                    calls=tuple(called_methods),
+                    call_qualifiers=tuple(call_qualifiers),
+                    call_arities=tuple(call_arities),
+                    variables=tuple(used_variables),
+                    start=span[0],
+                    end=span[1],
+                    kind="constructor" if is_constructor else "method",
+                )
+            )
+
+    classes = []
+    for _, node in tree.filter(javalang.tree.TypeDeclaration):
+        try:
+            classes.append(_class_record(node))
+        except Exception as e:
+            print(f"Errore nel riassunto della classe {node.name} di {file_path}: {e}")
+    return FileRecords(
+        package=tree.package.name if tree.package else "",
+        imports=tuple(
+            ("static " if i.static else "") + i.path + (".*" if i.wildcard else "")
+            for i in tree.imports or ()
+        ),
+        methods=records,
+        classes=classes,
+    )
+
+
+def extract_method_records(java_code: str, file_path: str = ""):
+    """Estrae metodi e costruttori delle classi di un file Java come lista di MethodRecord."""
+    return extract_file_records(java_code, file_path).methods
+
+
+def record_text(text: str, record: MethodRecord) -> str:
+    """Ricava il testo del metodo dal sorgente restituito da source_text()."""
+    return text[record.start : record.end]
+
+
+def _class_header(record: ClassRecord) -> str:
+    header = " ".join(record.modifiers + (record.kind, record.class_name))
+    if record.extends:
+        header += " extends " + ", ".join(record.extends)
+    if record.implements:
+        header += " implements " + ", ".join(record.implements)
+    return header
+
+
+def class_summary_text(package: str, record: ClassRecord) -> str:
+    """
+    Scheletro della classe senza i corpi dei metodi (Javadoc, annotazioni,
+    campi e firme): è il testo indicizzato e inserito nel contesto.
+    """
+    lines = [f"package {package};"] if package else []
+    if record.documentation:
+        lines.append(f"/** {record.documentation} */")
+    lines += list(record.annotations)
+    lines.append(_class_header(record) + " {")
+    if record.constants:
+        lines.append(f"    {', '.join(record.constants)};")
+    lines += [f"    {field};" for field in record.fields]
+    lines += [f"    {method};" for method in record.methods]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def file_summary_text(rel_path: str, records: FileRecords) -> str:
+    """Package, import e tipi dichiarati in un file, con il numero di metodi."""
+    lines = [f"// {rel_path}"]
+    if records.package:
+        lines.append(f"package {records.package};")
+    lines += [f"import {i};" for i in records.imports]
+    lines += [
+        f"{_class_header(c)}  // {len(c.fields)} campi, {len(c.methods)} metodi"
+        for c in records.classes
+    ]
+    return "\n".join(lines)
+
+
+def extract_java_structure(java_code: str, file_path: str):
+    """Estrae classi, metodi e call graph da un file Java."""
+    text = source_text(java_code)
+    return [
+        {
+            "class": r.class_name,
+            "method": r.method,
+            "params": list(r.params),
+            "param_names": list(r.param_names),
+            "return_type": r.return_type,
+            "modifiers": list(r.modifiers),
+            "calls": list(r.calls),
+            "call_qualifiers": list(r.call_qualifiers),
+            "call_arities": list(r.call_arities),
+            "variables": list(r.variables),
+            "file": file_path,
+            "text": record_text(text, r),
+        }
+        for r in extract_method_records(java_code, file_path)
+    ]
+
+
+def _parse_worker(item):
+    """Funzione eseguita nei processi del pool: (file_path, codice, ...) -> FileRecords."""
+    file_path, java_code = item[0], item[1]
+    return extract_file_records(java_code, file_path)
+
+
+def parse_java_sources(sources, workers=None, executor=None):
+    """
+    Analizza in parallelo una lista di coppie (file_path, codice Java).
+
+    Restituisce, nello stesso ordine dell'input, i FileRecords di ogni file.
+    Con `workers` <= 1 o pochi file l'analisi avviene nel processo
+    corrente. Se viene passato un `executor` già avviato lo si riusa, evitando
+    di creare un pool a ogni chiamata (modalità streaming).
+    """
+    sources = list(sources)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(sources))
+
+    if workers <= 1 or len(sources) < MIN_FILES_FOR_POOL:
+        return [_parse_worker(item) for item in sources]
+
+    # map() conserva l'ordine dell'input; i chunk riducono l'overhead di IPC
+    chunksize = max(1, len(sources) // (workers * 8))
+    if executor is not None:
+        return list(executor.map(_parse_worker, sources, chunksize=chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_parse_worker, sources, chunksize=chunksize))
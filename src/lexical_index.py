@@ -0,0 +1,170 @@
+# src/lexical_index.py
+"""
+Indice lessicale (BM25) sui token del codice.
+
+Gli identificatori vengono spezzati su camelCase e snake_case
+(findByEmailAndStatus -> find, by, email, and, status) e indicizzati anche
+interi, così una domanda che nomina l'identificatore esatto lo trova anche
+quando il suo embedding è poco significativo.
+
+L'indice è invertito (termine -> {chunk_id: frequenza}) e aggiornabile per
+file, come il database vettoriale. Su disco si salva in forma compatta: il
+vocabolario una volta sola e, per ogni chunk, gli ID dei termini con le
+frequenze.
+"""
+import os
+import re
+import gzip
+import json
+import math
+import heapq
+from collections import Counter
+
+from config import BM25_K1, BM25_B
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+# Parti di un identificatore: HTTPServerError -> HTTP, Server, Error
+_WORD_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z]|[0-9]|$)|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+# Parole chiave Java e parole comuni nelle domande: frequentissime e poco utili
+STOP_WORDS = frozenset(
+    """
+    public private protected static final void return new this class import
+    package if else for while try catch throw throws int long boolean string
+    null true false extends implements super var
+    il lo la le gli di da del della dei delle in con su per tra che come cosa
+    un una uno nel nella sono è the of to and or is in on for what how
+    """.split()
+)
+
+
+def tokenize_code(text: str):
+    """Token minuscoli del testo: identificatori interi e loro parti."""
+    tokens = []
+    for identifier in _IDENTIFIER.findall(text):
+        parts = [
+            p.lower()
+            for piece in identifier.split("_")
+            for p in _WORD_PART.findall(piece)
+        ]
+        if len(parts) > 1:
+            tokens.append(identifier.lower())
+        tokens.extend(p for p in parts if len(p) > 1 and p not in STOP_WORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings, k: int = 60):
+    """
+    Unisce più classifiche (liste di chiavi, dalla migliore) con la
+    Reciprocal Rank Fusion: punteggio = somma di 1 / (k + posizione).
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda key: -scores[key])
+
+
+class LexicalIndex:
+    """Indice invertito con punteggio BM25, aggiornabile per file."""
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.term_ids = {}  # termine -> ID
+        self.postings = {}  # ID termine -> {chunk_id: frequenza}
+        self.docs = {}  # chunk_id -> (file, lunghezza, ID dei termini)
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _add(self, chunk_id, file, counts):
+        term_ids = []
+        for term, tf in counts.items():
+            tid = self.term_ids.setdefault(term, len(self.term_ids))
+            self.postings.setdefault(tid, {})[chunk_id] = tf
+            term_ids.append(tid)
+        length = sum(counts.values())
+        self.docs[chunk_id] = (file, length, term_ids)
+        self.total_length += length
+
+    def _remove(self, chunk_id):
+        _, length, term_ids = self.docs.pop(chunk_id)
+        for tid in term_ids:
+            posting = self.postings[tid]
+            del posting[chunk_id]
+            if not posting:
+                del self.postings[tid]
+        self.total_length -= length
+
+    def add_chunks(self, chunks):
+        for doc in chunks:
+            chunk_id = doc.metadata.get("chunk_id")
+            if not chunk_id:
+                continue
+            if chunk_id in self.docs:
+                self._remove(chunk_id)
+            counts = Counter(tokenize_code(doc.page_content))
+            if counts:
+                self._add(chunk_id, doc.metadata.get("file", ""), counts)
+
+    def remove_files(self, files):
+        files = set(files)
+        if not files:
+            return
+        for chunk_id in [cid for cid, d in self.docs.items() if d[0] in files]:
+            self._remove(chunk_id)
+
+    def search(self, query: str, k: int):
+        """Restituisce [(chunk_id, punteggio BM25)] dei k chunk migliori."""
+        if not self.docs:
+            return []
+        n_docs = len(self.docs)
+        avg_length = self.total_length / n_docs
+        scores = {}
+        for term in set(tokenize_code(query)):
+            posting = self.postings.get(self.term_ids.get(term))
+            if not posting:
+                continue
+            idf = math.log(1 + (n_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                length = self.docs[chunk_id][1]
+                norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (
+                    self.k1 + 1
+                ) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self, path: str):
+        # Vocabolario ricompattato: solo i termini ancora presenti
+        used = sorted(self.postings)
+        new_ids = {tid: i for i, tid in enumerate(used)}
+        terms = {tid: term for term, tid in self.term_ids.items()}
+        data = {
+            "terms": [terms[tid] for tid in used],
+            "docs": {
+                cid: [
+                    file,
+                    [new_ids[tid] for tid in term_ids],
+                    [self.postings[tid][cid] for tid in term_ids],
+                ]
+                for cid, (file, _, term_ids) in self.docs.items()
+            },
+        }
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls()
+        if not os.path.exists(path):
+            return index
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        terms = data["terms"]
+        for chunk_id, (file, term_ids, tfs) in data["docs"].items():
+            index._add(chunk_id, file, {terms[tid]: tf for tid, tf in zip(term_ids, tfs)})
+        return index
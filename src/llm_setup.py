@@ -8,7 +8,15 @@ sys.path.append(project_root)
 
 from langchain_community.llms import Ollama
 from langchain_community.llms import LlamaCpp
-from config import LLM_MODEL_PATH
+from config import (
+    LLM_MODEL_PATH,
+    LLM_N_CTX,
+    LLM_MAX_TOKENS,
+    LLM_SPECULATIVE_DECODING,
+    LLM_PROFILE_PATH,
+)
+from src.speculative import make_draft_model
+from src.autotune import load_llm_profile, default_threads
 
 
 def bck_load_local_llm(n_gpu_layers=-1, n_batch=512, verbose=True):
@@ -31,15 +39,21 @@ def bck_load_local_llm(n_gpu_layers=-1, n_batch=512, verbose=True):
         raise
 
 
-def load_local_llm(n_gpu_layers=-1, n_batch=512, verbose=True):
+def load_local_llm(
+    n_gpu_layers=None, n_batch=None, verbose=True, speculative=LLM_SPECULATIVE_DECODING
+):
     """
     Carica un modello LLM locale in formato GGUF usando LlamaCpp.
+    I parametri non indicati vengono dal profilo di `python src/autotune.py`,
+    se esiste per questo modello, altrimenti dai valori predefiniti.
 
     Args:
         n_gpu_layers (int): Numero di layer da scaricare sulla GPU (-1 per tutti i layer).
                             Imposta a 0 per eseguire solo su CPU.
         n_batch (int): Dimensione del batch per l'elaborazione.
         verbose (bool): Se mostrare l'output dettagliato di LlamaCpp.
+        speculative (str): Decodifica speculativa: "none", "prompt_lookup" o
+                           "draft_model" (vedi src/speculative.py).
 
     Returns:
         LlamaCpp: L'istanza del modello LLM caricato.
@@ -51,17 +65,48 @@ def load_local_llm(n_gpu_layers=-1, n_batch=512, verbose=True):
             f"Modello LLM non trovato al percorso specificato: {LLM_MODEL_PATH}. Assicurati di averlo scaricato e posizionato correttamente."
         )
 
+    profile = load_llm_profile() or {}
+    if profile:
+        print(
+            f"Profilo hardware da {LLM_PROFILE_PATH}: thread prefill/decodifica "
+            f"{profile['n_threads_batch']}/{profile['n_threads']}, n_batch {profile['n_batch']}, "
+            f"n_ctx {profile['n_ctx']}."
+        )
+    # Senza profilo: un thread per core fisico entro la quota CPU del cgroup
+    n_threads = profile.get("n_threads") or default_threads()
+    n_batch = n_batch or profile.get("n_batch", 512)
+
     try:
+        draft_model = make_draft_model(speculative)
         llm = LlamaCpp(
             model_path=LLM_MODEL_PATH,
-            n_gpu_layers=n_gpu_layers,
+            n_gpu_layers=n_gpu_layers if n_gpu_layers is not None else profile.get("n_gpu_layers", -1),
             n_batch=n_batch,
-            max_tokens=2048,  # Limita la lunghezza della risposta dell'LLM (opzionale)
-            n_ctx=8192,  # Con 18GB di RAM, puoi tranquillamente usare 4096 o anche 8192 per modelli 7B
+            max_tokens=LLM_MAX_TOKENS,  # Limita la lunghezza della risposta dell'LLM (opzionale)
+            n_ctx=profile.get("n_ctx", LLM_N_CTX),  # Con 18GB di RAM, puoi tranquillamente usare 4096 o anche 8192 per modelli 7B
             verbose=verbose,
-            n_threads=os.cpu_count(),  # Utilizza tutti i core logici disponibili
+            n_threads=n_threads,  # Thread della decodifica
+            use_mmap=profile.get("use_mmap", True),
+            use_mlock=profile.get("use_mlock", False),
             temperature=0.7,  # Controllo della creatività (opzionale)
+            # Con una bozza servono i logit di ogni posizione; llama-cpp-python
+            # dimensiona la matrice dei logit solo in base a questo parametro
+            logits_all=draft_model is not None,
+            model_kwargs={
+                "draft_model": draft_model,
+                # Il prefill può rendere meglio con un numero di thread diverso
+                "n_threads_batch": profile.get("n_threads_batch", n_threads),
+                "n_ubatch": min(profile.get("n_ubatch", n_batch), n_batch),
+            },
         )
+        draft_llama = getattr(draft_model, "llama", None)
+        if draft_llama is not None and draft_llama.n_vocab() != llm.client.n_vocab():
+            raise ValueError(
+                "Il modello di bozza deve avere lo stesso vocabolario del modello principale "
+                f"({draft_llama.n_vocab()} token contro {llm.client.n_vocab()})."
+            )
+        if draft_model is not None:
+            print(f"Decodifica speculativa attiva: {speculative}.")
         print("Modello LLM caricato con successo!")
         return llm
     except Exception as e:
@@ -81,8 +126,8 @@ if __name__ == "__main__":
 
     # Test del caricamento dell'LLM
     try:
-        # Usa n_gpu_layers=-1 per sfruttare la GPU del tuo M3
-        llm_model = load_local_llm(n_gpu_layers=-1)
+        # Parametri dal profilo hardware (python src/autotune.py), se presente
+        llm_model = load_local_llm()
         # Puoi fare una semplice query per testare
         print("\nTest query:")
         response = llm_model.invoke("Ciao, come stai? Descriviti brevemente.")
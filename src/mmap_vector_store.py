@@ -0,0 +1,961 @@
+# src/mmap_vector_store.py
+"""
+Indice vettoriale in-process su file in memory map, alternativo a Chroma.
+
+Ogni collezione è una cartella `{collection}.vectors` accanto al database:
+
+    info.json     dimensione dei vettori
+    vectors.f16   matrice float16 (righe x dimensione), solo in append
+    norms.f32     norma al quadrato di ogni riga, per la distanza L2
+    codes.*       codici int8/binari della prima fase (VECTOR_QUANTIZATION)
+    docs.jsonl    sidecar: una riga JSON {id, text, metadata} per vettore
+    deleted.log   righe eliminate dall'ultimo snapshot
+    index.json    snapshot: ID delle righe, valori dei campi filtrabili
+    columns.npz   snapshot: fine di ogni riga in docs.jsonl e codici dei campi
+    ivf/          partizionamento IVF (centroidi + inizio di ogni lista)
+
+La matrice viene aperta in memory map: il caricamento non legge i vettori e
+una query tocca solo le righe che confronta. Testi e metadati restano su disco
+e si leggono solo per i risultati; in memoria ci sono gli ID e, per i campi di
+VECTOR_FILTER_FIELDS, un codice intero per riga con cui si valutano i filtri
+where (stessa sintassi di Chroma).
+
+Le scritture sono in append e sopravvivono a un'interruzione: al caricamento
+lo snapshot viene completato rileggendo le righe di docs.jsonl successive.
+persist() consolida lo snapshot, compatta i file se le righe eliminate sono
+troppe e, da VECTOR_IVF_MIN_ROWS righe in su, ricostruisce le partizioni IVF
+riordinando la matrice per lista: la query legge in sequenza solo le righe
+delle VECTOR_IVF_NPROBE liste più vicine (più quelle aggiunte dopo).
+
+Con VECTOR_QUANTIZATION = "int8" o "binary" la prima fase confronta i codici
+compatti (src/quantization.py) invece della matrice float16, e solo i
+migliori k * VECTOR_RESCORE_FACTOR candidati vengono rivalutati sui vettori
+float16. I codici mancanti (modalità appena attivata, scrittura interrotta)
+si ricalcolano dalla matrice all'apertura.
+"""
+import os
+import json
+import uuid
+import shutil
+import threading
+from array import array
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from config import (
+    CHROMA_DB_DIR,
+    VECTOR_FILTER_FIELDS,
+    VECTOR_IVF_MIN_ROWS,
+    VECTOR_IVF_NPROBE,
+    VECTOR_QUANTIZATION,
+    VECTOR_RESCORE_FACTOR,
+)
+from src.quantization import (
+    QUANTIZATION_MODES,
+    CODE_FILES,
+    SCALE_FILE,
+    code_width,
+    quantize_int8,
+    quantize_binary,
+    int8_dots,
+    hamming_distances,
+)
+
+# Righe convertite in float32 alla volta durante le scansioni
+_BLOCK_ROWS = 32768
+# Filtri con al più queste righe si valutano confrontando solo quelle righe
+_EXACT_FILTER_ROWS = 4096
+# Quota di righe eliminate oltre la quale persist() riscrive i file
+_COMPACT_RATIO = 0.2
+# Righe aggiunte dopo l'ultimo IVF (in proporzione) oltre le quali si ricostruisce
+_IVF_REBUILD_RATIO = 0.1
+# Liste IVF = 4 * sqrt(righe): liste più piccole, meno righe confrontate per query
+_IVF_LISTS_PER_SQRT_ROW = 4
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 32
+_KMEANS_MAX_SAMPLE = 100_000
+
+
+def vector_store_dir(collection_name: str, db_path: str = CHROMA_DB_DIR) -> str:
+    return os.path.join(db_path, f"{collection_name}.vectors")
+
+
+def _write_json(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _top_k(distances: np.ndarray, k: int) -> np.ndarray:
+    """Posizioni delle k distanze minori, in ordine crescente."""
+    if len(distances) > k:
+        top = np.argpartition(distances, k)[:k]
+    else:
+        top = np.arange(len(distances))
+    return top[np.argsort(distances[top], kind="stable")]
+
+
+def _kmeans(sample: np.ndarray, num_lists: int, seed: int = 0) -> np.ndarray:
+    """Centroidi (float32) del k-means L2 sul campione."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = _nearest_centroid(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=num_lists)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Le liste vuote ripartono da un punto a caso del campione
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty))]
+    return centroids
+
+
+def _append_to_buffer(buffer, count: int, values: np.ndarray) -> np.ndarray:
+    """
+    Scrive `values` dopo le prime `count` righe di `buffer`, raddoppiando la
+    capacità quando serve: aggiungere un batch costa O(batch) ammortizzato.
+    """
+    needed = count + len(values)
+    if buffer is None or len(buffer) < needed:
+        grown = np.empty(max(needed, 2 * count, 1024), dtype=values.dtype)
+        if count:
+            grown[:count] = buffer[:count]
+        buffer = grown
+    buffer[count:needed] = values
+    return buffer
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    scores = (centroids * centroids).sum(axis=1) - 2.0 * (vectors @ centroids.T)
+    return scores.argmin(axis=1)
+
+
+class _Column:
+    """Valori di un campo dei metadati codificati come interi (-1 = assente)."""
+
+    def __init__(self, values=(), codes=()):
+        self.values = list(values)
+        self.lookup = {self._key(v): i for i, v in enumerate(self.values)}
+        self.codes = array("i", codes)
+
+    @staticmethod
+    def _key(value):
+        # True e 1 sono chiavi uguali per un dict: si distinguono per tipo
+        return (type(value).__name__, value)
+
+    def append(self, value):
+        if value is None or isinstance(value, (list, dict)):
+            self.codes.append(-1)
+            return
+        key = self._key(value)
+        code = self.lookup.get(key)
+        if code is None:
+            code = self.lookup[key] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def value(self, row: int):
+        code = self.codes[row]
+        return self.values[code] if code >= 0 else None
+
+    def code(self, value):
+        return self.lookup.get(self._key(value), -2)
+
+    def matching_codes(self, predicate):
+        return [i for i, v in enumerate(self.values) if predicate(v)]
+
+
+_COMPARATORS = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _matches(metadata: dict, where: dict) -> bool:
+    """Valuta un filtro where di Chroma su un dizionario di metadati."""
+    if "$and" in where:
+        return all(_matches(metadata, w) for w in where["$and"])
+    if "$or" in where:
+        return any(_matches(metadata, w) for w in where["$or"])
+    for field, condition in where.items():
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        value = metadata.get(field)
+        for op, operand in condition.items():
+            if op == "$eq" and value != operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$nin" and value in operand:
+                return False
+            if op in _COMPARATORS:
+                try:
+                    if value is None or not _COMPARATORS[op](value, operand):
+                        return False
+                except TypeError:
+                    return False
+    return True
+
+
+class MmapVectorStore(VectorStore):
+    """
+    VectorStore di LangChain su matrice float16 in memory map.
+
+    Espone gli stessi metodi di Chroma usati dal progetto (ricerca per vettore
+    con filtro, get, delete, upsert, count), con i parametri omonimi, così
+    ingestione e retrieval non dipendono dal backend. Le distanze sono L2 al
+    quadrato, come in Chroma: più basse = più simili.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        embedding_function=None,
+        persist_directory: str = CHROMA_DB_DIR,
+        filter_fields=VECTOR_FILTER_FIELDS,
+        nprobe: int = VECTOR_IVF_NPROBE,
+        ivf_min_rows: int = VECTOR_IVF_MIN_ROWS,
+        quantization: str = VECTOR_QUANTIZATION,
+        rescore_factor: int = VECTOR_RESCORE_FACTOR,
+    ):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(
+                f"Quantizzazione sconosciuta: {quantization!r} ({' | '.join(QUANTIZATION_MODES)})"
+            )
+        self.collection_name = collection_name
+        self._embedding_function = embedding_function
+        self.path = vector_store_dir(collection_name, persist_directory)
+        self.filter_fields = tuple(filter_fields)
+        self.nprobe = nprobe
+        self.ivf_min_rows = ivf_min_rows
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        self._docs_file = None
+        self._load()
+
+    # --- Caricamento -------------------------------------------------------
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _reset_state(self):
+        self.dim = None
+        self._ids = []  # riga -> ID (None se eliminata)
+        self._rows = {}  # ID -> riga
+        self._ends = array("q")  # fine di ogni riga in docs.jsonl
+        self._alive = bytearray()
+        self._columns = {field: _Column() for field in self.filter_fields}
+        self._snapshot_rows = 0
+        self._deleted_since_snapshot = 0
+        self._vectors = None
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._norm_buffer = None  # norme con capacità extra per gli upsert
+        self._codes_q = None
+        self._scales = None
+        self._scale_buffer = None
+        self._ivf = None
+        self._cache = {}
+
+    def _load(self):
+        self._reset_state()
+        if not os.path.exists(self._file("info.json")):
+            return
+        with open(self._file("info.json"), "r", encoding="utf-8") as f:
+            self.dim = json.load(f)["dim"]
+        if os.path.exists(self._file("index.json")):
+            with open(self._file("index.json"), "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            rows = snapshot["rows"]
+            with np.load(self._file("columns.npz")) as columns:
+                self._ends = array("q", columns["ends"][:rows].tolist())
+                for field in self.filter_fields:
+                    values = snapshot["columns"].get(field)
+                    if values is None:
+                        # Campo aggiunto alla configurazione: codici dal sidecar
+                        self._columns[field] = None
+                    else:
+                        self._columns[field] = _Column(
+                            values, columns[f"codes_{field}"][:rows].tolist()
+                        )
+            self._ids = snapshot["ids"]
+            self._alive = bytearray(cid is not None for cid in self._ids)
+            self._snapshot_rows = rows
+
+        # Righe con vettore e norma entrambi scritti per intero
+        num_vectors = 0
+        if os.path.exists(self._file("norms.f32")):
+            num_vectors = min(
+                os.path.getsize(self._file("vectors.f16")) // (2 * self.dim),
+                os.path.getsize(self._file("norms.f32")) // 4,
+            )
+        self._replay_docs(num_vectors)
+        if any(column is None for column in self._columns.values()):
+            self._rebuild_columns()
+        self._rows = {cid: row for row, cid in enumerate(self._ids) if cid is not None}
+
+        if os.path.exists(self._file("deleted.log")):
+            with open(self._file("deleted.log"), "r", encoding="utf-8") as f:
+                for line in f:
+                    row = int(line)
+                    if row < len(self._ids) and self._ids[row] is not None:
+                        # L'ID può essere stato reinserito in una riga successiva
+                        if self._rows.get(self._ids[row]) == row:
+                            del self._rows[self._ids[row]]
+                        self._ids[row] = None
+                        self._alive[row] = 0
+                        self._deleted_since_snapshot += 1
+
+        self._truncate_to_rows()
+        self._ensure_codes()
+        self._open_matrix()
+        self._load_ivf()
+
+    def _replay_docs(self, num_vectors: int):
+        """Aggiunge le righe di docs.jsonl scritte dopo lo snapshot."""
+        path = self._file("docs.jsonl")
+        if not os.path.exists(path):
+            return
+        offset = self._ends[-1] if self._ends else 0
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                # Riga incompleta o senza vettore: scrittura interrotta
+                if not line.endswith(b"\n") or len(self._ids) >= num_vectors:
+                    break
+                record = json.loads(line)
+                offset += len(line)
+                self._ids.append(record["id"])
+                self._alive.append(1)
+                self._ends.append(offset)
+                for field, column in self._columns.items():
+                    if column is not None:
+                        column.append(record["metadata"].get(field))
+
+    def _rebuild_columns(self):
+        missing = [f for f, c in self._columns.items() if c is None]
+        for field in missing:
+            self._columns[field] = _Column()
+        for row in range(len(self._ids)):
+            metadata = self._read_record(row)["metadata"]
+            for field in missing:
+                self._columns[field].append(metadata.get(field))
+
+    def _truncate_to_rows(self):
+        """Scarta i byte scritti oltre l'ultima riga completa (scrittura interrotta)."""
+        num_rows = len(self._ids)
+        sizes = {
+            "vectors.f16": num_rows * 2 * self.dim,
+            "norms.f32": num_rows * 4,
+            "docs.jsonl": self._ends[-1] if self._ends else 0,
+            SCALE_FILE: num_rows * 4,
+        }
+        for mode, name in CODE_FILES.items():
+            sizes[name] = num_rows * code_width(mode, self.dim)
+        for name, size in sizes.items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+    def _ensure_codes(self):
+        """Calcola dalla matrice float16 i codici delle righe che non li hanno."""
+        if self.quantization == "none" or not self._ids:
+            return
+        path = self._file(CODE_FILES[self.quantization])
+        width = code_width(self.quantization, self.dim)
+        done = os.path.getsize(path) // width if os.path.exists(path) else 0
+        if self.quantization == "int8" and os.path.exists(self._file(SCALE_FILE)):
+            done = min(done, os.path.getsize(self._file(SCALE_FILE)) // 4)
+        elif self.quantization == "int8":
+            done = 0
+        if done >= len(self._ids):
+            return
+        print(
+            f"Codici {self.quantization} di {self.collection_name}: "
+            f"{len(self._ids) - done} righe da quantizzare."
+        )
+        sizes = {CODE_FILES[self.quantization]: done * width}
+        if self.quantization == "int8":
+            sizes[SCALE_FILE] = done * 4
+        for name, size in sizes.items():
+            if os.path.exists(self._file(name)):
+                os.truncate(self._file(name), size)
+        vectors = np.memmap(
+            self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(len(self._ids), self.dim)
+        )
+        for start in range(done, len(self._ids), _BLOCK_ROWS):
+            self._append_codes(np.asarray(vectors[start : start + _BLOCK_ROWS], dtype=np.float32))
+
+    def _append_codes(self, vectors: np.ndarray):
+        """Scrive i codici quantizzati; restituisce le scale (int8) o None."""
+        scales = None
+        if self.quantization == "int8":
+            codes, scales = quantize_int8(vectors)
+            with open(self._file(SCALE_FILE), "ab") as f:
+                f.write(scales.tobytes())
+        else:
+            codes = quantize_binary(vectors)
+        with open(self._file(CODE_FILES[self.quantization]), "ab") as f:
+            f.write(codes.tobytes())
+        return scales
+
+    def _open_matrix(self, new_norms=None, new_scales=None):
+        """
+        Apre le memory map sulle righe correnti. Norme e scale stanno in
+        memoria: dopo un upsert si aggiungono quelle delle righe nuove
+        (`new_norms`, `new_scales`) invece di rileggere i file per intero.
+        """
+        num_rows = len(self._ids)
+        self._cache = {}
+        if not num_rows:
+            self._vectors = None
+            self._norms = np.zeros(0, dtype=np.float32)
+            self._norm_buffer = self._scale_buffer = None
+            self._codes_q = self._scales = None
+            return
+        self._vectors = np.memmap(
+            self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(num_rows, self.dim)
+        )
+        if new_norms is None:
+            self._norm_buffer = np.fromfile(
+                self._file("norms.f32"), dtype=np.float32, count=num_rows
+            )
+        else:
+            self._norm_buffer = _append_to_buffer(
+                self._norm_buffer, num_rows - len(new_norms), new_norms
+            )
+        self._norms = self._norm_buffer[:num_rows]
+        if self.quantization != "none":
+            self._codes_q = np.memmap(
+                self._file(CODE_FILES[self.quantization]),
+                dtype=np.int8 if self.quantization == "int8" else np.uint8,
+                mode="r",
+                shape=(num_rows, code_width(self.quantization, self.dim)),
+            )
+        if self.quantization == "int8":
+            if new_scales is None:
+                self._scale_buffer = np.fromfile(
+                    self._file(SCALE_FILE), dtype=np.float32, count=num_rows
+                )
+            else:
+                self._scale_buffer = _append_to_buffer(
+                    self._scale_buffer, num_rows - len(new_scales), new_scales
+                )
+            self._scales = self._scale_buffer[:num_rows]
+
+    def _load_ivf(self):
+        ivf_dir = self._file("ivf")
+        if not os.path.exists(os.path.join(ivf_dir, "ivf.json")):
+            self._ivf = None
+            return
+        with open(os.path.join(ivf_dir, "ivf.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info["rows"] > len(self._ids):
+            self._ivf = None
+            return
+        centroids = np.load(os.path.join(ivf_dir, "centroids.npy"))
+        self._ivf = {
+            "rows": info["rows"],
+            "centroids": centroids,
+            "centroid_norms": (centroids * centroids).sum(axis=1),
+            "indptr": np.load(os.path.join(ivf_dir, "indptr.npy")),
+        }
+
+    # --- Lettura -----------------------------------------------------------
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    def count(self) -> int:
+        return len(self._rows)
+
+    def _alive_mask(self) -> np.ndarray:
+        mask = self._cache.get("alive")
+        if mask is None:
+            mask = self._cache["alive"] = np.frombuffer(bytes(self._alive), dtype=bool)
+        return mask
+
+    def _codes(self, field: str) -> np.ndarray:
+        key = f"codes_{field}"
+        codes = self._cache.get(key)
+        if codes is None:
+            codes = self._cache[key] = np.array(self._columns[field].codes, dtype=np.int32)
+        return codes
+
+    def _read_line(self, row: int) -> bytes:
+        start = self._ends[row - 1] if row else 0
+        with self._lock:
+            if self._docs_file is None:
+                self._docs_file = open(self._file("docs.jsonl"), "rb")
+            self._docs_file.seek(start)
+            return self._docs_file.read(self._ends[row] - start)
+
+    def _read_record(self, row: int) -> dict:
+        return json.loads(self._read_line(row))
+
+    def _document(self, row: int) -> Document:
+        record = self._read_record(row)
+        return Document(page_content=record["text"], metadata=record["metadata"])
+
+    def _where_mask(self, where: dict) -> np.ndarray:
+        """Righe (maschera booleana) che soddisfano il filtro, eliminate comprese."""
+        num_rows = len(self._ids)
+        if "$and" in where:
+            mask = np.ones(num_rows, dtype=bool)
+            for condition in where["$and"]:
+                mask &= self._where_mask(condition)
+            return mask
+        if "$or" in where:
+            mask = np.zeros(num_rows, dtype=bool)
+            for condition in where["$or"]:
+                mask |= self._where_mask(condition)
+            return mask
+        if len(where) > 1:
+            return self._where_mask({"$and": [{f: c} for f, c in where.items()]})
+
+        field, condition = next(iter(where.items()))
+        if field not in self._columns:
+            # Campo non indicizzato in memoria: si leggono i metadati dal sidecar
+            return np.fromiter(
+                (
+                    self._ids[row] is not None
+                    and _matches(self._read_record(row)["metadata"], where)
+                    for row in range(num_rows)
+                ),
+                dtype=bool,
+                count=num_rows,
+            )
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        column, codes = self._columns[field], self._codes(field)
+        mask = np.ones(num_rows, dtype=bool)
+        for op, operand in condition.items():
+            if op == "$eq":
+                mask &= codes == column.code(operand)
+            elif op == "$ne":
+                mask &= codes != column.code(operand)
+            elif op in ("$in", "$nin"):
+                hit = np.isin(codes, [column.code(v) for v in operand])
+                mask &= hit if op == "$in" else ~hit
+            elif op in _COMPARATORS:
+                compare = _COMPARATORS[op]
+
+                def predicate(value, compare=compare, operand=operand):
+                    try:
+                        return compare(value, operand)
+                    except TypeError:
+                        return False
+
+                mask &= np.isin(codes, column.matching_codes(predicate))
+            else:
+                raise ValueError(f"Operatore non supportato nel filtro: {op}")
+        return mask
+
+    def _filtered_rows(self, where=None) -> np.ndarray:
+        mask = self._alive_mask()
+        if where:
+            mask = mask & self._where_mask(where)
+        return np.flatnonzero(mask)
+
+    def _distances(self, query: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Distanze L2 al quadrato (senza |q|^2) della domanda dalle righe indicate."""
+        distances = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block_rows = rows[start : start + _BLOCK_ROWS]
+            block = np.asarray(self._vectors[block_rows], dtype=np.float32)
+            distances[start : start + len(block_rows)] = (
+                self._norms[block_rows] - 2.0 * (block @ query)
+            )
+        return distances
+
+    def _block_distances(self, query: np.ndarray, query_bits, start: int, stop: int):
+        """Distanze della prima fase: sui codici se quantizzati, altrimenti float16."""
+        if self.quantization == "int8":
+            dots = int8_dots(self._codes_q[start:stop], self._scales[start:stop], query)
+            return self._norms[start:stop] - 2.0 * dots
+        if self.quantization == "binary":
+            return hamming_distances(self._codes_q[start:stop], query_bits)
+        block = np.asarray(self._vectors[start:stop], dtype=np.float32)
+        return self._norms[start:stop] - 2.0 * (block @ query)
+
+    def _scan_ranges(self, query: np.ndarray, ranges, k: int, mask: np.ndarray):
+        """
+        Top-k sugli intervalli di righe contigue [start, stop), considerando
+        solo le righe con `mask` vera. Restituisce (righe, distanze della
+        prima fase).
+        """
+        query_bits = quantize_binary(query[None, :])[0] if self.quantization == "binary" else None
+        best_rows, best_distances = [], []
+        for range_start, range_stop in ranges:
+            for start in range(range_start, range_stop, _BLOCK_ROWS):
+                stop = min(start + _BLOCK_ROWS, range_stop)
+                distances = self._block_distances(query, query_bits, start, stop)
+                distances[~mask[start:stop]] = np.inf
+                top = _top_k(distances, k)
+                best_rows.append(top + start)
+                best_distances.append(distances[top])
+        if not best_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows, distances = np.concatenate(best_rows), np.concatenate(best_distances)
+        top = _top_k(distances, k)
+        keep = np.isfinite(distances[top])
+        return rows[top][keep], distances[top][keep]
+
+    def _ivf_ranges(self, query: np.ndarray):
+        """Intervalli di righe delle liste IVF più vicine, più le righe aggiunte dopo."""
+        ivf = self._ivf
+        scores = ivf["centroid_norms"] - 2.0 * (ivf["centroids"] @ query)
+        lists = np.sort(_top_k(scores, min(self.nprobe, len(scores))))
+        indptr = ivf["indptr"]
+        ranges = [(int(indptr[l]), int(indptr[l + 1])) for l in lists]
+        ranges.append((ivf["rows"], len(self._ids)))
+        return ranges
+
+    def _search_rows(self, embedding, k: int, where=None):
+        if self._vectors is None or k <= 0:
+            return [], []
+        query = np.asarray(embedding, dtype=np.float32)
+        mask = self._alive_mask()
+        if where:
+            mask = mask & self._where_mask(where)
+            rows = np.flatnonzero(mask)
+            if len(rows) <= _EXACT_FILTER_ROWS:
+                # Filtro selettivo: confronto diretto con le sole righe filtrate
+                distances = self._distances(query, rows)
+                top = _top_k(distances, k)
+                query_norm = float(query @ query)
+                return rows[top], [max(0.0, float(d) + query_norm) for d in distances[top]]
+        # Con i codici quantizzati si tengono più candidati, poi il rescoring
+        fetch_k = k if self.quantization == "none" else k * self.rescore_factor
+        ranges = [(0, len(self._ids))] if self._ivf is None else self._ivf_ranges(query)
+        found, distances = self._scan_ranges(query, ranges, fetch_k, mask)
+        rescore = self.quantization != "none"
+        if self._ivf is not None and where and len(found) < k:
+            # Con un filtro molto selettivo le liste visitate possono non bastare
+            found, rescore = np.flatnonzero(mask), True
+        if rescore:
+            # Righe in ordine crescente: letture più sequenziali dal memory map
+            found = np.sort(found)
+            distances = self._distances(query, found)
+            top = _top_k(distances, k)
+            found, distances = found[top], distances[top]
+        query_norm = float(query @ query)
+        return found, [max(0.0, float(d) + query_norm) for d in distances]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding, k: int = 4, filter=None, **kwargs
+    ):
+        rows, distances = self._search_rows(embedding, k, filter)
+        return [(self._document(row), d) for row, d in zip(rows, distances)]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter=None, **kwargs):
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_relevance_scores(
+                embedding, k, filter
+            )
+        ]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None, **kwargs):
+        embedding = self._embedding_function.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def get(
+        self, ids=None, where=None, limit=None, offset=None, include=None, **kwargs
+    ) -> dict:
+        """Come Chroma.get(): ID sempre presenti, il resto secondo `include`."""
+        include = ["metadatas", "documents"] if include is None else include
+        if ids is not None:
+            if isinstance(ids, str):
+                ids = [ids]
+            rows = [self._rows[cid] for cid in ids if cid in self._rows]
+            if where:
+                mask = self._where_mask(where)
+                rows = [row for row in rows if mask[row]]
+        else:
+            rows = self._filtered_rows(where)
+        start = offset or 0
+        rows = list(rows[start : None if limit is None else start + limit])
+
+        records = (
+            [self._read_record(row) for row in rows]
+            if "metadatas" in include or "documents" in include
+            else None
+        )
+        return {
+            "ids": [self._ids[row] for row in rows],
+            "documents": [r["text"] for r in records] if "documents" in include else None,
+            "metadatas": [r["metadata"] for r in records] if "metadatas" in include else None,
+            "embeddings": (
+                np.asarray(self._vectors[rows], dtype=np.float32)
+                if "embeddings" in include and rows
+                else None
+            ),
+        }
+
+    # --- Scrittura ---------------------------------------------------------
+
+    def upsert(self, ids, embeddings, documents, metadatas=None):
+        """
+        Inserisce o sostituisce i chunk indicati. Le righe vengono aggiunte in
+        coda ai file; quelle con lo stesso ID diventano eliminate.
+        """
+        metadatas = metadatas or [{} for _ in ids]
+        # A parità di ID nello stesso batch vale l'ultimo
+        latest = {cid: i for i, cid in enumerate(ids)}
+        order = sorted(latest.values())
+        if not order:
+            return
+        vectors = np.asarray([embeddings[i] for i in order], dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                os.makedirs(self.path, exist_ok=True)
+                self.dim = vectors.shape[1]
+                _write_json(self._file("info.json"), {"dim": self.dim})
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(
+                    f"Dimensione degli embedding {vectors.shape[1]} diversa da quella "
+                    f"della collezione ({self.dim})."
+                )
+            self._delete_rows([self._rows[ids[i]] for i in order if ids[i] in self._rows])
+
+            # Prima i vettori, poi il sidecar: una riga del sidecar ha sempre il vettore
+            with open(self._file("vectors.f16"), "ab") as f:
+                f.write(vectors.astype(np.float16).tobytes())
+            stored = vectors.astype(np.float16).astype(np.float32)
+            norms = (stored * stored).sum(axis=1).astype(np.float32)
+            with open(self._file("norms.f32"), "ab") as f:
+                f.write(norms.tobytes())
+            scales = self._append_codes(vectors) if self.quantization != "none" else None
+            offset = self._ends[-1] if self._ends else 0
+            lines = []
+            for i in order:
+                metadata = metadatas[i] or {}
+                line = (
+                    json.dumps(
+                        {"id": ids[i], "text": documents[i], "metadata": metadata},
+                        ensure_ascii=False,
+                        separators=(",", ":"),
+                    )
+                    + "\n"
+                ).encode("utf-8")
+                lines.append(line)
+                offset += len(line)
+                self._rows[ids[i]] = len(self._ids)
+                self._ids.append(ids[i])
+                self._alive.append(1)
+                self._ends.append(offset)
+                for field, column in self._columns.items():
+                    column.append(metadata.get(field))
+            with open(self._file("docs.jsonl"), "ab") as f:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self._open_matrix(norms, scales)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        embeddings = self._embedding_function.embed_documents(texts)
+        self.upsert(ids, embeddings, texts, list(metadatas) if metadatas else None)
+        return ids
+
+    def _delete_rows(self, rows):
+        if not rows:
+            return
+        with open(self._file("deleted.log"), "a", encoding="utf-8") as f:
+            f.write("".join(f"{row}\n" for row in rows))
+        for row in rows:
+            self._rows.pop(self._ids[row], None)
+            self._ids[row] = None
+            self._alive[row] = 0
+        self._deleted_since_snapshot += len(rows)
+        self._cache.pop("alive", None)
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            self._delete_rows([self._rows[cid] for cid in ids or [] if cid in self._rows])
+
+    def delete_collection(self):
+        with self._lock:
+            self._close()
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._reset_state()
+
+    def _close(self):
+        if self._docs_file is not None:
+            self._docs_file.close()
+            self._docs_file = None
+        self._vectors = None
+        self._codes_q = self._scales = None
+
+    def persist(self):
+        """
+        Consolida lo snapshot. Se servono nuove partizioni IVF (collezione
+        cresciuta) o le righe eliminate superano _COMPACT_RATIO, riscrive i
+        file con le sole righe vive.
+        """
+        with self._lock:
+            if not self._ids:
+                return
+            num_rows, num_alive = len(self._ids), len(self._rows)
+            too_many_deleted = num_rows - num_alive > _COMPACT_RATIO * num_rows
+            covered = self._ivf["rows"] if self._ivf else 0
+            if num_alive >= self.ivf_min_rows and (
+                too_many_deleted or num_rows - covered > _IVF_REBUILD_RATIO * max(covered, 1)
+            ):
+                self._build_ivf()
+            elif too_many_deleted:
+                self._rewrite(np.flatnonzero(self._alive_mask()))
+            elif num_rows > self._snapshot_rows or self._deleted_since_snapshot:
+                self._write_snapshot(self.path)
+                open(self._file("deleted.log"), "w").close()
+                self._deleted_since_snapshot = 0
+
+    def _write_snapshot(self, path: str):
+        columns = {"ends": np.array(self._ends, dtype=np.int64)}
+        for field, column in self._columns.items():
+            columns[f"codes_{field}"] = np.array(column.codes, dtype=np.int32)
+        tmp_path = os.path.join(path, "columns.tmp.npz")
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, os.path.join(path, "columns.npz"))
+        # index.json per ultimo: indica quante righe di columns.npz sono valide
+        _write_json(
+            os.path.join(path, "index.json"),
+            {
+                "rows": len(self._ids),
+                "ids": self._ids,
+                "columns": {f: c.values for f, c in self._columns.items()},
+            },
+        )
+        self._snapshot_rows = len(self._ids)
+
+    def _rewrite(self, order: np.ndarray, ivf=None):
+        """
+        Riscrive i file con le righe `order` (solo righe vive), in quell'ordine,
+        in una cartella che poi sostituisce quella della collezione.
+        `ivf` = (centroidi, indptr) delle liste, se le righe sono ordinate per lista.
+        """
+        num_deleted = len(self._ids) - len(self._rows)
+        if num_deleted:
+            print(f"Compattazione di {self.collection_name}: {num_deleted} righe eliminate.")
+        tmp_dir = self.path + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        _write_json(os.path.join(tmp_dir, "info.json"), {"dim": self.dim})
+        with open(os.path.join(tmp_dir, "vectors.f16"), "wb") as vf:
+            for start in range(0, len(order), _BLOCK_ROWS):
+                vf.write(np.asarray(self._vectors[order[start : start + _BLOCK_ROWS]]).tobytes())
+        self._norms[order].tofile(os.path.join(tmp_dir, "norms.f32"))
+        if self._codes_q is not None:
+            with open(os.path.join(tmp_dir, CODE_FILES[self.quantization]), "wb") as cf:
+                for start in range(0, len(order), _BLOCK_ROWS):
+                    cf.write(np.asarray(self._codes_q[order[start : start + _BLOCK_ROWS]]).tobytes())
+        if self._scales is not None:
+            self._scales[order].tofile(os.path.join(tmp_dir, SCALE_FILE))
+
+        ids, ends = [], array("q")
+        columns = {field: _Column() for field in self.filter_fields}
+        offset = 0
+        with open(os.path.join(tmp_dir, "docs.jsonl"), "wb") as df:
+            for row in order:
+                line = self._read_line(row)
+                df.write(line)
+                offset += len(line)
+                ids.append(self._ids[row])
+                ends.append(offset)
+                for field, column in columns.items():
+                    column.append(self._columns[field].value(row))
+
+        self._close()
+        self._ids, self._ends, self._columns = ids, ends, columns
+        self._alive = bytearray(b"\x01" * len(ids))
+        self._rows = {cid: row for row, cid in enumerate(ids)}
+        self._write_snapshot(tmp_dir)
+        self._deleted_since_snapshot = 0
+        if ivf is not None:
+            centroids, indptr = ivf
+            ivf_dir = os.path.join(tmp_dir, "ivf")
+            os.makedirs(ivf_dir)
+            np.save(os.path.join(ivf_dir, "centroids.npy"), centroids)
+            np.save(os.path.join(ivf_dir, "indptr.npy"), indptr)
+            _write_json(
+                os.path.join(ivf_dir, "ivf.json"), {"rows": len(ids), "lists": len(centroids)}
+            )
+
+        old_dir = self.path + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        os.replace(self.path, old_dir)
+        os.replace(tmp_dir, self.path)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self._open_matrix()
+        self._load_ivf()
+
+    def _build_ivf(self):
+        """
+        k-means su un campione delle righe vive, poi riscrittura della matrice
+        ordinata per lista: ogni lista è un intervallo contiguo di righe e la
+        query legge i vettori in sequenza invece che sparsi nel file.
+        """
+        alive = np.flatnonzero(self._alive_mask())
+        num_lists = max(1, int(_IVF_LISTS_PER_SQRT_ROW * np.sqrt(len(alive))))
+        rng = np.random.default_rng(0)
+        sample_size = min(
+            len(alive), num_lists * _KMEANS_SAMPLE_PER_LIST, _KMEANS_MAX_SAMPLE
+        )
+        num_lists = min(num_lists, sample_size)
+        sample_rows = np.sort(rng.choice(alive, sample_size, replace=False))
+        sample = np.asarray(self._vectors[sample_rows], dtype=np.float32)
+        centroids = _kmeans(sample, num_lists)
+
+        assign = np.empty(len(alive), dtype=np.int32)
+        for start in range(0, len(alive), _BLOCK_ROWS):
+            block_rows = alive[start : start + _BLOCK_ROWS]
+            block = np.asarray(self._vectors[block_rows], dtype=np.float32)
+            assign[start : start + len(block_rows)] = _nearest_centroid(block, centroids)
+        order = alive[np.argsort(assign, kind="stable")]
+        indptr = np.zeros(num_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=num_lists), out=indptr[1:])
+
+        self._rewrite(order, ivf=(centroids, indptr))
+        print(
+            f"Partizioni IVF di {self.collection_name}: {num_lists} liste "
+            f"su {len(alive)} vettori (nprobe={self.nprobe})."
+        )
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts,
+        embedding,
+        metadatas=None,
+        ids=None,
+        collection_name: str = "langchain",
+        persist_directory: str = CHROMA_DB_DIR,
+        **kwargs,
+    ):
+        store = cls(
+            collection_name,
+            embedding_function=embedding,
+            persist_directory=persist_directory,
+        )
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.persist()
+        return store
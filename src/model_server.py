@@ -0,0 +1,37 @@
+# src/model_server.py
+"""
+Assistente condiviso da tutto il processo.
+
+Modello di embedding, database vettoriale e LLM vengono caricati una sola
+volta e serviti a tutte le sessioni (ogni sessione Streamlit gira in un
+proprio thread dello stesso processo): la memoria non cresce con il numero
+di utenti e le sessioni dopo la prima sono pronte subito.
+
+Retrieval ed embedding delle domande possono procedere in parallelo; le
+generazioni dell'LLM passano una alla volta dallo scheduler di
+CodeAssistant (vedi src/scheduler.py), perché il contesto llama.cpp è uno solo.
+"""
+import threading
+
+from src.rag_pipeline import CodeAssistant
+
+_lock = threading.Lock()
+_assistant = None
+
+
+def get_code_assistant() -> CodeAssistant:
+    """
+    Restituisce l'assistente condiviso, creandolo alla prima chiamata.
+    Le chiamate concorrenti durante il caricamento attendono la stessa istanza;
+    se il caricamento fallisce, la chiamata successiva riprova.
+    """
+    global _assistant
+    if _assistant is None:
+        with _lock:
+            if _assistant is None:
+                _assistant = CodeAssistant()
+    return _assistant
+
+
+def is_loaded() -> bool:
+    return _assistant is not None
@@ -0,0 +1,116 @@
+# src/parse_cache.py
+"""
+Cache persistente dei risultati del parsing Java.
+
+La chiave è lo SHA del blob git del file: un file invariato tra due
+ingestioni (o tra due branch) non viene più analizzato con javalang. Lo SHA
+si calcola come fa git ("blob <size>\\0" + contenuto), quindi coincide con
+quello del repository e funziona anche per cartelle che non sono repo git.
+
+I record sono salvati come tuple serializzate con marshal e compresse con
+zlib. Quando cambia EXTRACTOR_VERSION le voci precedenti vengono scartate.
+"""
+import hashlib
+import marshal
+import zlib
+
+from diskcache import Cache
+
+from config import PARSE_CACHE_DIR, PARSE_CACHE_SIZE_LIMIT
+from src.java_parser import (
+    EXTRACTOR_VERSION,
+    ClassRecord,
+    FileRecords,
+    MethodRecord,
+    parse_java_sources,
+)
+
+_VERSION_KEY = "__extractor_version__"
+
+
+def git_blob_sha(data: bytes) -> str:
+    """SHA-1 del blob git per il contenuto indicato."""
+    header = b"blob %d\0" % len(data)
+    return hashlib.sha1(header + data).hexdigest()
+
+
+class ParseCache:
+    """Mappa SHA del blob -> FileRecords del file."""
+
+    def __init__(
+        self,
+        cache_dir: str = PARSE_CACHE_DIR,
+        size_limit: int = PARSE_CACHE_SIZE_LIMIT,
+    ):
+        self.cache = Cache(cache_dir, size_limit=size_limit)
+        self.hits = 0
+        self.misses = 0
+        if self.cache.get(_VERSION_KEY) != EXTRACTOR_VERSION:
+            # Estrattore cambiato: i record salvati non sono più validi
+            self.cache.clear()
+            self.cache.set(_VERSION_KEY, EXTRACTOR_VERSION)
+
+    def get(self, blob_sha: str):
+        packed = self.cache.get(blob_sha)
+        if packed is None:
+            return None
+        package, imports, methods, classes = marshal.loads(zlib.decompress(packed))
+        return FileRecords(
+            package,
+            imports,
+            [MethodRecord._make(t) for t in methods],
+            [ClassRecord._make(t) for t in classes],
+        )
+
+    def set(self, blob_sha: str, records: FileRecords):
+        packed = zlib.compress(
+            marshal.dumps(
+                (
+                    records.package,
+                    records.imports,
+                    [tuple(r) for r in records.methods],
+                    [tuple(r) for r in records.classes],
+                )
+            )
+        )
+        self.cache.set(blob_sha, packed)
+
+    def parse(self, sources, workers=None, executor=None):
+        """
+        Come parse_java_sources(), ma analizza solo i file non presenti in cache.
+        Ogni sorgente è (file_path, codice) oppure (file_path, codice, blob_sha)
+        quando lo SHA è già noto (es. letto dall'indice git).
+        """
+        sources = list(sources)
+        shas = [
+            s[2] if len(s) > 2 and s[2] else git_blob_sha(s[1].encode("utf-8"))
+            for s in sources
+        ]
+        results = [None] * len(sources)
+        missing = []
+        with self.cache.transact():
+            for i, sha in enumerate(shas):
+                results[i] = self.get(sha)
+                if results[i] is None:
+                    missing.append(i)
+        self.hits += len(sources) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            parsed = parse_java_sources(
+                [sources[i][:2] for i in missing], workers=workers, executor=executor
+            )
+            with self.cache.transact():
+                for i, records in zip(missing, parsed):
+                    # Anche i file non analizzabili (record vuoti) vengono salvati
+                    self.set(shas[i], records)
+                    results[i] = records
+        return results
+
+    def print_stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(
+            f"🧩 Cache parsing: {self.hits} file riutilizzati, {self.misses} analizzati "
+            f"({rate:.1%} hit rate)."
+        )
@@ -0,0 +1,98 @@
+# src/prompt_cache.py
+"""
+Riuso della KV cache di llama.cpp per il prefisso statico del prompt.
+
+Le istruzioni in testa al prompt della RAG sono identiche per ogni domanda:
+si valutano una volta all'avvio, si salva lo stato del contesto (KV cache)
+e lo si ripristina prima di ogni richiesta. llama-cpp-python riusa da solo
+i token iniziali già presenti nel contesto, quindi il prefill della
+richiesta elabora solo contesto e domanda.
+
+Con PROMPT_PREFIX_CACHE_PERSIST lo stato viene salvato anche su disco
+(PROMPT_CACHE_DIR) e i riavvii successivi saltano la valutazione del
+prefisso. La chiave dipende dal file del modello, da n_ctx, dalla versione
+di llama-cpp-python e dai token del prefisso.
+"""
+import hashlib
+import os
+import time
+
+from diskcache import Cache
+
+from config import (
+    PROMPT_PREFIX_CACHE_PERSIST,
+    PROMPT_CACHE_DIR,
+    PROMPT_CACHE_SIZE_LIMIT,
+)
+
+
+class PromptPrefixCache:
+    """
+    Stato di un'istanza llama_cpp.Llama dopo la valutazione di `prefix`.
+    L'istanza non va usata da più thread insieme: restore() e la generazione
+    che segue devono avvenire sotto lo stesso lock.
+    """
+
+    def __init__(
+        self,
+        llama,
+        prefix: str,
+        persist: bool = PROMPT_PREFIX_CACHE_PERSIST,
+        cache_dir: str = PROMPT_CACHE_DIR,
+        size_limit: int = PROMPT_CACHE_SIZE_LIMIT,
+    ):
+        self.llama = llama
+        # Stessa tokenizzazione di create_completion (BOS e token speciali)
+        self.tokens = llama.tokenize(prefix.encode("utf-8"), add_bos=True, special=True)
+        self.cache = Cache(cache_dir, size_limit=size_limit) if persist else None
+        self.state = None
+        self.restores = 0
+
+    def _key(self) -> str:
+        import llama_cpp
+
+        stat = os.stat(self.llama.model_path)
+        parts = [
+            os.path.basename(self.llama.model_path),
+            str(stat.st_size),
+            str(int(stat.st_mtime)),
+            str(self.llama.n_ctx()),
+            llama_cpp.__version__,
+            ",".join(map(str, self.tokens)),
+        ]
+        return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def warm(self):
+        """Valuta il prefisso, o carica lo stato salvato su disco, e lo conserva."""
+        started = time.perf_counter()
+        key = self._key() if self.cache is not None else None
+        state = self.cache.get(key) if key else None
+        if state is not None:
+            self.llama.load_state(state)
+            source = "caricato dal disco"
+        else:
+            self.llama.reset()
+            self.llama.eval(self.tokens)
+            state = self.llama.save_state()
+            if key:
+                self.cache.set(key, state)
+            source = "valutato"
+        self.state = state
+        print(
+            f"⚡ Prefisso del prompt: {len(self.tokens)} token, {source} in "
+            f"{time.perf_counter() - started:.2f}s."
+        )
+
+    def restore(self):
+        """
+        Da chiamare prima di ogni generazione. Se il contesto inizia ancora con
+        il prefisso (il caso normale, dopo un'altra domanda) non serve nulla;
+        altrimenti, es. dopo un prompt diverso, si ripristina lo stato salvato.
+        """
+        if self.state is None:
+            return
+        n = len(self.tokens)
+        if self.llama.n_tokens >= n and list(self.llama.input_ids[:n]) == self.tokens:
+            return
+        self.llama.load_state(self.state)
+        self.restores += 1
@@ -0,0 +1,49 @@
+# src/quantization.py
+"""
+Codici compatti degli embedding per la prima fase della ricerca vettoriale.
+
+- "int8": ogni vettore viene diviso per il suo massimo in valore assoluto e
+  arrotondato a interi in [-127, 127], con una scala float32 per riga
+  (1 byte per dimensione: metà del float16, un quarto del float32);
+- "binary": solo il segno di ogni dimensione, 8 dimensioni per byte
+  (1/16 del float16); la distanza è quella di Hamming tra i segni.
+
+I codici servono solo a scegliere i candidati: l'ordine finale si calcola
+sui vettori non quantizzati (rescoring dei migliori k * VECTOR_RESCORE_FACTOR).
+"""
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+# File dei codici di ogni modalità, accanto a vectors.f16
+CODE_FILES = {"int8": "codes.i8", "binary": "codes.bin"}
+SCALE_FILE = "scales.f32"
+
+
+def code_width(mode: str, dim: int) -> int:
+    """Byte per vettore dei codici."""
+    return dim if mode == "int8" else (dim + 7) // 8
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Restituisce (codici int8, scale float32 per riga)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def quantize_binary(vectors: np.ndarray) -> np.ndarray:
+    """Bit di segno impacchettati (uint8, 8 dimensioni per byte)."""
+    return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+
+def int8_dots(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Prodotti scalari approssimati tra la domanda e i vettori quantizzati."""
+    return (codes.astype(np.float32) @ query) * scales
+
+
+def hamming_distances(codes: np.ndarray, query_bits: np.ndarray) -> np.ndarray:
+    """Numero di segni diversi tra la domanda e ogni riga dei codici binari."""
+    return np.bitwise_count(codes ^ query_bits).sum(axis=1, dtype=np.float32)
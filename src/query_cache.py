@@ -0,0 +1,126 @@
+# src/query_cache.py
+"""
+Cache delle domande, su due livelli.
+
+1. QueryEmbeddingCache: LRU in memoria degli embedding delle domande, così una
+   domanda ripetuta non ricalcola l'embedding prima della ricerca.
+2. AnswerCache: cache persistente delle risposte. La chiave combina domanda
+   normalizzata, ID dei chunk recuperati, modello, versione del prompt e
+   versione dell'indice di ogni collezione interrogata: una nuova ingestione
+   incrementa la versione e le risposte precedenti non vengono più trovate.
+"""
+import re
+import json
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from diskcache import Cache
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    QUERY_EMBEDDING_CACHE_SIZE,
+    ANSWER_CACHE_DIR,
+    ANSWER_CACHE_SIZE_LIMIT,
+)
+
+
+def normalize_question(question: str) -> str:
+    """Minuscole, spazi compattati e senza punteggiatura finale."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = " ".join(text.split())
+    return re.sub(r"[\s?!.]+$", "", text)
+
+
+class QueryEmbeddingCache(Embeddings):
+    """
+    Avvolge un modello di embedding con una LRU per embed_query().
+    embed_documents() passa direttamente al modello.
+    """
+
+    def __init__(self, embeddings: Embeddings, max_size: int = QUERY_EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str):
+        # Solo gli spazi vengono normalizzati: l'embedding dipende dal testo esatto
+        key = " ".join(text.split())
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = tuple(vector)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class AnswerCache:
+    """Risposte generate, su disco con eviction LRU."""
+
+    def __init__(
+        self,
+        cache_dir: str = ANSWER_CACHE_DIR,
+        size_limit: int = ANSWER_CACHE_SIZE_LIMIT,
+    ):
+        self.cache = Cache(
+            cache_dir, size_limit=size_limit, eviction_policy="least-recently-used"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(question: str, chunk_ids, model: str, prompt_version, index_versions) -> str:
+        payload = json.dumps(
+            [
+                normalize_question(question),
+                # Stesso insieme di chunk = stessa evidenza, anche se in ordine diverso
+                sorted(chunk_ids),
+                model,
+                prompt_version,
+                sorted(index_versions.items()),
+            ],
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        answer = self.cache.get(key)
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def set(self, key: str, answer: str):
+        self.cache.set(key, answer)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+        }
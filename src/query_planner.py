@@ -0,0 +1,83 @@
+# src/query_planner.py
+"""
+Pianificatore delle query: ricava dalla domanda dei vincoli sui metadati dei
+chunk e li traduce in un filtro `where` di Chroma, così la ricerca vettoriale
+avviene solo sul sottoinsieme pertinente della collezione.
+
+Vincoli riconosciuti:
+- classi indicizzate nominate nella domanda ("la classe OrderService");
+- visibilità e static ("metodi pubblici", "private methods", "metodi statici");
+- tipo restituito ("che restituiscono ResponseEntity", "returns void");
+- nome del file ("nel file UserController.java").
+
+Se il filtro restituisce troppo pochi risultati, il retrieval completa con
+la ricerca senza filtro.
+"""
+import os
+import re
+
+_METHOD_WORD = re.compile(r"\b(?:metod[io]|methods?|funzion[ei])\b", re.IGNORECASE)
+_VISIBILITY = [
+    ("public", re.compile(r"\b(?:pubblic[oia]|pubbliche|public)\b", re.IGNORECASE)),
+    ("protected", re.compile(r"\b(?:protett[oia]|protette|protected)\b", re.IGNORECASE)),
+    ("private", re.compile(r"\b(?:privat[oia]|private)\b", re.IGNORECASE)),
+]
+_STATIC = re.compile(r"\b(?:static[oi]|statiche|static)\b", re.IGNORECASE)
+_RETURN_TYPE = re.compile(
+    r"\b(?:restituisc\w*|ritorn\w*|returns?|return type|tipo di ritorno)\s+"
+    r"(?:(?:un|uno|una|il|lo|la|i|gli|le|a|an|the)\s+)?[`'\"]?"
+    r"([A-Z][\w$]*|void|int|long|boolean|double|float|char|byte|short)\b"
+)
+_FILE = re.compile(r"([\w$][\w$./\\-]*\.java)\b")
+
+
+def file_names(question: str):
+    """Nomi dei file .java citati nella domanda, senza percorso e senza duplicati."""
+    return list(
+        dict.fromkeys(
+            os.path.basename(f.replace("\\", "/")) for f in _FILE.findall(question)
+        )
+    )
+
+
+def plan_query(question: str, symbol_index=None):
+    """
+    Restituisce (filtro where per Chroma o None, descrizione dei vincoli).
+    Le classi vengono filtrate solo se esistono nella tabella dei simboli,
+    per non azzerare i risultati con nomi inventati o scritti male.
+    """
+    conditions, described = [], []
+
+    classes = symbol_index.class_names(question) if symbol_index else []
+    if classes:
+        conditions.append(
+            {"class": classes[0]} if len(classes) == 1 else {"class": {"$in": classes}}
+        )
+        described.append(f"classe {', '.join(classes)}")
+
+    if _METHOD_WORD.search(question):
+        for visibility, pattern in _VISIBILITY:
+            if pattern.search(question):
+                conditions.append({"visibility": visibility})
+                described.append(visibility)
+                break
+        if _STATIC.search(question):
+            conditions.append({"is_static": True})
+            described.append("static")
+
+    match = _RETURN_TYPE.search(question)
+    if match:
+        conditions.append({"return_type": match.group(1)})
+        described.append(f"restituisce {match.group(1)}")
+
+    files = file_names(question)
+    if files:
+        conditions.append(
+            {"file_name": files[0]} if len(files) == 1 else {"file_name": {"$in": files}}
+        )
+        described.append(f"file {', '.join(files)}")
+
+    if not conditions:
+        return None, ""
+    where = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+    return where, "; ".join(described)
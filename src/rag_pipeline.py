@@ -1,127 +1,271 @@
 # src/rag_pipeline.py
-import os
-from langchain_community.vectorstores import Chroma
+import time
+import asyncio
+import threading
+from contextlib import aclosing, closing
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain.prompts import PromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.messages import HumanMessage, SystemMessage
-
-from config import CHROMA_DB_DIR, EMBEDDING_MODEL_NAME
+from langchain_core.documents import Document
+
+from config import (
+    CHROMA_DB_DIR,
+    CHROMA_COLLECTION_NAME,
+    EMBEDDING_MODEL_NAME,
+    REPO_NAME,
+    RETRIEVAL_K,
+    SYMBOL_INDEX_ENABLED,
+    QUERY_PLANNER_ENABLED,
+    QUERY_FILTER_MIN_RESULTS,
+    HIERARCHICAL_RETRIEVAL_ENABLED,
+    HIERARCHICAL_CLASS_K,
+    HYBRID_RETRIEVAL_ENABLED,
+    HYBRID_FETCH_K,
+    HYBRID_RRF_K,
+    HYBRID_LATENCY_BUDGET_MS,
+    GRAPH_EXPANSION_ENABLED,
+    GRAPH_EXPANSION_HOPS,
+    GRAPH_EXPANSION_MAX_CHUNKS,
+    RERANK_ENABLED,
+    RERANK_FETCH_K,
+    LLM_MODEL_NAME,
+    ANSWER_CACHE_ENABLED,
+    PROMPT_VERSION,
+    PROMPT_PREFIX_CACHE_ENABLED,
+)
 from src.llm_setup import load_local_llm
+from src.prompt_cache import PromptPrefixCache
+from src.scheduler import GenerationScheduler, question_priority
+from src.repositories import load_manifest, collection_for_repo
+from src.index_artifacts import (
+    load_symbol_index,
+    load_lexical_index,
+    load_call_graph,
+)
+from src.lexical_index import reciprocal_rank_fusion
+from src.context_packer import ContextPacker
+from src.query_planner import plan_query, file_names
+from src.query_cache import QueryEmbeddingCache, AnswerCache
+from src.index_state import index_versions
+from src.vector_store import open_vector_store, count_chunks
+from src.summary_index import SUMMARY_LEVELS, summary_collection
 
 
-class CodeAssistant:
-    def __init__(self):
-        print("Inizializzazione CodeAssistant...")
-        # 1. Carica il modello di embedding
-        # Ignoriamo il warning di deprecazione qui per il momento
-        self.embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+# Prompt della RAG diviso in due parti. Le istruzioni fisse stanno in testa e
+# sono identiche per ogni domanda: la loro KV cache viene calcolata una volta
+# e ripristinata a ogni richiesta (vedi src/prompt_cache.py), così il prefill
+# elabora solo contesto e domanda.
+RAG_PROMPT_PREFIX = """[INST]
+Sei un assistente AI esperto in Java e architettura backend.
 
-        # 2. Carica il database vettoriale ChromaDB persistente
-        try:
-            self.vectorstore = Chroma(
-                persist_directory=CHROMA_DB_DIR, embedding_function=self.embeddings
-            )
-            print(f"Database vettoriale caricato da {CHROMA_DB_DIR}")
-        except Exception as e:
-            print(f"Errore durante il caricamento di ChromaDB: {e}")
-            print(
-                "Assicurati che il database sia stato creato correttamente nella fase di ingestione."
-            )
-            raise
+Rispondi **solo** basandoti sul codice fornito nel CONTEXT.  
+Le risposte devono essere:
 
-        # 3. Carica il modello LLM locale
-        # n_gpu_layers=-1 è per il tuo Mac M3
-        self.llm = load_local_llm(n_gpu_layers=-1)
+- **Molto tecniche e dettagliate:** analizza annotazioni, validazioni, eccezioni, chiamate a repository, tabelle e colonne modificate.  
+- **Strutturate e formattate in Markdown:** con titoli, tabelle, elenco numerato e blocchi di codice se serve.  
+- **Complete:** non saltare nulla di importante.  
+- **Vincolate al contesto:** non inventare nulla, se manca un'informazione scrivi chiaramente che non è presente.  
 
-        # 4. Definisci il template del prompt per la RAG
-        # Questo template istruisce l'LLM su come rispondere
-        # OLD: ChatPromptTemplate.from_messages([SystemMessage(content=(""))
-        self.rag_prompt_template = ChatPromptTemplate.from_template(
-            """
-            [INST]
-            Sei un assistente AI esperto in Java e architettura backend.
+---
 
-            Rispondi **solo** basandoti sul codice fornito nel CONTEXT.  
-            Le risposte devono essere:
+### Quando la domanda riguarda un metodo:
 
-            - **Molto tecniche e dettagliate:** analizza annotazioni, validazioni, eccezioni, chiamate a repository, tabelle e colonne modificate.  
-            - **Strutturate e formattate in Markdown:** con titoli, tabelle, elenco numerato e blocchi di codice se serve.  
-            - **Complete:** non saltare nulla di importante.  
-            - **Vincolate al contesto:** non inventare nulla, se manca un'informazione scrivi chiaramente che non è presente.  
+**1. Informazioni generali**
 
-            ---
+- **Classe:** `NomeClasse` (in grassetto)  
+- **Metodo:** `NomeMetodo` (in grassetto)  
+- **Ruolo:** Controller, Service, Repository o altro  
+- **Endpoint HTTP (se API):**  
+- Path API (es. `@RequestMapping("/api/users")`)  
+- Metodo HTTP (es. `@GetMapping`, `POST`, ecc.)  
 
-            ### Quando la domanda riguarda un metodo:
+**2. Parametri**
 
-            **1. Informazioni generali**
+| Tipo        | Nome      | Annotazioni              |
+|-------------|-----------|-------------------------|
+| DTO         | userDto   | @Valid, @RequestBody    |
+| PathVariable| id        | @PathVariable           |
 
-            - **Classe:** `NomeClasse` (in grassetto)  
-            - **Metodo:** `NomeMetodo` (in grassetto)  
-            - **Ruolo:** Controller, Service, Repository o altro  
-            - **Endpoint HTTP (se API):**  
-            - Path API (es. `@RequestMapping("/api/users")`)  
-            - Metodo HTTP (es. `@GetMapping`, `POST`, ecc.)  
+Descrivi la struttura completa del DTO di input (campi e tipo dati).
 
-            **2. Parametri**
+**3. Logica interna del metodo**
 
-            | Tipo        | Nome      | Annotazioni              |
-            |-------------|-----------|-------------------------|
-            | DTO         | userDto   | @Valid, @RequestBody    |
-            | PathVariable| id        | @PathVariable           |
+- Spiega in modo dettagliato ogni passo del flusso, indicando:  
+- Controlli eseguiti (es. validazioni, controlli nullità)  
+- Chiamate ad altri metodi o repository (es. `userRepository.save(user)`)  
+- Gestione delle eccezioni e errori previsti  
+- Validazioni con annotazioni o logica custom  
 
-            Descrivi la struttura completa del DTO di input (campi e tipo dati).
+**4. Persistenza e database**
 
-            **3. Logica interna del metodo**
+- Indica la/e tabella/e coinvolta/e  
+- Tipo di operazione (INSERT, UPDATE, DELETE, MERGE)  
+- Colonne o campi modificati o letti  
+- Query SQL o annotazioni JPA usate (es. `@Column`, `@Table`, query custom)  
 
-            - Spiega in modo dettagliato ogni passo del flusso, indicando:  
-            - Controlli eseguiti (es. validazioni, controlli nullità)  
-            - Chiamate ad altri metodi o repository (es. `userRepository.save(user)`)  
-            - Gestione delle eccezioni e errori previsti  
-            - Validazioni con annotazioni o logica custom  
+**5. Output**
 
-            **4. Persistenza e database**
+- Tipo restituito (es. `ResponseEntity<UserDto>`)  
+- Status HTTP previsto (es. `201 CREATED`)  
+- Descrizione e struttura del DTO di risposta  
+- Esempio realistico di JSON di output  
 
-            - Indica la/e tabella/e coinvolta/e  
-            - Tipo di operazione (INSERT, UPDATE, DELETE, MERGE)  
-            - Colonne o campi modificati o letti  
-            - Query SQL o annotazioni JPA usate (es. `@Column`, `@Table`, query custom)  
+---
 
-            **5. Output**
+### Se mancano informazioni:
 
-            - Tipo restituito (es. `ResponseEntity<UserDto>`)  
-            - Status HTTP previsto (es. `201 CREATED`)  
-            - Descrizione e struttura del DTO di risposta  
-            - Esempio realistico di JSON di output  
+Scrivi chiaramente:  
+_"Il contesto fornito non contiene abbastanza informazioni per rispondere in modo completo."_
 
-            ---
+---
 
-            ### Se mancano informazioni:
+### Requisiti di stile
 
-            Scrivi chiaramente:  
-            _"Il contesto fornito non contiene abbastanza informazioni per rispondere in modo completo."_
+- Usa **grassetto** per classi, metodi, nomi di tabelle e annotazioni.  
+- Rispondi in sezioni chiare come sopra, con titoli Markdown.  
+- Non usare linguaggio generico o descrizioni astratte.  
+- Non omettere mai riferimenti a database o tabelle se presenti nel codice.  
 
-            ---
+Rispondi nella lingua della domanda.
 
-            ### Requisiti di stile
+Contesto:
+"""
+RAG_PROMPT_SUFFIX = """{context}
 
-            - Usa **grassetto** per classi, metodi, nomi di tabelle e annotazioni.  
-            - Rispondi in sezioni chiare come sopra, con titoli Markdown.  
-            - Non usare linguaggio generico o descrizioni astratte.  
-            - Non omettere mai riferimenti a database o tabelle se presenti nel codice.  
+Domanda:
+{question}
+[/INST]
+"""
 
-            Rispondi nella lingua della domanda.
 
-            Contesto:  
-            {context}
+def _resolve_collections(repos=None) -> dict:
+    """
+    Restituisce {nome repository: collezione del database vettoriale}. Senza
+    `repos` usa tutti i repository del manifest, oppure la collezione singola
+    se il manifest manca.
+    """
+    if repos is None:
+        repos = [entry["name"] for entry in load_manifest()]
+    if repos:
+        return {name: collection_for_repo(name) for name in repos}
+    return {REPO_NAME or CHROMA_COLLECTION_NAME: CHROMA_COLLECTION_NAME}
 
-            Domanda:  
-            {question}
-            [/INST]
 
-            """
+class CodeAssistant:
+    def __init__(self, repos=None):
+        """
+        Args:
+            repos: nomi dei repository del manifest da interrogare
+                   (None = tutti, o la collezione singola senza manifest).
+        """
+        print("Inizializzazione CodeAssistant...")
+        # 1. Carica il modello di embedding
+        # Ignoriamo il warning di deprecazione qui per il momento
+        # Gli embedding delle domande ripetute vengono presi da una LRU in memoria
+        self.embeddings = QueryEmbeddingCache(
+            HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
         )
+        # Risposte già generate, valide finché indice, modello e prompt non cambiano
+        self.answer_cache = AnswerCache() if ANSWER_CACHE_ENABLED else None
+
+        # 2. Carica il database vettoriale persistente (una collezione per repo,
+        # backend scelto con VECTOR_BACKEND)
+        collections = _resolve_collections(repos)
+        self.collections = collections
+        try:
+            self.vectorstores = {
+                name: open_vector_store(collection, self.embeddings, CHROMA_DB_DIR)
+                for name, collection in collections.items()
+            }
+            self.vectorstore = next(iter(self.vectorstores.values()))
+            # Tabelle dei simboli per il recupero diretto di classi e metodi
+            self.symbol_indexes = (
+                {
+                    name: load_symbol_index(collection, CHROMA_DB_DIR)
+                    for name, collection in collections.items()
+                }
+                if SYMBOL_INDEX_ENABLED
+                else {}
+            )
+            # Indici BM25 per la ricerca ibrida
+            self.lexical_indexes = (
+                {
+                    name: load_lexical_index(collection, CHROMA_DB_DIR)
+                    for name, collection in collections.items()
+                }
+                if HYBRID_RETRIEVAL_ENABLED
+                else {}
+            )
+            # Call graph per espandere i risultati a chiamati e chiamanti
+            self.call_graphs = (
+                {
+                    name: load_call_graph(collection, CHROMA_DB_DIR)
+                    for name, collection in collections.items()
+                }
+                if GRAPH_EXPANSION_ENABLED
+                else {}
+            )
+            # Riassunti di classi e file per la ricerca per livelli (se indicizzati)
+            self.summary_stores = {}
+            if HIERARCHICAL_RETRIEVAL_ENABLED:
+                for name, collection in collections.items():
+                    levels = {
+                        level: open_vector_store(
+                            summary_collection(collection, level),
+                            self.embeddings,
+                            CHROMA_DB_DIR,
+                        )
+                        for level in SUMMARY_LEVELS.values()
+                    }
+                    if count_chunks(levels["classes"]):
+                        self.summary_stores[name] = levels
+            # Un thread in più per il BM25, che gira accanto alle ricerche vettoriali
+            self._search_pool = ThreadPoolExecutor(
+                max_workers=min(8, len(self.vectorstores)) + 1
+            )
+            print(
+                f"Database vettoriale caricato da {CHROMA_DB_DIR} "
+                f"({len(self.vectorstores)} collezioni)"
+            )
+        except Exception as e:
+            print(f"Errore durante il caricamento del database vettoriale: {e}")
+            print(
+                "Assicurati che il database sia stato creato correttamente nella fase di ingestione."
+            )
+            raise
+
+        # Cross-encoder opzionale per riordinare i candidati del retrieval
+        self.reranker = None
+        if RERANK_ENABLED:
+            from src.reranker import Reranker
+
+            self.reranker = Reranker()
+
+        # 3. Carica il modello LLM locale
+        # Parametri dal profilo hardware (python src/autotune.py), se presente
+        self.llm = load_local_llm()
+        # Un solo contesto llama.cpp per tutte le sessioni (vedi src/model_server.py):
+        # le generazioni passano dallo scheduler, una alla volta, mentre retrieval
+        # ed embedding delle richieste in coda procedono in parallelo
+        self.scheduler = GenerationScheduler()
+        # Il contesto viene riempito contando i token con il tokenizer del modello
+        self.context_packer = ContextPacker(
+            self.llm.get_num_tokens, self.llm.n_ctx, self.llm.max_tokens
+        )
+
+        # 4. Template del prompt per la RAG: istruzioni fisse in testa, poi
+        # contesto e domanda (vedi RAG_PROMPT_PREFIX)
+        self.rag_prompt_template = PromptTemplate.from_template(
+            RAG_PROMPT_PREFIX + RAG_PROMPT_SUFFIX
+        )
+        # KV cache delle istruzioni, calcolata (o letta dal disco) una volta sola
+        self.prompt_prefix_cache = None
+        if PROMPT_PREFIX_CACHE_ENABLED:
+            self.prompt_prefix_cache = PromptPrefixCache(self.llm.client, RAG_PROMPT_PREFIX)
+            self.prompt_prefix_cache.warm()
 
         # 5. Crea la pipeline RAG
         # retriever: ricerca i chunk di codice più rilevanti nel DB vettoriale
@@ -129,24 +273,532 @@ class CodeAssistant:
         # chain: combina il retriever, il prompt e l'LLM
         self.rag_chain = (
             {
-                "context": self.vectorstore.as_retriever(),
-                "question": RunnablePassthrough(),
+                "context": RunnableLambda(
+                    lambda x: self.build_context(x["question"], x["docs"])
+                ),
+                "question": itemgetter("question"),
             }
             | self.rag_prompt_template
+            | RunnableLambda(self._restore_prompt_prefix)
             | self.llm
             | StrOutputParser()
         )
         print("CodeAssistant inizializzato e pipeline RAG pronta.")
 
-    def ask_codebase(self, question: str) -> str:
+    def _restore_prompt_prefix(self, prompt):
+        """Passo della chain: rimette la KV cache del prefisso prima della generazione."""
+        if self.prompt_prefix_cache is not None:
+            self.prompt_prefix_cache.restore()
+        return prompt
+
+    def count_indexed_chunks(self) -> int:
+        """Numero totale di chunk indicizzati nelle collezioni interrogate."""
+        return sum(count_chunks(vs) for vs in self.vectorstores.values())
+
+    def _fetch_chunks(self, stores: dict, keys):
+        """
+        Legge dal database vettoriale i chunk indicati come [(repository, chunk_id)],
+        restituendo i Document nello stesso ordine.
+        """
+        found_docs = {}
+        for name in stores:
+            ids = [cid for n, cid in keys if n == name]
+            if not ids:
+                continue
+            found = stores[name].get(ids=ids, include=["documents", "metadatas"])
+            for cid, text, meta in zip(found["ids"], found["documents"], found["metadatas"]):
+                found_docs[(name, cid)] = Document(
+                    page_content=text, metadata={**meta, "repo": name}
+                )
+        return [found_docs[key] for key in keys if key in found_docs]
+
+    def _retrieve_symbols(self, question: str, stores: dict, k: int):
+        """
+        Recupera per ID i chunk delle classi/metodi nominati nella domanda,
+        usando la tabella dei simboli di ogni collezione (nessun embedding).
+        """
+        matches = []
+        for name in stores:
+            index = self.symbol_indexes.get(name)
+            if index:
+                # Con il planner le classi nominate diventano un filtro della ricerca
+                # vettoriale: qui si prendono direttamente solo i metodi
+                matches.extend(
+                    (score, name, cid)
+                    for cid, score in index.match_question(
+                        question, include_classes=not QUERY_PLANNER_ENABLED
+                    )
+                )
+        if not matches:
+            return []
+        # Ordinamento stabile: a parità di punteggio resta l'ordine delle collezioni
+        matches.sort(key=lambda m: -m[0])
+        return self._fetch_chunks(stores, [(name, cid) for _, name, cid in matches[:k]])
+
+    def _search_store(self, store, query_vector, k: int, where=None):
+        """
+        Cerca in una collezione con il filtro `where`; se i risultati filtrati
+        sono meno di QUERY_FILTER_MIN_RESULTS completa con la ricerca senza
+        filtro. Restituisce [(priorità, distanza, Document)]: i risultati
+        filtrati (priorità 0) precedono quelli di riserva.
+        """
+        search = store.similarity_search_by_vector_with_relevance_scores
+        if where is None:
+            return [(0, distance, doc) for doc, distance in search(query_vector, k=k)]
+        hits = [(0, distance, doc) for doc, distance in search(query_vector, k=k, filter=where)]
+        if len(hits) < QUERY_FILTER_MIN_RESULTS:
+            found = {doc.metadata.get("chunk_id") or doc.page_content for _, _, doc in hits}
+            hits += [
+                (1, distance, doc)
+                for doc, distance in search(query_vector, k=k)
+                if (doc.metadata.get("chunk_id") or doc.page_content) not in found
+            ]
+        return hits
+
+    def _vector_search(self, question: str, stores: dict, k: int, plans=None):
+        """
+        Ricerca vettoriale: restituisce [(repository, Document, filtrato)] per
+        distanza, con prima i risultati che rispettano il filtro.
+        La domanda viene trasformata in embedding una sola volta; con più
+        collezioni le ricerche partono in parallelo e i risultati sono uniti
+        per distanza. `plans` indica il filtro where di ogni collezione.
+        """
+        plans = plans or {}
+        query_vector = self.embeddings.embed_query(question)
+        names = list(stores)
+        if len(names) == 1:
+            name = names[0]
+            per_store = [self._search_store(stores[name], query_vector, k, plans.get(name))]
+        else:
+            per_store = self._search_pool.map(
+                lambda n: self._search_store(stores[n], query_vector, k, plans.get(n)),
+                names,
+            )
+        results = [
+            (priority, distance, name, doc)
+            for name, hits in zip(names, per_store)
+            for priority, distance, doc in hits
+        ]
+        results.sort(key=lambda r: (r[0], r[1]))
+        return [(name, doc, priority == 0) for priority, _, name, doc in results]
+
+    def _plan_filters(self, question: str, stores: dict):
+        """Filtri where ricavati dalla domanda per ogni collezione."""
+        if not QUERY_PLANNER_ENABLED:
+            return {}
+        plans = {}
+        for name in stores:
+            where, described = plan_query(question, self.symbol_indexes.get(name))
+            if where is not None:
+                plans[name] = where
+                print(f"Filtro su {name}: {described}")
+        return plans
+
+    def _select_classes(self, question: str, stores: dict, plans: dict):
+        """
+        Primo livello della ricerca per livelli, per ogni collezione con i riassunti:
+        - se la domanda nomina classi indicizzate o file .java se ne prendono
+          direttamente i riassunti (il planner filtra già i metodi);
+        - altrimenti si scelgono le HIERARCHICAL_CLASS_K classi più vicine alla
+          domanda e la ricerca dei metodi viene limitata a quelle.
+        Restituisce (riassunti nominati, riassunti scelti, filtri where aggiornati).
+        """
+        named, chosen, plans = [], [], dict(plans)
+        for name in stores:
+            levels = self.summary_stores.get(name)
+            if levels is None:
+                continue
+            index = self.symbol_indexes.get(name)
+            targets = [
+                ("classes", "class", index.class_names(question) if index else []),
+                ("files", "file_name", file_names(question)),
+            ]
+            if any(values for _, _, values in targets):
+                for level, field, values in targets:
+                    if not values:
+                        continue
+                    found = levels[level].get(
+                        where={field: {"$in": values}}, include=["documents", "metadatas"]
+                    )
+                    named += [
+                        Document(page_content=text, metadata={**meta, "repo": name})
+                        for text, meta in zip(found["documents"], found["metadatas"])
+                    ]
+                continue
+
+            hits = levels["classes"].similarity_search_by_vector_with_relevance_scores(
+                self.embeddings.embed_query(question), k=HIERARCHICAL_CLASS_K
+            )
+            if not hits:
+                continue
+            for doc, _ in hits:
+                doc.metadata["repo"] = name
+                chosen.append(doc)
+            classes = list(dict.fromkeys(doc.metadata["class"] for doc, _ in hits))
+            where = {"class": {"$in": classes}}
+            plans[name] = {"$and": [plans[name], where]} if name in plans else where
+            print(f"Classi scelte su {name}: {', '.join(classes)}")
+        return named, chosen, plans
+
+    def _lexical_search(self, question: str, stores: dict, k: int):
+        """Ricerca BM25: restituisce [(repository, chunk_id)] per punteggio."""
+        results = [
+            (score, name, cid)
+            for name in stores
+            if self.lexical_indexes.get(name)
+            for cid, score in self.lexical_indexes[name].search(question, k)
+        ]
+        results.sort(key=lambda r: -r[0])
+        return [(name, cid) for _, name, cid in results[:k]]
+
+    def _expand_call_graph(self, docs, stores: dict, hops: int, budget: int):
+        """
+        Aggiunge ai chunk recuperati i metodi chiamati e chiamanti fino a
+        `hops` passi nel call graph, al massimo `budget` chunk in più.
+        """
+        seeds = {}
+        for doc in docs:
+            seeds.setdefault(doc.metadata["repo"], []).append(doc.metadata.get("chunk_id"))
+        keys = []
+        for name, chunk_ids in seeds.items():
+            graph = self.call_graphs.get(name)
+            if graph:
+                found = graph.expand(chunk_ids, hops, budget - len(keys))
+                keys.extend((name, cid) for cid in found)
+            if len(keys) >= budget:
+                break
+        return self._fetch_chunks(stores, keys)
+
+    def retrieve(
+        self,
+        question: str,
+        repos=None,
+        k: int = RETRIEVAL_K,
+        expand_hops: int = GRAPH_EXPANSION_HOPS,
+    ):
+        """
+        Recupera i chunk più rilevanti dalle collezioni selezionate.
+        Prima prende direttamente i chunk dei simboli nominati nella domanda
+        (es. 'UserService', processOrder), poi completa con la ricerca
+        vettoriale, che viene saltata se i simboli bastano già a riempire i k posti.
+
+        La ricerca vettoriale usa i filtri sui metadati ricavati dalla domanda
+        (classe, visibilità, tipo restituito, file), con ripiego sulla ricerca
+        senza filtro se i risultati filtrati sono troppo pochi.
+
+        Con la ricerca ibrida il BM25 gira in parallelo alla ricerca vettoriale
+        e le due classifiche vengono unite con la Reciprocal Rank Fusion; se il
+        BM25 non termina entro HYBRID_LATENCY_BUDGET_MS si usa solo il vettoriale.
+        Con il reranking abilitato si recuperano RERANK_FETCH_K candidati e il
+        cross-encoder sceglie i migliori k.
+
+        Con `expand_hops` > 0 ai risultati si aggiungono i metodi collegati nel
+        call graph (es. controller -> service -> repository), fino a
+        GRAPH_EXPANSION_MAX_CHUNKS chunk: un flusso completo in un solo passaggio.
+
+        Con la ricerca per livelli si scelgono prima le classi dai loro riassunti
+        e i metodi si cercano solo dentro quelle classi. I riassunti si aggiungono
+        ai k chunk: in testa quelli di classi e file nominati nella domanda, dopo
+        i metodi quelli delle classi scelte dalla ricerca.
+        """
+        started = time.perf_counter()
+        stores = self.vectorstores
+        if repos:
+            stores = {n: vs for n, vs in self.vectorstores.items() if n in repos}
+            missing = set(repos) - set(stores)
+            if missing:
+                print(f"Repository non caricati, ignorati: {', '.join(sorted(missing))}")
+
+        docs = self._retrieve_symbols(question, stores, k)
+        plans = self._plan_filters(question, stores)
+        named_summaries, chosen_summaries = [], []
+        if self.summary_stores and len(docs) < k:
+            named_summaries, chosen_summaries, plans = self._select_classes(
+                question, stores, plans
+            )
+        if len(docs) < k and self.reranker is not None:
+            # I simboli nominati restano in testa; il resto viene riordinato
+            exact = len(docs)
+            candidates = self._retrieve_ranked(
+                question, stores, exact + max(RERANK_FETCH_K, k), list(docs), started, plans
+            )[exact:]
+            docs += self.reranker.rerank(question, candidates, k - exact)
+            print(
+                f"Reranking di {len(candidates)} candidati in "
+                f"{self.reranker.last_latency_ms:.0f} ms."
+            )
+        elif len(docs) < k:
+            docs = self._retrieve_ranked(question, stores, k, docs, started, plans)
+        expanded = []
+        if expand_hops > 0 and self.call_graphs:
+            expanded = self._expand_call_graph(
+                docs, stores, expand_hops, GRAPH_EXPANSION_MAX_CHUNKS
+            )
+        return named_summaries + docs + chosen_summaries + expanded
+
+    def _retrieve_ranked(
+        self, question: str, stores: dict, k: int, docs, started, plans=None
+    ):
+        """
+        Completa `docs` fino a k chunk con ricerca vettoriale e BM25 (RRF).
+        `plans` sono i filtri where per collezione (ricavati qui se mancano).
+        """
+        seen = {(d.metadata["repo"], d.metadata.get("chunk_id")) for d in docs}
+
+        hybrid = any(self.lexical_indexes.get(name) for name in stores)
+        fetch_k = max(k, HYBRID_FETCH_K) if hybrid else k
+        lexical_future = (
+            self._search_pool.submit(self._lexical_search, question, stores, fetch_k)
+            if hybrid
+            else None
+        )
+        if plans is None:
+            plans = self._plan_filters(question, stores)
+        vector_results = self._vector_search(question, stores, fetch_k, plans)
+
+        lexical_results = []
+        if lexical_future is not None:
+            remaining = HYBRID_LATENCY_BUDGET_MS / 1000 - (time.perf_counter() - started)
+            try:
+                lexical_results = lexical_future.result(timeout=max(remaining, 0))
+            except TimeoutError:
+                print("BM25 oltre il budget di latenza: uso solo la ricerca vettoriale.")
+
+        vector_docs, matching = {}, set()
+        for name, doc, filtered in vector_results:
+            doc.metadata["repo"] = name
+            # I chunk senza ID stabile (indici vecchi) restano distinti per contenuto
+            key = (name, doc.metadata.get("chunk_id") or doc.page_content)
+            vector_docs.setdefault(key, doc)
+            if filtered and name in plans:
+                matching.add(key)
+        ranked = reciprocal_rank_fusion(
+            [list(vector_docs), lexical_results], k=HYBRID_RRF_K
+        )
+        if matching:
+            # I chunk che rispettano il filtro precedono gli altri (ordinamento stabile)
+            ranked.sort(key=lambda key: key not in matching)
+        ranked = [key for key in ranked if key not in seen][: k - len(docs)]
+
+        lexical_only = self._fetch_chunks(
+            stores, [key for key in ranked if key not in vector_docs]
+        )
+        lexical_docs = {(d.metadata["repo"], d.metadata.get("chunk_id")): d for d in lexical_only}
+        for key in ranked:
+            doc = vector_docs.get(key) or lexical_docs.get(key)
+            if doc is not None:
+                docs.append(doc)
+        return docs
+
+    def build_context(self, question: str, docs) -> str:
+        """
+        Impacchetta i chunk recuperati nel budget di token rimasto:
+        n_ctx - token della risposta - token del prompt senza contesto.
+        """
+        budget = self.context_packer.budget(
+            self.rag_prompt_template.format(context="", question=question)
+        )
+        context, num_blocks, used = self.context_packer.pack(docs, budget)
+        print(
+            f"Contesto: {len(docs)} chunk -> {num_blocks} blocchi, "
+            f"{used}/{budget} token."
+        )
+        return context
+
+    def _answer_cache_key(self, question: str, docs, repos=None) -> str:
+        names = [n for n in self.collections if not repos or n in repos]
+        return AnswerCache.make_key(
+            question,
+            [f"{d.metadata.get('repo')}/{d.metadata.get('chunk_id')}" for d in docs],
+            LLM_MODEL_NAME,
+            PROMPT_VERSION,
+            index_versions(self.collections[n] for n in names),
+        )
+
+    def cache_stats(self) -> dict:
+        """Statistiche delle cache di embedding delle domande e delle risposte."""
+        return {
+            "query_embeddings": self.embeddings.stats(),
+            "answers": self.answer_cache.stats() if self.answer_cache else None,
+        }
+
+    def _cached_answer(self, question: str, docs, repos=None):
+        """(chiave della cache delle risposte o None, risposta salvata o None)."""
+        if self.answer_cache is None:
+            return None, None
+        cache_key = self._answer_cache_key(question, docs, repos)
+        return cache_key, self.answer_cache.get(cache_key)
+
+    def enqueue(self, question: str, user=None):
+        """
+        Prenota il turno di generazione per una domanda (vedi src/scheduler.py).
+        Va chiamato prima del retrieval, che così procede mentre si è in coda.
+        Non rifiuta mai: SchedulerFull arriva solo quando, mancata la cache
+        delle risposte, il ticket entra fra i pronti per la generazione.
+        """
+        return self.scheduler.submit(user, question_priority(question))
+
+    def ask_codebase(self, question: str, repos=None, user=None) -> str:
         """
         Interroga la codebase con una domanda usando la pipeline RAG.
+        `repos` limita la ricerca ad alcuni repository del manifest.
+        Se la stessa domanda ha già avuto risposta con gli stessi chunk e lo
+        stesso indice, la risposta viene presa dalla cache.
         """
         print(f"\nDomanda: {question}")
-        response = self.rag_chain.invoke(question)
+        started = time.perf_counter()
+        ticket = self.enqueue(question, user)
+        try:
+            docs = self.retrieve(question, repos)
+
+            cache_key, cached = self._cached_answer(question, docs, repos)
+            if cached is not None:
+                print(
+                    f"Risposta dalla cache in {(time.perf_counter() - started) * 1000:.0f} ms."
+                )
+                return cached
+
+            with ticket:
+                print(f"In coda per {ticket.waited:.1f}s.")
+                response = self.rag_chain.invoke({"question": question, "docs": docs})
+        finally:
+            ticket.release()
+        if cache_key is not None:
+            self.answer_cache.set(cache_key, response)
         print("Risposta generata.")
         return response
 
+    async def aretrieve(self, question: str, repos=None):
+        """retrieve() in un thread, così l'event loop resta libero per le altre richieste."""
+        return await asyncio.to_thread(self.retrieve, question, repos)
+
+    async def aanswer(self, question: str, docs, repos=None, ticket=None) -> str:
+        """
+        Versione asincrona della generazione di ask_codebase(), a partire dai
+        chunk già recuperati: attesa del turno e generazione non bloccano
+        l'event loop. Il ticket passa al thread di generazione (vedi
+        astream_answer), che lo libera quando ha finito.
+        """
+        async with aclosing(self.astream_answer(question, docs, repos, ticket)) as stream:
+            return "".join([chunk async for chunk in stream])
+
+    def stream_answer(self, question: str, docs, repos=None, ticket=None, on_wait=None):
+        """
+        Genera la risposta a pezzi, man mano che l'LLM produce i token, a
+        partire dai chunk già recuperati con retrieve(): chi chiama può
+        mostrare le fonti prima ancora che inizi la generazione. Il primo
+        pezzo arriva dopo il solo prefill del prompt.
+
+        `ticket` è il turno prenotato con enqueue() prima del retrieval (se
+        manca se ne prende uno ora); `on_wait(ticket)` viene chiamata ogni
+        mezzo secondo finché si resta in coda. Se la coda dei ticket pronti è
+        piena solleva SchedulerFull prima del primo pezzo. Annullare il ticket
+        ferma la generazione al pezzo successivo.
+
+        La risposta completa finisce nella cache delle risposte; se il
+        generatore viene chiuso o annullato prima della fine non si salva nulla.
+        """
+        started = time.perf_counter()
+        ticket = ticket or self.enqueue(question)
+        try:
+            cache_key, cached = self._cached_answer(question, docs, repos)
+            if cached is not None:
+                print("Risposta dalla cache.")
+                yield cached
+                return
+
+            while not ticket.acquire(timeout=0.5 if on_wait else None):
+                on_wait(ticket)
+            print(f"In coda per {ticket.waited:.1f}s.")
+            parts = []
+            # Il turno resta preso fino alla fine dello stream (o alla chiusura del generatore)
+            with closing(self.rag_chain.stream({"question": question, "docs": docs})) as stream:
+                for chunk in stream:
+                    if ticket.cancelled:
+                        print("Generazione annullata.")
+                        return
+                    if not parts:
+                        print(f"Primo token dopo {(time.perf_counter() - started) * 1000:.0f} ms.")
+                    parts.append(chunk)
+                    yield chunk
+        finally:
+            ticket.release()
+        if cache_key is not None:
+            self.answer_cache.set(cache_key, "".join(parts))
+        print(f"Risposta generata in {time.perf_counter() - started:.1f}s.")
+
+    async def astream_answer(self, question: str, docs, repos=None, ticket=None):
+        """
+        Versione asincrona di stream_answer(). La generazione gira in un
+        thread dedicato che possiede il ticket: attende il turno, esegue
+        stream_answer() e libera l'LLM solo dopo essere uscito da llama.cpp.
+        Se chi consuma si ferma (es. client SSE disconnesso) il ticket viene
+        annullato, ma l'LLM resta occupato finché il thread non ha chiuso lo
+        stream: l'istanza Llama non è thread-safe e non deve passare a
+        un'altra richiesta mentre sta ancora generando.
+        """
+        ticket = ticket or self.enqueue(question)
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def send(item):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+            except RuntimeError:
+                pass  # Event loop già chiuso: nessuno legge più
+
+        def generate():
+            try:
+                for chunk in self.stream_answer(question, docs, repos, ticket):
+                    send((chunk, None))
+            except BaseException as e:
+                send((None, e))
+            else:
+                send((None, None))
+
+        producer = threading.Thread(target=generate, name="llm-generation", daemon=True)
+        producer.start()
+        finished = False
+        try:
+            while True:
+                chunk, error = await queue.get()
+                if chunk is None:
+                    finished = True
+                    if error is not None:
+                        raise error
+                    return
+                yield chunk
+        finally:
+            if not finished:
+                ticket.cancel()
+
+    def stream_codebase(self, question: str, repos=None, user=None):
+        """Come ask_codebase(), ma genera la risposta a pezzi (vedi stream_answer)."""
+        print(f"\nDomanda: {question}")
+        ticket = self.enqueue(question, user)
+        try:
+            docs = self.retrieve(question, repos)
+        except BaseException:
+            ticket.release()
+            raise
+        yield from self.stream_answer(question, docs, repos, ticket)
+
+    async def astream_codebase(self, question: str, repos=None, user=None):
+        """
+        Versione asincrona di stream_codebase(): il retrieval gira in un thread,
+        così l'event loop resta libero per le altre richieste.
+        """
+        print(f"\nDomanda: {question}")
+        ticket = self.enqueue(question, user)
+        try:
+            docs = await self.aretrieve(question, repos)
+        except BaseException:
+            ticket.release()
+            raise
+        async with aclosing(self.astream_answer(question, docs, repos, ticket)) as stream:
+            async for chunk in stream:
+                yield chunk
+
 
 if __name__ == "__main__":
     # Test della pipeline RAG
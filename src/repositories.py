@@ -0,0 +1,198 @@
+# src/repositories.py
+"""
+Gestione dei repository da indicizzare: clone/aggiornamento e manifest multi-repo.
+
+I repository vengono clonati come partial clone senza blob (--filter=blob:none):
+la storia dei commit e degli alberi resta disponibile per il diff incrementale,
+mentre i contenuti dei file vengono scaricati solo per la versione estratta.
+Con `shallow` si scarica anche solo l'ultimo commit; il commit indicizzato in
+precedenza resta comunque nell'object database locale, quindi il diff
+incrementale continua a funzionare.
+
+Il manifest è un file JSON con un elenco di repository:
+
+    [
+        {"name": "user-service", "url": "https://...", "branch": "main", "shallow": true},
+        ...
+    ]
+
+Ogni repository viene indicizzato nella propria collezione Chroma.
+"""
+import os
+import re
+import json
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from git import Repo, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
+
+from config import (
+    REPOS_DIR,
+    REPOS_MANIFEST_PATH,
+    REPO_FETCH_WORKERS,
+    REPO_CLONE_FILTER,
+    REPO_SHALLOW_CLONE,
+    REPO_FETCH_RETRIES,
+    REPO_FETCH_RETRY_SECONDS,
+)
+
+
+def _clone(repo_url: str, local_path: str, branch=None, shallow=False):
+    multi_options = [f"--filter={REPO_CLONE_FILTER}"] if REPO_CLONE_FILTER else []
+    Repo.clone_from(
+        repo_url,
+        local_path,
+        multi_options=multi_options,
+        branch=branch,
+        depth=1 if shallow else None,
+        single_branch=True,
+    )
+
+
+# Messaggi di git che indicano un problema di rete, non del repository locale
+_NETWORK_ERRORS = re.compile(
+    r"could not resolve host|unable to access|"
+    r"connection (?:timed out|refused|reset)|operation timed out|"
+    r"remote end hung up|early eof|rpc failed|temporary failure|network is unreachable",
+    re.IGNORECASE,
+)
+
+
+def _is_network_error(error: GitCommandError) -> bool:
+    return bool(_NETWORK_ERRORS.search(f"{error.stderr} {error.stdout}"))
+
+
+def _is_corrupt(repo: Repo) -> bool:
+    """True se l'object database locale è danneggiato (git fsck fallisce)."""
+    try:
+        repo.git.fsck("--connectivity-only", "--no-progress")
+        return False
+    except GitCommandError:
+        return True
+
+
+def _update_ref(repo: Repo, branch=None) -> str:
+    """Ref da scaricare: il branch indicato, quello corrente o, con HEAD staccato, l'HEAD del remote."""
+    if branch:
+        return branch
+    if repo.head.is_detached:
+        print("HEAD staccato: aggiorno al branch predefinito del remote.")
+        return "HEAD"
+    return repo.active_branch.name
+
+
+def _fetch(repo: Repo, ref: str, shallow: bool):
+    """Fetch del solo ref indicato, ritentando con attesa crescente gli errori di rete."""
+    delay = REPO_FETCH_RETRY_SECONDS
+    for attempt in range(1, REPO_FETCH_RETRIES + 1):
+        try:
+            if shallow:
+                repo.git.fetch("origin", ref, depth=1)
+            else:
+                repo.git.fetch("origin", ref)
+            return
+        except GitCommandError as e:
+            if attempt == REPO_FETCH_RETRIES or not _is_network_error(e):
+                raise
+            print(f"⚠️ Errore di rete nel fetch (tentativo {attempt}): riprovo tra {delay:.0f}s...")
+            time.sleep(delay)
+            delay *= 2
+
+
+def _reclone(repo_url: str, local_path: str, branch, shallow):
+    print(f"Elimino e riclono {local_path}...")
+    shutil.rmtree(local_path)
+    _clone(repo_url, local_path, branch, shallow)
+    print("Repository riclonato con successo.")
+
+
+def clone_repository(
+    repo_url: str, local_path: str, branch=None, shallow=REPO_SHALLOW_CLONE
+):
+    """
+    Clona un repository Git o aggiorna se esiste già.
+    L'aggiornamento scarica solo il branch indicato (fetch + reset), senza
+    ricostruire il clone: il clone esistente contiene il commit indicizzato
+    in precedenza, necessario all'ingestione incrementale. Si riclona solo
+    se il repository locale è corrotto; gli errori di rete vengono ritentati
+    e poi rilanciati.
+    """
+    print(f"Tentativo di clonare/aggiornare il repository: {repo_url}")
+    if os.path.exists(local_path):
+        print(f"Repository {local_path} esiste già. Aggiornamento in corso...")
+        try:
+            repo = Repo(local_path)
+        except (InvalidGitRepositoryError, NoSuchPathError) as e:
+            print(f"Repository locale non valido: {e}")
+            _reclone(repo_url, local_path, branch, shallow)
+            return
+        try:
+            _fetch(repo, _update_ref(repo, branch), shallow)
+            repo.git.reset("--hard", "FETCH_HEAD")
+            print("Repository aggiornato con successo.")
+        except GitCommandError as e:
+            print(f"Errore durante l'aggiornamento del repository: {e}")
+            if _is_network_error(e) or not _is_corrupt(repo):
+                raise
+            print("Il repository locale è corrotto (git fsck fallito).")
+            _reclone(repo_url, local_path, branch, shallow)
+    else:
+        print(f"Clonazione del repository in {local_path}...")
+        try:
+            _clone(repo_url, local_path, branch, shallow)
+            print("Repository clonato con successo.")
+        except GitCommandError as e:
+            print(f"Errore durante la clonazione del repository: {e}")
+            raise
+
+
+def load_manifest(path: str = REPOS_MANIFEST_PATH):
+    """Legge il manifest dei repository; restituisce [] se non esiste."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        if "url" not in entry:
+            raise ValueError(f"Voce del manifest senza 'url': {entry}")
+        entry.setdefault(
+            "name", entry["url"].rstrip("/").split("/")[-1].replace(".git", "")
+        )
+    return entries
+
+
+def collection_for_repo(name: str) -> str:
+    """
+    Nome della collezione Chroma di un repository. Chroma accetta solo
+    caratteri [a-zA-Z0-9._-], con inizio e fine alfanumerici.
+    """
+    return "repo_" + re.sub(r"[^a-zA-Z0-9._-]", "_", name).strip("._-")
+
+
+def repo_local_path(name: str) -> str:
+    return os.path.join(REPOS_DIR, name)
+
+
+def sync_repositories(entries, workers: int = REPO_FETCH_WORKERS):
+    """
+    Clona/aggiorna in parallelo i repository del manifest.
+    Restituisce {nome: errore o None}; un repository che fallisce non blocca gli altri.
+    """
+
+    def sync(entry):
+        started = time.perf_counter()
+        try:
+            clone_repository(
+                entry["url"],
+                repo_local_path(entry["name"]),
+                branch=entry.get("branch"),
+                shallow=entry.get("shallow", REPO_SHALLOW_CLONE),
+            )
+        except Exception as e:
+            return entry["name"], e
+        print(f"⏱️ {entry['name']} sincronizzato in {time.perf_counter() - started:.1f}s")
+        return entry["name"], None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(executor.map(sync, entries))
@@ -0,0 +1,78 @@
+# src/reranker.py
+"""
+Reranking dei chunk recuperati con un cross-encoder su CPU.
+
+Il retrieval recupera più candidati del necessario (RERANK_FETCH_K), il
+cross-encoder li valuta tutti insieme in un'unica chiamata batch e restano
+solo i migliori. La chiamata ha un tetto di latenza: se non termina in tempo
+si usa l'ordine originale del retrieval.
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from sentence_transformers import CrossEncoder
+
+from config import (
+    RERANK_MODEL_NAME,
+    RERANK_MAX_LENGTH,
+    RERANK_TIMEOUT_MS,
+)
+
+
+class Reranker:
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL_NAME,
+        max_length: int = RERANK_MAX_LENGTH,
+        timeout_ms: int = RERANK_TIMEOUT_MS,
+    ):
+        print(f"Caricamento del cross-encoder {model_name}...")
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.timeout = timeout_ms / 1000
+        # Un solo worker: una valutazione oltre il tempo limite non si può
+        # interrompere, quindi finché è in corso le richieste successive la saltano
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._running = None
+        # Il reranker è condiviso fra le richieste: controllo e invio sono atomici
+        self._lock = threading.Lock()
+        self.last_latency_ms = 0.0
+        self.fallbacks = 0
+
+    def score(self, question: str, docs):
+        """Punteggi di rilevanza di ogni chunk per la domanda, in un solo batch."""
+        pairs = [(question, doc.page_content) for doc in docs]
+        return self.model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+
+    def rerank(self, question: str, docs, top_n: int):
+        """
+        Riordina `docs` per rilevanza e ne restituisce i primi `top_n`.
+        Oltre il tempo limite (o con una valutazione precedente ancora in corso)
+        restituisce i primi `top_n` nell'ordine ricevuto.
+        """
+        if len(docs) <= 1:
+            return docs[:top_n]
+        started = time.perf_counter()
+        with self._lock:
+            busy = self._running is not None and not self._running.done()
+            if busy:
+                self.fallbacks += 1
+            else:
+                future = self._running = self._pool.submit(self.score, question, docs)
+        if busy:
+            print("Reranking ancora occupato: uso l'ordine del retrieval.")
+            return docs[:top_n]
+
+        try:
+            scores = future.result(timeout=self.timeout)
+        except TimeoutError:
+            self.fallbacks += 1
+            print(
+                f"Reranking oltre {self.timeout * 1000:.0f} ms: uso l'ordine del retrieval."
+            )
+            return docs[:top_n]
+        finally:
+            self.last_latency_ms = (time.perf_counter() - started) * 1000
+
+        order = sorted(range(len(docs)), key=lambda i: -float(scores[i]))
+        return [docs[i] for i in order[:top_n]]
@@ -0,0 +1,246 @@
+# src/scheduler.py
+"""
+Scheduler delle generazioni dell'LLM condiviso.
+
+Il modello llama.cpp ha un solo contesto: una generazione alla volta. Ogni
+richiesta prende un Ticket appena arriva, esegue il retrieval mentre è in
+coda e, se la risposta non è già in cache, diventa pronta e attende il
+proprio turno. Il controllo di ammissione (lunghezza massima della coda,
+anche per utente) conta solo i ticket pronti: una risposta dalla cache o un
+retrieval in corso non occupano posti. Quando l'LLM si libera, fra i
+ticket pronti si sceglie:
+
+1. la priorità più alta: domande brevi di consultazione prima delle
+   spiegazioni lunghe, con invecchiamento (ogni SCHEDULER_AGING_SECONDS di
+   attesa si sale di un livello, così le spiegazioni non restano indietro
+   per sempre);
+2. a parità di priorità, l'utente servito meno di recente (round robin);
+3. a parità di utente, l'ordine di arrivo.
+
+Un ticket si può annullare (es. l'utente cambia pagina): se è in coda esce
+subito, se sta generando la generazione si ferma al pezzo successivo.
+"""
+import re
+import threading
+import time
+from collections import deque
+from itertools import count
+
+from config import (
+    SCHEDULER_MAX_QUEUE,
+    SCHEDULER_MAX_QUEUE_PER_USER,
+    SCHEDULER_AGING_SECONDS,
+    SCHEDULER_LOOKUP_MAX_WORDS,
+    SCHEDULER_STATS_WINDOW,
+)
+
+PRIORITY_LOOKUP = 0
+PRIORITY_EXPLAIN = 1
+
+_EXPLAIN = re.compile(
+    r"\b(?:spieg\w*|descriv\w*|illustr\w*|analizz\w*|riassum\w*|riassunto|flusso|"
+    r"come funzion\w*|perch[eé]|explain\w*|describ\w*|walk me through|overview|"
+    r"summar\w*|how does|why)\b",
+    re.IGNORECASE,
+)
+
+
+def question_priority(question: str) -> int:
+    """Domande brevi di consultazione (dove, quale, elenca) prima delle spiegazioni."""
+    if _EXPLAIN.search(question) or len(question.split()) > SCHEDULER_LOOKUP_MAX_WORDS:
+        return PRIORITY_EXPLAIN
+    return PRIORITY_LOOKUP
+
+
+class SchedulerFull(RuntimeError):
+    """La coda delle generazioni è piena: la richiesta non viene accettata."""
+
+
+class GenerationCancelled(RuntimeError):
+    """Il ticket è stato annullato prima di ottenere l'LLM."""
+
+
+class Ticket:
+    """Posto in coda di una richiesta. Come context manager attende il turno e poi lo rilascia."""
+
+    def __init__(self, scheduler, user, priority: int, seq: int):
+        self.scheduler = scheduler
+        self.user = user
+        self.priority = priority
+        self.seq = seq
+        self.submitted = time.monotonic()
+        self.started = None
+        self.ready = False  # retrieval finito, in attesa dell'LLM
+        self.cancelled = False
+
+    @property
+    def waited(self) -> float:
+        """Secondi passati in coda (fino all'inizio della generazione)."""
+        return (self.started or time.monotonic()) - self.submitted
+
+    def mark_ready(self):
+        """Entra fra i ticket pronti; SchedulerFull (e il ticket esce dalla coda) se è piena."""
+        self.scheduler._mark_ready(self)
+
+    def acquire(self, timeout=None) -> bool:
+        """
+        Attende il turno (entrando fra i pronti, vedi mark_ready); False se
+        scade il timeout (il ticket resta in coda).
+        """
+        return self.scheduler._acquire(self, timeout)
+
+    def release(self):
+        """Libera l'LLM o esce dalla coda. Si può chiamare più volte."""
+        self.scheduler._release(self)
+
+    def cancel(self):
+        self.scheduler._cancel(self)
+
+    def position(self) -> int:
+        """Posizione in coda (1 = prossimo), 0 se sta già generando."""
+        return self.scheduler._position(self)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        max_queue: int = SCHEDULER_MAX_QUEUE,
+        max_queue_per_user: int = SCHEDULER_MAX_QUEUE_PER_USER,
+        aging_seconds: float = SCHEDULER_AGING_SECONDS,
+    ):
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.aging_seconds = aging_seconds
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._running = None
+        self._seq = count()
+        self._grants = count()
+        self._last_served = {}  # utente -> numero dell'ultima assegnazione
+        self._waits = deque(maxlen=SCHEDULER_STATS_WINDOW)
+        self.completed = 0
+        self.cancelled = 0
+        self.rejected = 0
+
+    def submit(self, user=None, priority: int = PRIORITY_LOOKUP) -> Ticket:
+        """
+        Mette in coda una richiesta. L'ammissione si decide quando il ticket
+        diventa pronto (vedi _mark_ready), non qui.
+        """
+        with self._cond:
+            ticket = Ticket(self, user, priority, next(self._seq))
+            self._waiting.append(ticket)
+            return ticket
+
+    def _mark_ready(self, ticket: Ticket):
+        with self._cond:
+            if ticket.ready or ticket not in self._waiting:
+                return
+            ready = [t for t in self._waiting if t.ready]
+            error = None
+            if len(ready) >= self.max_queue:
+                error = f"Coda delle generazioni piena ({len(ready)} richieste in attesa)."
+            elif ticket.user is not None and (
+                sum(t.user == ticket.user for t in ready) >= self.max_queue_per_user
+            ):
+                error = (
+                    f"Troppe richieste in coda per lo stesso utente "
+                    f"(massimo {self.max_queue_per_user})."
+                )
+            if error is not None:
+                self._waiting.remove(ticket)
+                self.rejected += 1
+                raise SchedulerFull(error)
+            ticket.ready = True
+            self._dispatch()
+
+    def _sort_key(self, ticket: Ticket, now: float):
+        aged = int((now - ticket.submitted) // self.aging_seconds) if self.aging_seconds else 0
+        return (ticket.priority - aged, self._last_served.get(ticket.user, -1), ticket.seq)
+
+    def _dispatch(self):
+        """Assegna l'LLM libero al ticket pronto con la chiave più bassa."""
+        if self._running is not None:
+            return
+        ready = [t for t in self._waiting if t.ready]
+        if not ready:
+            return
+        now = time.monotonic()
+        ticket = min(ready, key=lambda t: self._sort_key(t, now))
+        self._waiting.remove(ticket)
+        self._running = ticket
+        ticket.started = now
+        self._last_served[ticket.user] = next(self._grants)
+        self._waits.append(ticket.started - ticket.submitted)
+        self._cond.notify_all()
+
+    def _acquire(self, ticket: Ticket, timeout=None) -> bool:
+        with self._cond:
+            self._mark_ready(ticket)
+            self._cond.wait_for(
+                lambda: self._running is ticket or ticket.cancelled, timeout
+            )
+            if ticket.cancelled and self._running is not ticket:
+                raise GenerationCancelled("Richiesta annullata.")
+            return self._running is ticket
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            if self._running is ticket:
+                self._running = None
+                self.completed += 1
+            elif ticket in self._waiting:
+                self._waiting.remove(ticket)
+                # Sveglia un acquire() rimasto in attesa (es. task asincrono annullato)
+                ticket.cancelled = True
+            else:
+                return
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _cancel(self, ticket: Ticket):
+        with self._cond:
+            if ticket.cancelled:
+                return
+            ticket.cancelled = True
+            self.cancelled += 1
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._dispatch()
+            self._cond.notify_all()
+
+    def _position(self, ticket: Ticket) -> int:
+        with self._cond:
+            if self._running is ticket:
+                return 0
+            if ticket not in self._waiting:
+                return 0
+            now = time.monotonic()
+            key = self._sort_key(ticket, now)
+            ahead = sum(
+                t is not ticket and t.ready and self._sort_key(t, now) < key
+                for t in self._waiting
+            )
+            return ahead + 1
+
+    def stats(self) -> dict:
+        """Profondità della coda e tempi di attesa delle ultime richieste."""
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "busy": self._running is not None,
+                "queued": len(self._waiting),
+                "ready": sum(t.ready for t in self._waiting),
+                "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+                "rejected": self.rejected,
+            }
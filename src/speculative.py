@@ -0,0 +1,89 @@
+# src/speculative.py
+"""
+Decodifica speculativa per la generazione su CPU.
+
+Una bozza propone i prossimi token e il modello principale li valuta tutti
+in un solo batch, accettando quelli che avrebbe generato comunque: su CPU
+un batch di 10 token costa poco più di un token singolo, quindi ogni token
+accettato è quasi gratis. Il campionamento resta quello del modello
+principale, per cui le risposte non cambiano.
+
+Modalità (LLM_SPECULATIVE_DECODING):
+- "prompt_lookup": la bozza è la continuazione, nel prompt, dell'ultimo
+  n-gram generato (LlamaPromptLookupDecoding). Le risposte della RAG citano
+  molto il codice del contesto: annotazioni, firme, nomi di tabelle.
+- "draft_model": la bozza viene da un modello GGUF piccolo (greedy), che
+  deve usare lo stesso tokenizer del modello principale.
+"""
+import numpy as np
+import llama_cpp
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+from config import (
+    LLM_SPECULATIVE_DECODING,
+    LLM_DRAFT_NUM_PRED_TOKENS,
+    LLM_DRAFT_MAX_NGRAM,
+    LLM_DRAFT_MODEL_PATH,
+    LLM_DRAFT_N_CTX,
+)
+
+
+class SmallModelDraft(LlamaDraftModel):
+    """Bozze greedy di un modello piccolo, che riusa la propria KV cache tra un passo e l'altro."""
+
+    def __init__(
+        self,
+        model_path: str = LLM_DRAFT_MODEL_PATH,
+        num_pred_tokens: int = LLM_DRAFT_NUM_PRED_TOKENS,
+        n_ctx: int = LLM_DRAFT_N_CTX,
+        n_threads=None,
+    ):
+        self.llama = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_gpu_layers=0,
+            n_threads=n_threads,
+            verbose=False,
+        )
+        self.num_pred_tokens = num_pred_tokens
+
+    def _next_token(self) -> int:
+        logits = np.ctypeslib.as_array(
+            llama_cpp.llama_get_logits_ith(self.llama.ctx, -1),
+            shape=(self.llama.n_vocab(),),
+        )
+        return int(np.argmax(logits))
+
+    def __call__(self, input_ids, /, **kwargs):
+        llama = self.llama
+        # Prefisso comune con i token già valutati: solo il resto passa dal modello.
+        # Almeno un token va rivalutato per avere i logit dell'ultima posizione.
+        limit = min(llama.n_tokens, len(input_ids) - 1)
+        diff = np.flatnonzero(llama.input_ids[:limit] != input_ids[:limit])
+        llama.n_tokens = int(diff[0]) if diff.size else limit
+        llama.eval(input_ids[llama.n_tokens :].tolist())
+
+        draft = []
+        while len(draft) < self.num_pred_tokens and llama.n_tokens < llama.n_ctx():
+            token = self._next_token()
+            if llama_cpp.llama_vocab_is_eog(llama_cpp.llama_model_get_vocab(llama.model), token):
+                break
+            draft.append(token)
+            llama.eval([token])
+        return np.array(draft, dtype=np.intc)
+
+
+def make_draft_model(mode: str = LLM_SPECULATIVE_DECODING):
+    """Bozza da passare a llama_cpp.Llama(draft_model=...), None se disattivata."""
+    if mode == "none":
+        return None
+    if mode == "prompt_lookup":
+        return LlamaPromptLookupDecoding(
+            max_ngram_size=LLM_DRAFT_MAX_NGRAM, num_pred_tokens=LLM_DRAFT_NUM_PRED_TOKENS
+        )
+    if mode == "draft_model":
+        return SmallModelDraft()
+    raise ValueError(
+        f"Decodifica speculativa sconosciuta: {mode!r} (none | prompt_lookup | draft_model)"
+    )
@@ -0,0 +1,337 @@
+# src/streaming_ingestion.py
+"""
+Ingestione in streaming a memoria limitata.
+
+Gli stadi sono collegati da code di dimensione fissa, così in memoria restano
+solo pochi batch alla volta e l'embedding procede mentre altri file vengono
+analizzati:
+
+    file Java -> parsing/chunking (pool di processi) -> embedding a batch -> upsert nel database
+
+Dopo ogni upsert i file completamente scritti vengono annotati in un file di
+checkpoint: se il processo si interrompe, la ripresa salta i file già salvati.
+"""
+import sys
+import os
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+sys.path.append(project_root)
+
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    CHROMA_DB_DIR,
+    CHROMA_COLLECTION_NAME,
+    EMBEDDING_MODEL_NAME,
+    PARSE_WORKERS,
+    PARSE_CACHE_ENABLED,
+    STREAM_PARSE_BATCH_FILES,
+    STREAM_EMBED_BATCH_SIZE,
+    STREAM_QUEUE_SIZE,
+    STREAM_PROGRESS_INTERVAL,
+    HIERARCHICAL_INDEX_ENABLED,
+)
+from src.java_parser import parse_java_sources
+from src.parse_cache import ParseCache
+from src.git_source import iter_source_files
+from src.index_artifacts import IndexArtifacts
+from src.summary_index import SummaryCollections, split_summary_chunks
+from src.vector_store import open_vector_store, upsert_chunks, persist_vector_store
+from src.ingestion import (
+    build_file_chunks,
+    build_summary_chunks,
+    _make_fallback_splitter,
+    load_ingestion_embeddings,
+    save_index_state,
+    get_head_commit,
+)
+
+# Marca la fine del flusso in una coda
+_END = object()
+
+
+class _StageFailure:
+    """Propaga al thread principale l'eccezione di uno stadio."""
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+
+class StageStats:
+    """Contatori di avanzamento e throughput di uno stadio della pipeline."""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy = 0.0  # secondi di lavoro effettivo, esclusa l'attesa sulle code
+        self.started = time.perf_counter()
+
+    def add(self, count: int, busy: float):
+        self.count += count
+        self.busy += busy
+
+    def report(self) -> str:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return (
+            f"{self.name}: {self.count} {self.unit} "
+            f"({self.count / elapsed:.1f} {self.unit}/s, occupato {self.busy / elapsed:.0%})"
+        )
+
+
+def checkpoint_path(db_path: str, collection_name: str) -> str:
+    return os.path.join(db_path, f"{collection_name}.stream_checkpoint")
+
+
+def load_checkpoint(path: str) -> set:
+    """File (percorsi relativi) già scritti completamente nel database."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _put(q, item, stop: threading.Event):
+    """Inserisce in una coda limitata senza bloccarsi se la pipeline si ferma."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _END
+
+
+def _parse_stage(repo_path, skip, out_q, stats, stop, workers, batch_files):
+    """Stadio 1-2: legge i file a batch, li analizza e produce i chunk per file."""
+    try:
+        splitter = _make_fallback_splitter()
+        parse_cache = ParseCache() if PARSE_CACHE_ENABLED else None
+        parse = parse_cache.parse if parse_cache else parse_java_sources
+        # I blob vengono letti in modo pigro dal processo `git cat-file --batch`
+        files = iter_source_files(repo_path, extensions={".java"}, skip=skip)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                batch = [f for _, f in zip(range(batch_files), files)]
+                if not batch:
+                    break
+                all_records = parse(
+                    [(f.path, f.text, f.blob_sha) for f in batch],
+                    workers=workers,
+                    executor=executor,
+                )
+                file_chunks = [
+                    (
+                        f.rel_path,
+                        build_file_chunks(f.path, f.rel_path, f.text, records.methods, splitter)
+                        + (
+                            build_summary_chunks(f.path, f.rel_path, records)
+                            if HIERARCHICAL_INDEX_ENABLED
+                            else []
+                        ),
+                    )
+                    for f, records in zip(batch, all_records)
+                ]
+                stats.add(len(batch), time.perf_counter() - started)
+                if not _put(out_q, file_chunks, stop):
+                    return
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        if parse_cache:
+            parse_cache.print_stats()
+        _put(out_q, _END, stop)
+    except BaseException as e:
+        _put(out_q, _StageFailure("parsing", e), stop)
+
+
+def _embed_stage(in_q, out_q, embeddings, stats, stop, batch_size):
+    """
+    Stadio 3: accumula i chunk in batch di `batch_size` e calcola gli embedding.
+    Ogni batch porta con sé i file il cui ultimo chunk è incluso nel batch.
+    """
+
+    def flush(items, finished_files):
+        started = time.perf_counter()
+        docs = [doc for doc, _ in items]
+        vectors = embeddings.embed_documents([d.page_content for d in docs])
+        completed = [f for _, f in items if f is not None] + finished_files
+        stats.add(len(docs), time.perf_counter() - started)
+        return _put(out_q, (docs, vectors, completed), stop)
+
+    try:
+        pending = []  # (Document, file completato con questo chunk oppure None)
+        empty_files = []  # file senza chunk, completati al prossimo flush
+        while True:
+            item = _get(in_q, stop)
+            if item is _END:
+                break
+            if isinstance(item, _StageFailure):
+                _put(out_q, item, stop)
+                return
+            for rel_path, docs in item:
+                if not docs:
+                    empty_files.append(rel_path)
+                for i, doc in enumerate(docs):
+                    pending.append((doc, rel_path if i == len(docs) - 1 else None))
+            while len(pending) >= batch_size:
+                if not flush(pending[:batch_size], empty_files):
+                    return
+                pending, empty_files = pending[batch_size:], []
+        if pending or empty_files:
+            if pending:
+                if not flush(pending, empty_files):
+                    return
+            else:
+                _put(out_q, ([], [], empty_files), stop)
+        _put(out_q, _END, stop)
+    except BaseException as e:
+        _put(out_q, _StageFailure("embedding", e), stop)
+
+
+def run_streaming_ingestion(
+    repo_path: str,
+    db_path: str = CHROMA_DB_DIR,
+    embedding_model_name: str = EMBEDDING_MODEL_NAME,
+    collection_name: str = CHROMA_COLLECTION_NAME,
+    workers: int = PARSE_WORKERS,
+    parse_batch_files: int = STREAM_PARSE_BATCH_FILES,
+    embed_batch_size: int = STREAM_EMBED_BATCH_SIZE,
+    queue_size: int = STREAM_QUEUE_SIZE,
+):
+    """
+    Esegue l'ingestione completa in streaming e restituisce il database.
+    Se esiste un checkpoint di un'esecuzione interrotta riprende da lì.
+    """
+    embeddings = load_ingestion_embeddings(embedding_model_name)
+    vector_db = open_vector_store(collection_name, embeddings, db_path)
+
+    ckpt_path = checkpoint_path(db_path, collection_name)
+    done_files = load_checkpoint(ckpt_path)
+    if done_files:
+        print(f"Ripresa dal checkpoint: {len(done_files)} file già indicizzati.")
+    print(f"Ingestione in streaming da {repo_path} verso {db_path}...")
+    # Gli indici ausiliari sono piccoli: restano in memoria e si salvano alla fine
+    artifacts = IndexArtifacts(collection_name, db_path, reset=True)
+    summary_collections = (
+        SummaryCollections(collection_name, embeddings, db_path)
+        if HIERARCHICAL_INDEX_ENABLED
+        else None
+    )
+
+    stop = threading.Event()
+    chunk_q = queue.Queue(maxsize=queue_size)
+    vector_q = queue.Queue(maxsize=queue_size)
+    parse_stats = StageStats("parsing", "file")
+    embed_stats = StageStats("embedding", "chunk")
+    upsert_stats = StageStats("upsert", "chunk")
+
+    threads = [
+        threading.Thread(
+            target=_parse_stage,
+            args=(repo_path, done_files, chunk_q, parse_stats, stop, workers, parse_batch_files),
+            name="ingestion-parse",
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_embed_stage,
+            args=(chunk_q, vector_q, embeddings, embed_stats, stop, embed_batch_size),
+            name="ingestion-embed",
+            daemon=True,
+        ),
+    ]
+    for t in threads:
+        t.start()
+
+    def print_progress():
+        print(
+            " | ".join(s.report() for s in (parse_stats, embed_stats, upsert_stats))
+            + f" | code: {chunk_q.qsize()}/{vector_q.qsize()}"
+        )
+
+    last_report = time.perf_counter()
+    try:
+        # Stadio 4: upsert nel thread principale, poi checkpoint dei file completati
+        with open(ckpt_path, "a", encoding="utf-8") as ckpt:
+            while True:
+                item = vector_q.get()
+                if item is _END:
+                    break
+                if isinstance(item, _StageFailure):
+                    raise RuntimeError(
+                        f"Errore nello stadio di {item.stage}: {item.error}"
+                    ) from item.error
+                docs, vectors, completed = item
+                started = time.perf_counter()
+                # I riassunti di classi e file vanno nelle loro collezioni
+                (docs, vectors), (summary_docs, summary_vectors) = split_summary_chunks(
+                    docs, vectors
+                )
+                if summary_docs:
+                    summary_collections.add_chunks(summary_docs, summary_vectors)
+                if docs:
+                    upsert_chunks(
+                        vector_db,
+                        ids=[d.metadata["chunk_id"] for d in docs],
+                        embeddings=vectors,
+                        documents=[d.page_content for d in docs],
+                        metadatas=[d.metadata for d in docs],
+                    )
+                    artifacts.add_chunks(docs)
+                if completed:
+                    ckpt.write("".join(f"{f}\n" for f in completed))
+                    ckpt.flush()
+                    os.fsync(ckpt.fileno())
+                upsert_stats.add(len(docs), time.perf_counter() - started)
+
+                if time.perf_counter() - last_report >= STREAM_PROGRESS_INTERVAL:
+                    print_progress()
+                    last_report = time.perf_counter()
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    print_progress()
+    # Chunk di file non più presenti (cancellati o rinominati dall'ultima ingestione)
+    indexed_files = sorted(
+        os.path.normpath(os.path.join(repo_path, p)) for p in load_checkpoint(ckpt_path)
+    )
+    stale = vector_db.get(
+        where={"file": {"$nin": indexed_files}} if indexed_files else None,
+        include=["metadatas"],
+    )
+    stale_files = sorted({m["file"] for m in stale["metadatas"] if m.get("file")})
+    if stale["ids"]:
+        vector_db.delete(ids=stale["ids"])
+        print(f"Eliminati {len(stale['ids'])} chunk di {len(stale_files)} file non più presenti.")
+    persist_vector_store(vector_db)
+    if summary_collections is not None:
+        summary_collections.remove_files(stale_files)
+        summary_collections.save()
+    if done_files:
+        # I chunk scritti prima dell'interruzione non sono passati di qui
+        artifacts.rebuild(vector_db)
+    artifacts.save()
+    # Ingestione completata: il checkpoint non serve più
+    os.remove(ckpt_path)
+    if os.path.isdir(os.path.join(repo_path, ".git")):
+        save_index_state(collection_name, get_head_commit(repo_path))
+    print("Ingestione in streaming completata.")
+    return vector_db
@@ -0,0 +1,107 @@
+# src/summary_index.py
+"""
+Livelli superiori dell'indice gerarchico file -> classe -> metodo.
+
+Accanto alla collezione dei chunk dei metodi ci sono due collezioni di
+riassunti, con lo stesso backend e lo stesso modello di embedding:
+
+- "<collezione>.classes": uno scheletro per ogni classe/interfaccia/enum
+  (Javadoc, annotazioni, campi, firme dei metodi senza corpo);
+- "<collezione>.files": package, import e tipi dichiarati di ogni file.
+
+Il retrieval per livelli sceglie prima le classi dai loro riassunti e poi
+cerca i metodi solo dentro quelle classi (filtro where sul campo "class").
+Come per IndexArtifacts, l'ingestione aggiorna i riassunti con gli stessi
+file rimossi e gli stessi chunk scritti nella collezione principale.
+"""
+from config import CHROMA_DB_DIR
+from src.vector_store import (
+    open_vector_store,
+    upsert_chunks,
+    delete_stale_chunks,
+    count_chunks,
+    persist_vector_store,
+)
+
+# content_type dei riassunti -> livello (suffisso della collezione)
+SUMMARY_LEVELS = {"java_class": "classes", "java_file": "files"}
+
+
+def summary_collection(collection_name: str, level: str) -> str:
+    return f"{collection_name}.{level}"
+
+
+def split_summary_chunks(chunks, vectors=None):
+    """
+    Separa i riassunti dai chunk del codice.
+    Restituisce (chunk, riassunti) oppure, se si passano anche gli embedding,
+    ((chunk, vettori), (riassunti, vettori)).
+    """
+    chunks = list(chunks)
+    is_summary = [c.metadata.get("content_type") in SUMMARY_LEVELS for c in chunks]
+    code = [c for c, s in zip(chunks, is_summary) if not s]
+    summaries = [c for c, s in zip(chunks, is_summary) if s]
+    if vectors is None:
+        return code, summaries
+    return (
+        (code, [v for v, s in zip(vectors, is_summary) if not s]),
+        (summaries, [v for v, s in zip(vectors, is_summary) if s]),
+    )
+
+
+class SummaryCollections:
+    """Collezioni dei riassunti di classi e file di una collezione."""
+
+    def __init__(self, collection_name: str, embeddings=None, db_path: str = CHROMA_DB_DIR):
+        self.embeddings = embeddings
+        self.stores = {
+            level: open_vector_store(
+                summary_collection(collection_name, level), embeddings, db_path
+            )
+            for level in SUMMARY_LEVELS.values()
+        }
+
+    def remove_files(self, files):
+        files = sorted(set(files))
+        if not files:
+            return
+        for store in self.stores.values():
+            stale_ids = store.get(where={"file": {"$in": files}}, include=[])["ids"]
+            if stale_ids:
+                store.delete(ids=stale_ids)
+
+    def keep_only(self, docs):
+        """Elimina i riassunti che non sono tra `docs` (ingestione completa)."""
+        ids = [d.metadata["chunk_id"] for d in docs]
+        for store in self.stores.values():
+            delete_stale_chunks(store, ids)
+
+    def add_chunks(self, docs, vectors=None):
+        """Inserisce i riassunti; gli embedding si calcolano se non indicati."""
+        docs = list(docs)
+        if vectors is None:
+            vectors = self.embeddings.embed_documents([d.page_content for d in docs])
+        for content_type, level in SUMMARY_LEVELS.items():
+            selected = [
+                (d, v) for d, v in zip(docs, vectors) if d.metadata["content_type"] == content_type
+            ]
+            if selected:
+                upsert_chunks(
+                    self.stores[level],
+                    ids=[d.metadata["chunk_id"] for d, _ in selected],
+                    embeddings=[v for _, v in selected],
+                    documents=[d.page_content for d, _ in selected],
+                    metadatas=[d.metadata for d, _ in selected],
+                )
+
+    def save(self):
+        for store in self.stores.values():
+            persist_vector_store(store)
+        print(
+            f"🗂️ Riassunti: {count_chunks(self.stores['classes'])} classi, "
+            f"{count_chunks(self.stores['files'])} file."
+        )
+
+    def delete(self):
+        for store in self.stores.values():
+            store.delete_collection()
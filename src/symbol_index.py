@@ -0,0 +1,192 @@
+# src/symbol_index.py
+"""
+Tabella dei simboli della codebase: classe, metodo e firma -> ID dei chunk.
+
+Viene costruita durante l'ingestione dai metadati dei chunk e salvata accanto
+al database Chroma. Permette al retrieval di recuperare direttamente i chunk
+dei simboli nominati nella domanda ("la classe 'UserService'", "il metodo
+processOrder") con una lookup in un dizionario, prima della ricerca vettoriale.
+"""
+import os
+import re
+import gzip
+import json
+
+# Identificatori che sembrano nomi di classi o metodi Java:
+# UserService, processOrder, OrderService.processOrder
+_QUOTED = re.compile(r"['\"`“”‘’]([A-Za-z_$][\w$.]*(?:\([^)]*\))?)['\"`“”‘’]")
+_QUALIFIED = re.compile(r"\b([A-Z][\w$]*)\.([a-z_$][\w$]*)\b")
+_CAMEL = re.compile(r"\b([A-Z][a-z0-9]+[A-Z][\w$]*|[a-z][a-z0-9]*[A-Z][\w$]*)\b")
+_AFTER_KEYWORD = re.compile(
+    r"\b(?:classe|class|metodo|method|interfaccia|interface)\s+([A-Za-z_$][\w$]*)",
+    re.IGNORECASE,
+)
+
+
+def extract_symbol_candidates(question: str):
+    """
+    Restituisce i possibili simboli nominati nella domanda, in ordine di
+    affidabilità: prima quelli tra virgolette/backtick, poi le forme
+    Classe.metodo, poi i nomi dopo "classe"/"metodo", infine i camelCase.
+    """
+    candidates = []
+    for pattern in (_QUOTED, _AFTER_KEYWORD):
+        candidates.extend(m.group(1) for m in pattern.finditer(question))
+    candidates.extend(f"{c}.{m}" for c, m in _QUALIFIED.findall(question))
+    candidates.extend(_CAMEL.findall(question))
+    seen = set()
+    return [c for c in candidates if not (c.lower() in seen or seen.add(c.lower()))]
+
+
+class SymbolIndex:
+    """
+    Indice esatto dei simboli. Le chiavi sono in minuscolo; per ogni chunk si
+    conserva (file, classe, metodo, firma) così da poter rimuovere i simboli
+    di un file durante l'ingestione incrementale.
+    """
+
+    def __init__(self):
+        self.entries = {}  # chunk_id -> (file, classe, metodo, firma)
+        self.classes = {}
+        self.methods = {}
+        self.signatures = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _index(self, chunk_id, entry):
+        _, class_name, method, signature = entry
+        for table, key in (
+            (self.classes, class_name),
+            (self.methods, method),
+            (self.signatures, signature),
+        ):
+            if key:
+                table.setdefault(key.lower(), []).append(chunk_id)
+
+    def add_chunks(self, chunks):
+        """Aggiunge i chunk (Document) con metadati di classe/metodo."""
+        for doc in chunks:
+            meta = doc.metadata
+            chunk_id = meta.get("chunk_id")
+            if not chunk_id or not (meta.get("class") or meta.get("method")):
+                continue
+            if chunk_id in self.entries:
+                self._unindex([chunk_id])
+            entry = (
+                meta.get("file", ""),
+                meta.get("class", ""),
+                meta.get("method", ""),
+                meta.get("method_signature", ""),
+            )
+            self.entries[chunk_id] = entry
+            self._index(chunk_id, entry)
+
+    def _unindex(self, chunk_ids):
+        chunk_ids = set(chunk_ids)
+        for table in (self.classes, self.methods, self.signatures):
+            for key in {
+                k
+                for cid in chunk_ids
+                for k in self.entries.get(cid, ())[1:]
+                if k and k.lower() in table
+            }:
+                ids = [i for i in table[key.lower()] if i not in chunk_ids]
+                if ids:
+                    table[key.lower()] = ids
+                else:
+                    del table[key.lower()]
+
+    def remove_files(self, files):
+        """Elimina i simboli dei file indicati (percorsi come nei metadati)."""
+        files = set(files)
+        if not files:
+            return
+        stale = [cid for cid, entry in self.entries.items() if entry[0] in files]
+        self._unindex(stale)
+        for cid in stale:
+            del self.entries[cid]
+
+    def resolve(self, symbol: str):
+        """
+        Restituisce (ID dei chunk, tipo) per un simbolo: firma completa,
+        Classe.metodo, nome di metodo o nome di classe. Il tipo è "class"
+        quando il simbolo è solo il nome di una classe.
+        """
+        key = symbol.lower()
+        if key in self.signatures:
+            return list(self.signatures[key]), "method"
+        if "(" in key:
+            key = key.split("(", 1)[0]
+        if "." in key:
+            class_name, _, method = key.rpartition(".")
+            class_name = class_name.rsplit(".", 1)[-1]
+            method_ids = set(self.methods.get(method, ()))
+            ids = [i for i in self.classes.get(class_name, ()) if i in method_ids]
+            return ids, "method"
+        # Un costruttore ha il nome della classe: il nome da solo indica la classe
+        if key in self.methods and key not in self.classes:
+            return list(self.methods[key]), "method"
+        return list(self.classes.get(key, ())), "class"
+
+    def lookup(self, symbol: str):
+        """ID dei chunk per un simbolo (vedi resolve())."""
+        return self.resolve(symbol)[0]
+
+    def class_names(self, question: str):
+        """Nomi (con le maiuscole originali) delle classi indicizzate nominate nella domanda."""
+        names = []
+        for candidate in extract_symbol_candidates(question):
+            ids, kind = self.resolve(candidate)
+            if kind == "class":
+                for chunk_id in ids:
+                    name = self.entries[chunk_id][1]
+                    if name not in names:
+                        names.append(name)
+        return names
+
+    def match_question(self, question: str, include_classes: bool = True):
+        """
+        Restituisce [(chunk_id, punteggio)] per i simboli nominati nella domanda.
+        Il punteggio è il numero di simboli che corrispondono al chunk, così
+        "il metodo 'processOrder' della classe 'OrderService'" mette per primo
+        OrderService.processOrder e solo dopo gli altri metodi omonimi o della
+        stessa classe. A parità di punteggio vale l'ordine dei simboli.
+        Con `include_classes=False` una classe nominata non aggiunge tutti i
+        suoi metodi, ma alza solo il punteggio di quelli già trovati.
+        """
+        scores = {}
+        class_ids = []
+        for candidate in extract_symbol_candidates(question):
+            ids, kind = self.resolve(candidate)
+            if kind == "class":
+                class_ids.append(ids)
+                if not include_classes:
+                    continue
+            for chunk_id in dict.fromkeys(ids):
+                scores[chunk_id] = scores.get(chunk_id, 0) + 1
+        if not include_classes:
+            for ids in class_ids:
+                for chunk_id in set(ids) & scores.keys():
+                    scores[chunk_id] += 1
+        return sorted(scores.items(), key=lambda item: -item[1])
+
+    def lookup_question(self, question: str, limit: int):
+        """ID dei chunk dei simboli nominati nella domanda, al massimo `limit`."""
+        return [chunk_id for chunk_id, _ in self.match_question(question)[:limit]]
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(self.entries, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        index = cls()
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for chunk_id, entry in json.load(f).items():
+                    index.entries[chunk_id] = tuple(entry)
+                    index._index(chunk_id, tuple(entry))
+        return index
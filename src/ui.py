@@ -1,12 +1,15 @@
 # src/ui.py
 import sys
+import uuid
 from pathlib import Path
 
 project_root = Path(__file__).resolve().parent.parent
 sys.path.append(str(project_root))
 
 import streamlit as st
-from src.rag_pipeline import CodeAssistant  # Importa la classe che hai già creato
+from config import VECTOR_BACKEND
+from src.model_server import get_code_assistant, is_loaded
+from src.scheduler import SchedulerFull, GenerationCancelled
 
 # --- Configurazione della Pagina ---
 st.set_page_config(
@@ -16,21 +19,27 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# --- Inizializzazione dell'Assistente AI (una sola volta per sessione) ---
-if "code_assistant" not in st.session_state:
+# --- Inizializzazione dell'Assistente AI (una sola volta per processo) ---
+# Modelli e database sono condivisi da tutte le sessioni (vedi src/model_server.py):
+# solo la prima sessione attende il caricamento.
+if not is_loaded():
     with st.spinner(
         "Caricamento del modello AI e del database vettoriale... Potrebbe volerci un po'! 😉"
     ):
         try:
-            st.session_state.code_assistant = CodeAssistant()
+            get_code_assistant()
             st.success("Assistente AI pronto! 💪")
         except Exception as e:
             st.error(f"Errore durante l'inizializzazione dell'assistente AI: {e}")
             st.stop()
+code_assistant = get_code_assistant()
 
 # Inizializza la cronologia della chat se non esiste.
 if "messages" not in st.session_state:
     st.session_state.messages = []
+# Identifica la sessione nello scheduler (turni equi tra gli utenti)
+if "user_id" not in st.session_state:
+    st.session_state.user_id = uuid.uuid4().hex
 
 # --- Sidebar ---
 with st.sidebar:
@@ -41,14 +50,32 @@ with st.sidebar:
     st.write("Il modello LLM è in esecuzione localmente sul tuo Mac M3.")
     st.markdown("---")
     st.subheader("Informazioni sul Modello")
-    if "code_assistant" in st.session_state:
-        st.info(
-            f"""
-            **Modello LLM:** Mistral-7B-Instruct-v0.2 (GGUF)
-            **Embedding:** all-MiniLM-L6-v2
-            **Database:** ChromaDB ({st.session_state.code_assistant.vectorstore._collection.count()} elementi indicizzati)
-            """
+    st.info(
+        f"""
+        **Modello LLM:** Mistral-7B-Instruct-v0.2 (GGUF)
+        **Embedding:** all-MiniLM-L6-v2
+        **Database:** {"ChromaDB" if VECTOR_BACKEND == "chroma" else "Memory map (float16)"} ({code_assistant.count_indexed_chunks()} elementi indicizzati in {len(code_assistant.vectorstores)} repository)
+        """
+    )
+    # Hit rate delle cache (aggiornate a ogni domanda, di tutte le sessioni)
+    stats = code_assistant.cache_stats()
+    query_stats = stats["query_embeddings"]
+    st.caption(
+        f"Cache embedding domande: {query_stats['hit_rate']:.0%} hit "
+        f"({query_stats['hits']}/{query_stats['hits'] + query_stats['misses']})"
+    )
+    if stats["answers"] is not None:
+        answer_stats = stats["answers"]
+        st.caption(
+            f"Cache risposte: {answer_stats['hit_rate']:.0%} hit "
+            f"({answer_stats['hits']}/{answer_stats['hits'] + answer_stats['misses']}, "
+            f"{answer_stats['entries']} risposte salvate)"
         )
+    queue_stats = code_assistant.scheduler.stats()
+    st.caption(
+        f"Coda LLM: {queue_stats['queued']} richieste in attesa, "
+        f"attesa media {queue_stats['avg_wait']:.1f}s (p95 {queue_stats['p95_wait']:.1f}s)"
+    )
     st.markdown("---")
     if st.button(
         "Pulisci Cronologia",
@@ -63,10 +90,33 @@ st.markdown(
     "Fai domande sul tuo codice Java e l'AI cercherà le risposte nella codebase indicizzata."
 )
 
+
+def source_label(doc) -> str:
+    """Riga dell'elenco delle fonti: repository, file e classe/metodo del chunk."""
+    meta = doc.metadata
+    path = meta.get("file") or meta.get("source", "")
+    label = f"`{Path(path).name}`"
+    if meta.get("repo"):
+        label = f"**{meta['repo']}** / {label}"
+    symbol = meta.get("method_signature") or meta.get("class")
+    if symbol:
+        label += f" — `{symbol}`"
+    if meta.get("content_type") in ("java_class", "java_file"):
+        label += " (riassunto)"
+    return label
+
+
+def show_sources(sources):
+    if sources:
+        with st.expander(f"📚 Fonti ({len(sources)} chunk)"):
+            st.markdown("\n".join(f"- {s}" for s in sources))
+
+
 # Mostra la cronologia della chat
 # st.chat_message è lo standard per le interfacce di chat in Streamlit
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
+        show_sources(message.get("sources"))
         st.markdown(message["content"])
 
 
@@ -75,23 +125,51 @@ def process_question(question_text: str):
     """Elabora una domanda, la aggiunge alla cronologia e ottiene la risposta dall'AI."""
     st.session_state.messages.append({"role": "user", "content": question_text})
 
-    # Questo blocco viene mostrato durante il re-run causato dall'aggiunta del messaggio
-    # e poi dalla generazione della risposta.
+    # Il turno per l'LLM si prenota subito, così il retrieval avviene mentre si
+    # è in coda. Le fonti compaiono appena finito il retrieval; la risposta
+    # viene scritta token per token mentre l'LLM la genera.
+    assistant = code_assistant
     with st.chat_message("assistant"):
-        with st.spinner(f"L'AI sta elaborando la domanda: '{question_text}'..."):
-            try:
-                response = st.session_state.code_assistant.ask_codebase(question_text)
-                st.markdown(response)
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": response}
-                )
-            except Exception as e:
-                st.error(
-                    f"Si è verificato un errore durante la generazione della risposta: {e}"
-                )
-                st.session_state.messages.append(
-                    {"role": "assistant", "content": f"Errore: {e}"}
-                )
+        ticket = assistant.enqueue(question_text, st.session_state.user_id)
+        status = st.empty()
+
+        def show_queue(t):
+            status.caption(
+                f"⏳ In coda per l'LLM: posizione {t.position()}, attesa {t.waited:.0f}s"
+            )
+
+        try:
+            with st.spinner(f"Ricerca nel codice per: '{question_text}'..."):
+                docs = assistant.retrieve(question_text)
+            sources = [source_label(d) for d in docs]
+            show_sources(sources)
+            response = st.write_stream(
+                assistant.stream_answer(question_text, docs, ticket=ticket, on_wait=show_queue)
+            )
+            status.empty()
+            st.session_state.messages.append(
+                {"role": "assistant", "content": response, "sources": sources}
+            )
+        except SchedulerFull:
+            # La coda si controlla solo se la risposta non è in cache
+            status.empty()
+            st.warning("Troppe richieste in coda, riprova tra poco.")
+            st.session_state.messages.append(
+                {"role": "assistant", "content": "Richiesta rifiutata: coda piena."}
+            )
+        except GenerationCancelled:
+            status.empty()
+        except Exception as e:
+            st.error(
+                f"Si è verificato un errore durante la generazione della risposta: {e}"
+            )
+            st.session_state.messages.append(
+                {"role": "assistant", "content": f"Errore: {e}"}
+            )
+        finally:
+            # Anche quando l'utente lascia la pagina e Streamlit interrompe lo
+            # script: il ticket esce dalla coda o libera l'LLM
+            ticket.release()
 
 
 # Input dell'utente con st.chat_input
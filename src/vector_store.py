@@ -0,0 +1,85 @@
+# src/vector_store.py
+"""
+Scelta del backend dell'indice vettoriale (VECTOR_BACKEND in config).
+
+- "chroma": collezioni ChromaDB persistenti (predefinito);
+- "mmap": MmapVectorStore, matrice float16 in memory map con partizioni IVF
+  per le collezioni grandi (vedi src/mmap_vector_store.py).
+
+Ingestione e retrieval aprono le collezioni solo da qui; i due backend
+espongono gli stessi metodi (ricerca per vettore con filtro where, get,
+delete, add_documents), e le poche differenze sono raccolte nelle funzioni
+di questo modulo.
+"""
+from langchain_community.vectorstores import Chroma
+
+from config import CHROMA_DB_DIR, VECTOR_BACKEND
+from src.mmap_vector_store import MmapVectorStore
+
+# Chroma rifiuta upsert più grandi del suo max_batch_size
+_CHROMA_UPSERT_BATCH = 5000
+
+
+def vector_store_class(backend: str = VECTOR_BACKEND):
+    if backend == "chroma":
+        return Chroma
+    if backend == "mmap":
+        return MmapVectorStore
+    raise ValueError(f"Backend vettoriale sconosciuto: {backend!r} (chroma | mmap)")
+
+
+def open_vector_store(
+    collection_name: str,
+    embeddings=None,
+    db_path: str = CHROMA_DB_DIR,
+    backend: str = VECTOR_BACKEND,
+):
+    """Apre (o crea vuota) la collezione indicata con il backend scelto."""
+    return vector_store_class(backend)(
+        persist_directory=db_path,
+        embedding_function=embeddings,
+        collection_name=collection_name,
+    )
+
+
+def upsert_chunks(vector_db, ids, embeddings, documents, metadatas):
+    """Inserisce o sostituisce chunk con embedding già calcolati."""
+    if isinstance(vector_db, MmapVectorStore):
+        vector_db.upsert(ids, embeddings, documents, metadatas)
+        return
+    for start in range(0, len(ids), _CHROMA_UPSERT_BATCH):
+        end = start + _CHROMA_UPSERT_BATCH
+        vector_db._collection.upsert(
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
+        )
+
+
+def delete_stale_chunks(vector_db, keep_ids) -> int:
+    """
+    Elimina i chunk con ID non in `keep_ids`: dopo un'ingestione completa
+    restano solo quelli appena scritti (es. i file cancellati spariscono).
+    Restituisce il numero di chunk eliminati.
+    """
+    keep = set(keep_ids)
+    stale_ids = [cid for cid in vector_db.get(include=[])["ids"] if cid not in keep]
+    for start in range(0, len(stale_ids), _CHROMA_UPSERT_BATCH):
+        vector_db.delete(ids=stale_ids[start : start + _CHROMA_UPSERT_BATCH])
+    return len(stale_ids)
+
+
+def count_chunks(vector_db) -> int:
+    if isinstance(vector_db, MmapVectorStore):
+        return vector_db.count()
+    return vector_db._collection.count()
+
+
+def persist_vector_store(vector_db):
+    """
+    Fine di un'ingestione: Chroma salva già a ogni scrittura, il backend mmap
+    consolida lo snapshot e aggiorna le partizioni IVF.
+    """
+    if isinstance(vector_db, MmapVectorStore):
+        vector_db.persist()